@@ -1,10 +1,29 @@
 
+import io
+import os
 import sys
-from collections import deque
-from copy import deepcopy
-import networkx as nx
-import matplotlib.pyplot as plt
+import json
+import time
+import signal
+import fnmatch
+import hashlib
+import heapq
+import pickle
+import argparse
+import bisect
+import tempfile
+import itertools
+import contextlib
+import zlib
+from operator import methodcaller
+from collections import deque, Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
+# numpy, imported by the first ArrayHeap (see import_numpy)
+np = None
+# networkx and matplotlib.pyplot, imported only to draw (see import_drawing)
+nx = None
+plt = None
 
 
 
@@ -15,10 +34,49 @@ LOGIC3_1 = 1
 LOGIC3_HALF = 0.5
 LOGIC3_0 = 0
 
+# 3-value logic as stored in the int8 arrays of ArrayHeap. Ordered like LOGIC3_*, so or3/and3 are still max/min
+ARRAY3_1 = 2
+ARRAY3_HALF = 1
+ARRAY3_0 = 0
+ARRAY3_DECODE = (LOGIC3_0, LOGIC3_HALF, LOGIC3_1)
+# bytes.translate table of ARRAY3 values: 0xFF for the definite ones, 0 for ARRAY3_HALF (see subsumption_key)
+ARRAY3_DEFINITE = bytes.maketrans(bytes([ARRAY3_0, ARRAY3_HALF, ARRAY3_1]), b"\xff\x00\xff")
+
+HEAP_BACKEND_DICT = "dict"
+HEAP_BACKEND_NUMPY = "numpy"
+
+WORKLIST_SET = "set"
+WORKLIST_FIFO = "fifo"
+WORKLIST_RPO = "rpo"
+WORKLIST_WTO = "wto"
+
+# Default bounds of the TransferCache of Cfg.analyze
+TRANSFER_CACHE_ENTRIES = 4096
+TRANSFER_CACHE_BYTES = 64 * 1024 * 1024
 
 
 FAILSTATE_NAME = "fail"
-NULL = "NULL"
+# The NULL heap item. Every other heap item is a positive integer
+NULL = 0
+# The variable of every program that always points to NULL, as it is written in the code
+NULL_VAR = "NULL"
+
+# Phases timed by Profiler
+PROFILER_PHASES = ("focus", "apply_transformer", "coerce_red", "canonical_abstraction", "heaps_join")
+
+# Checkpoint files of Checkpointer: first bytes, version of their contents, and default wall time between two
+CHECKPOINT_MAGIC = b"SA-CHECKPOINT\n"
+CHECKPOINT_VERSION = 3
+CHECKPOINT_SECONDS = 300
+
+# Outcomes of an analysis (Cfg.verdict), and of a program in a batch run (analyze_file)
+VERDICT_OK = "ok"
+VERDICT_NULL_DEREFERENCE = "null_dereference"
+VERDICT_ASSERTION_FAILED = "assertion_failed"
+VERDICT_ILLEGAL_HEAP = "illegal_heap"
+VERDICT_PARSE_ERROR = "parse_error"
+VERDICT_TIMEOUT = "timeout"
+VERDICT_ERROR = "error"
 
 
 TRANSFORMER_ASSIGN_VAR = "assign_var"
@@ -40,27 +98,204 @@ EXPR_EVEN = "even"
 EXPR_LEN = "len x y == len z w"
 EXPR_TRUE = "TRUE"
 EXPR_FALSE = "FALSE"
+# Arguments of each type of atomic expression that focus makes definite, in order (see AtomicExpression.focus_variables)
+EXPR_FOCUS_ARGS = {EXPR_VAREQNULL: ("arg1",), EXPR_VARNEQNULL: ("arg1",),
+                   EXPR_VAREQVAR: ("arg1", "arg2"), EXPR_VARNEQVAR: ("arg1", "arg2"),
+                   EXPR_LS: ("arg1", "arg2"), EXPR_ODD: ("arg1", "arg2"), EXPR_EVEN: ("arg1", "arg2"),
+                   EXPR_LEN: ("arg1", "arg2", "arg3", "arg4")}
+
+
+def main(argv = None):
+    parser = argparse.ArgumentParser(description = "Shape analysis of singly linked list programs")
+    parser.add_argument("paths", nargs = "+",
+                        help = "program files. With --batch, also directories searched for programs")
+    parser.add_argument("--batch", action = "store_true",
+                        help = "analyze every program in worker processes, without drawing, "
+                               "and write a JSON record per program")
+    parser.add_argument("--jobs", type = int, default = os.cpu_count() or 1, help = "worker processes (--batch)")
+    parser.add_argument("--timeout", type = float, default = 0, help = "seconds per program, 0 = none (--batch)")
+    parser.add_argument("--output", default = "-", help = "file for the JSON records, - = stdout (--batch)")
+    parser.add_argument("--pattern", default = "*.txt", help = "programs to take from directories (--batch)")
+    parser.add_argument("--backend", choices = sorted(HEAP_BACKENDS), default = HEAP_BACKEND_DICT)
+    parser.add_argument("--strategy", choices = sorted(WORKLISTS), default = WORKLIST_FIFO)
+    parser.add_argument("--draw", action = "store_true",
+                        help = "save pictures of the heaps where assertions held and of the last state analyzed")
+    parser.add_argument("--draw-dir", default = ".", help = "directory for the pictures (--draw)")
+    parser.add_argument("--max-heaps", type = int, default = 0,
+                        help = "bound on the heaps of a state, joining heaps (less precise) over it. 0 = none")
+    parser.add_argument("--subsume", action = "store_true",
+                        help = "drop the heaps of a state that a more general heap of the state represents")
+    parser.add_argument("--profile", help = "write the time and counters of the analysis to this JSON file")
+    parser.add_argument("--trace", help = "write Chrome trace events of the analysis to this JSON file")
+    parser.add_argument("--checkpoint", help = "save the analysis in progress to this file now and then (one program)")
+    parser.add_argument("--checkpoint-iterations", type = int, default = 0,
+                        help = "iterations between checkpoints, 0 = none (--checkpoint)")
+    parser.add_argument("--checkpoint-seconds", type = float, default = CHECKPOINT_SECONDS,
+                        help = "seconds between checkpoints, 0 = none (--checkpoint)")
+    parser.add_argument("--resume", help = "continue the analysis saved in this checkpoint file (one program)")
+    parser.add_argument("--previous",
+                        help = "checkpoint file of the finished analysis of an earlier version of the program "
+                               "(--checkpoint): only analyze again the states the edits can change (one program)")
+    args = parser.parse_args(argv)
+    if (args.checkpoint or args.resume or args.previous) and (args.batch or len(args.paths) > 1):
+        parser.error("--checkpoint, --resume and --previous take a single program")
+    if args.resume and args.previous:
+        parser.error("--resume and --previous exclude each other")
+    if args.batch and (args.draw or args.profile or args.trace):
+        parser.error("--draw, --profile and --trace take a single run, not --batch (its records have the stats)")
+    if args.batch:
+        records = run_batch(find_programs(args.paths, args.pattern), args.output, args.jobs, args.timeout,
+                            args.backend, args.strategy, args.max_heaps, args.subsume)
+        sys.exit(0 if all(record["verdict"] == VERDICT_OK for record in records) else 1)
+    for filename in args.paths:
+        try:
+            print ("Starting shape analysis on file:  " + filename)
+            graph = Cfg.from_file(program_path(filename))
+            profiler = Profiler(trace = args.trace is not None) if args.profile or args.trace else None
+            checkpoint = None
+            if args.checkpoint:
+                checkpoint = Checkpointer(args.checkpoint, args.checkpoint_iterations, args.checkpoint_seconds)
+            previous = Cfg.from_checkpoint(args.previous, args.backend) if args.previous else None
+            if args.draw:
+                with HeapRenderer(args.draw_dir) as renderer:
+                    graph.analyze(args.backend, args.strategy, renderer = renderer, profiler = profiler,
+                                  max_heaps = args.max_heaps, subsume = args.subsume, checkpoint = checkpoint,
+                                  resume = args.resume, previous = previous)
+            else:
+                graph.analyze(args.backend, args.strategy, profiler = profiler, max_heaps = args.max_heaps,
+                              subsume = args.subsume, checkpoint = checkpoint, resume = args.resume,
+                              previous = previous)
+            if args.profile:
+                profiler.write_json(args.profile)
+            if args.trace:
+                profiler.write_chrome_trace(args.trace)
+            print("Analysis complete!")
+        except ErrorParsing as e:
+            print("Error: File parsing error or illegal code given")
+            if e.args:
+                print(e.args[0])
+        except ErrorNullDereference:
+            print("Error: NULL referenced by code (or maybe referenced)")
+        except ErrorAssertionFailed:
+            print("Error: Failed to properly assert a required assertion")
+        except ErrorIllegalHeap:
+            print ("Error: The heap analyzed had an illegal/illogical structure")
+        except ErrorCheckpoint as e:
+            print("Error: Cannot read checkpoint " + (args.resume or args.previous) + ": " + e.args[0])
+
+def program_path(filename):
+    """
+    Returns the path of a program file: as given, or else relative to the directory of this script
+    @input: string filename
+    @output: string path
+    """
+    if os.path.exists(filename):
+        return filename
+    return os.path.join(sys.path[0], filename)
+
+def find_programs(paths, pattern = "*.txt"):
+    """
+    Returns the program files to analyze in a batch run: files as given,
+    and the files matching 'pattern' anywhere under directories, in sorted order
+    @input: list of string paths
+            string pattern - fnmatch pattern of program file names
+    @output: list of string file names
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for directory, subdirectories, names in os.walk(path):
+                subdirectories.sort()
+                files += [os.path.join(directory, name) for name in sorted(fnmatch.filter(names, pattern))]
+        else:
+            files.append(program_path(path))
+    return files
 
+def run_batch(files, output = "-", jobs = 1, timeout = 0, backend = HEAP_BACKEND_DICT, strategy = WORKLIST_FIFO,
+              max_heaps = 0, subsume = False):
+    """
+    Analyzes every program in 'files' (see analyze_file) in a pool of 'jobs' worker processes,
+    writing its JSON record as a line of 'output' (JSON lines), in the order of 'files'
+    @input: list of string files
+            string output - file name, "-" for stdout
+            int jobs - worker processes
+            float timeout - seconds per program, 0 = none
+            backend, strategy, max_heaps, subsume - see Cfg.analyze
+    @output: list of dictionary - the records
+    """
+    records = []
+    out = sys.stdout if output == "-" else open(output, "w")
+    try:
+        with ProcessPoolExecutor(max(1, jobs)) as pool:
+            futures = [pool.submit(analyze_file, filename, backend, strategy, timeout, max_heaps, subsume)
+                       for filename in files]
+            for filename, future in zip(files, futures):
+                try:
+                    record = future.result()
+                except Exception as e:
+                    # The worker itself died
+                    record = {"file": filename, "verdict": VERDICT_ERROR, "error": repr(e)}
+                records.append(record)
+                out.write(json.dumps(record) + "\n")
+                out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return records
 
-def main():
-    path = sys.path[0]
+def analyze_file(filename, backend = HEAP_BACKEND_DICT, strategy = WORKLIST_FIFO, timeout = 0, max_heaps = 0,
+                 subsume = False):
+    """
+    Analyzes the program in 'filename' without printing, for batch runs
+    @input: string filename
+            backend, strategy - see Cfg.analyze
+            float timeout - seconds, 0 = none. Needs SIGALRM (not on Windows)
+            max_heaps, subsume - see Cfg.analyze
+    @output: dictionary - JSON record of the program:
+                 file, verdict (VERDICT_*), failed_command and failed_state (None unless an error was found),
+                 timings - seconds spent on each phase: parse (with reading), analyze and total,
+                 stats - Cfg.stats,
+                 error - the parsing error (VERDICT_PARSE_ERROR) or unexpected exception (VERDICT_ERROR)
+    """
+    record = {"file": filename, "verdict": None, "failed_command": None, "failed_state": None,
+              "timings": {}, "stats": {}}
+    timings = record["timings"]
+    start = time.perf_counter()
+    phase = start
+    graph = None
+    alarm = timeout > 0 and hasattr(signal, "SIGALRM")
+    if alarm:
+        previous_handler = signal.signal(signal.SIGALRM, raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
     try:
-        # Add filename reading from sys.path
-        filename = sys.argv[1]
-        print ("Starting shape analysis on file:  " + filename)
-        codefile = open(path + "\\" + filename, 'r')
-        code_file_string = file.read(codefile)
-        graph = Cfg(code_file_string)
-        graph.analyze()
-        print("Analysis complete!")
-    except ErrorParsing:
-        print("Error: File parsing error or illegal code given")
-    except ErrorNullDereference:
-        print("Error: NULL referenced by code (or maybe referenced)")
-    except ErrorAssertionFailed:
-        print("Error: Failed to properly assert a required assertion")
-    except ErrorIllegalHeap:
-        print ("Error: The heap analyzed had an illegal/illogical structure")
+        graph = Cfg.from_file(filename)
+        timings["parse"] = time.perf_counter() - phase
+        phase = time.perf_counter()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            graph.analyze(backend, strategy, max_heaps = max_heaps, subsume = subsume)
+        timings["analyze"] = time.perf_counter() - phase
+        record["verdict"] = graph.verdict
+        record["failed_command"] = graph.failed_command
+        record["failed_state"] = graph.failed_state
+    except ErrorTimeout:
+        record["verdict"] = VERDICT_TIMEOUT
+    except ErrorParsing as e:
+        record["verdict"] = VERDICT_PARSE_ERROR
+        record["error"] = str(e)
+    except Exception as e:
+        record["verdict"] = VERDICT_ERROR
+        record["error"] = repr(e)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+    if graph is not None and hasattr(graph, "stats"):
+        record["stats"] = graph.stats
+    timings["total"] = time.perf_counter() - start
+    return record
+
+def raise_timeout(signum, frame):
+    raise ErrorTimeout()
 
 
 
@@ -74,119 +309,1191 @@ class Cfg:
         * State fail state
         * State start state
         * list of variables - variables
+        * SymbolTable - symbols. Index of every variable, shared by all heaps of the graph
+        * string code - the code the graph was built from
+        * string verdict - outcome of the last analyze run, one of VERDICT_*
+        * string failed_command, failed_state - where the last analyze run found an error, None if it found none
+        * dictionary - stats. Counters of the last analyze run
+        * HeapRenderer - _renderer. Of the last analyze run, None if it drew nothing
+        * Profiler - _profiler. Of the last analyze run, None if it was not profiled: worklist strategy, iterations (states popped),
+          edges (edges transformed), heaps (heaps transformed along them) and the TransferCache counters
     """
     def __init__(self, codestring):
         """
         Constructor
-        
-        @input: codefile - Whole string of the file containing the code to be analyzed
-                           Should be divided by '\n' between lines and spaces between state label and commands
-                           Proper syntax: $pre-state$ $command$ $post-state$\n
+        Parses the code line by line. State names and commands are interned, and edges with the same command
+        share one Transformer, so huge generated programs parse in one pass, with little memory
+        @input: codestring - Whole string of the file containing the code to be analyzed,
+                             or an iterable of its lines, like an open file (see from_file)
+                             Should be divided by '\n' between lines and spaces between state label and commands
+                             Proper syntax: $pre-state$ $command$ $post-state$\n
+                             Blank lines are ignored
+        Notes: raises ErrorParsing with the line number of the first illegal line
         """
-        lines = codestring.split("\n")
+        if isinstance(codestring, str):
+            self.code = codestring
+            lines = io.StringIO(codestring, newline = None)
+        else:
+            # Not kept, see source
+            self.code = None
+            lines = codestring
         self.edges = []
-        self.variables = ["NULL"]
+        self.variables = [NULL_VAR]
         self.start_state = None
         self.fail_state = State("fail",self)
         self.states = {}
         self.states["fail"] = self.fail_state
+        lines = enumerate(lines, 1)
         # Parse variables
-        var_line = lines[0]
-        for var in var_line.split():
-            self.variables += [var]
+        for number, var_line in lines:
+            for var in var_line.split():
+                self.variables += [sys.intern(var)]
+            break
+        else:
+            raise ErrorParsing("Empty code")
+        self.symbols = SymbolTable.of(self.variables)
         # Parse each line
-        for line in lines[1:]:
-            line_parts = [line[:line.find(" ")], line[line.find(" ")+1: line.rfind(" ")] , line[line.rfind(" ")+1:]]
-            # if start uninitialized, set it
-            if self.start_state == None:
-                self.start_state = State(line_parts[0],self)
-                self.start_state.heaps = [Heap(self.variables)]
-                self.states[line_parts[0]] = self.start_state
-            if line_parts[0] not in self.states.keys():
-                self.states[line_parts[0]] = State(line_parts[0],self)
-            if line_parts[2] not in self.states.keys():
-                self.states[line_parts[2]] =  State(line_parts[2],self)
-            new_edge = Edge(line_parts[0], line_parts[1], line_parts[2])
+        variables = set(self.variables)
+        transformers = {}
+        for number, line in lines:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            source, _, rest = line.partition(" ")
+            command, _, destination = rest.rpartition(" ")
+            if not command:
+                raise ErrorParsing("Line %d: expected '$pre-state$ $command$ $post-state$', got %r" % (number, line))
+            operation = transformers.get(command)
+            if operation is None:
+                try:
+                    operation = Transformer(sys.intern(command))
+                except Exception as e:
+                    raise ErrorParsing("Line %d: illegal command %r" % (number, command)) from e
+                undefined = [var for var in operation.focus_variables() if var not in variables]
+                if undefined:
+                    raise ErrorParsing("Line %d: undefined variable %r in %r" % (number, undefined[0], command))
+                transformers[operation.entire_command] = operation
+            source_state = self.states.get(source)
+            if source_state is None:
+                source_state = self.states[source] = State(sys.intern(source), self)
+                # if start uninitialized, set it
+                if self.start_state is None:
+                    self.start_state = source_state
+                    self.start_state.heaps = [Heap(self.symbols)]
+            destination_state = self.states.get(destination)
+            if destination_state is None:
+                destination_state = self.states[destination] = State(sys.intern(destination), self)
+            new_edge = Edge(source_state.name, operation, destination_state.name)
             self.edges.append(new_edge)
-            self.states[line_parts[0]].out_edges.append(new_edge)
-            self.states[line_parts[2]].in_edges.append(new_edge)
+            source_state.out_edges.append(new_edge)
+            destination_state.in_edges.append(new_edge)
             # Add edge to fail from assert if necessary
-            if "assert" in line_parts[1]:
-                fail_edge = Edge(line_parts[0], line_parts[1], FAILSTATE_NAME )
-                self.edges += [fail_edge] 
-                self.states[FAILSTATE_NAME].in_edges += [fail_edge]
-                self.states[line_parts[0]].out_edges += [fail_edge]
-        
+            if operation.operation == TRANSFORMER_ASSERT:
+                fail_edge = Edge(source_state.name, operation, FAILSTATE_NAME)
+                self.edges.append(fail_edge)
+                self.fail_state.in_edges.append(fail_edge)
+                source_state.out_edges.append(fail_edge)
+        if self.start_state is None:
+            raise ErrorParsing("Code has no commands")
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Parses the code in 'filename' while reading it, without holding the whole file in memory
+        @input: string filename
+        @output: Cfg
+        """
+        with open(filename, 'r') as codefile:
+            return cls(codefile)
+
+    @classmethod
+    def from_checkpoint(cls, filename, backend = HEAP_BACKEND_DICT):
+        """
+        Rebuilds the CFG a checkpoint was saved from (see Checkpointer), with the heaps of its states
+        @input: string filename
+                backend - heap backend of the heaps, one of HEAP_BACKENDS
+        @output: Cfg. Its verdict is VERDICT_OK if the checkpoint holds the fixed point, else None
+        Notes: raises ErrorCheckpoint (see read_checkpoint)
+        """
+        data = read_checkpoint(filename)
+        graph = cls(data["source"])
+        graph.stats = {}
+        worklist = Worklist(graph)
+        graph.restore(data, HEAP_BACKENDS[backend], worklist)
+        graph._max_heaps = data["max_heaps"]
+        graph._subsume = data["subsume"]
+        graph.verdict = VERDICT_OK if len(worklist) == 0 else None
+        return graph
+
+    def source(self):
+        """
+        Returns the code of this CFG: the string it was parsed from, or else code written back from its edges
+        @output: string
+        """
+        if self.code is not None:
+            return self.code
+        lines = [" ".join(self.variables[1:])]
+        lines += [edge.src + " " + edge.op.entire_command + " " + edge.dst
+                  for edge in self.edges if not edge.checks_assertion]
+        return "\n".join(lines)
 
-    def analyze(self):
+    def analyze(self, backend = HEAP_BACKEND_DICT, strategy = WORKLIST_FIFO,
+                cache_entries = TRANSFER_CACHE_ENTRIES, cache_bytes = TRANSFER_CACHE_BYTES, workers = 0,
+                component_workers = 0, renderer = None, profiler = None, max_heaps = 0, subsume = False,
+                checkpoint = None, resume = None, previous = None):
         """
         Runs the analysis on the CFG.
         Uses disjunctive completion of possible heaps.
         Uses disjunctive completion of different heaps in every state.
         So assume/assert when condition doesn't hold adds nothing
+        @input: backend - heap implementation to analyze with, one of HEAP_BACKENDS:
+                          HEAP_BACKEND_DICT (Heap) or HEAP_BACKEND_NUMPY (ArrayHeap). Results are identical
+                strategy - order to analyze states in, one of WORKLISTS:
+                           WORKLIST_FIFO (order added), WORKLIST_WTO (weak topological order),
+                           WORKLIST_RPO (reverse postorder, loop heads first) or WORKLIST_SET (any order).
+                           The fixed point is the same, but the number of iterations is not,
+                           and neither is which error is found first when the code has more than one
+                cache_entries, cache_bytes - bounds of the TransferCache reusing the results of transformed heaps
+                                             (0 = unbounded). cache_entries = None disables the cache
+                workers - number of worker processes transforming the heaps of an edge in parallel, 0 = none.
+                          Results are the same, in the same order
+                component_workers - if not 0, number of worker processes analyzing strongly connected components
+                                    of the CFG in parallel (see analyze_components). Replaces 'workers'
+                renderer - HeapRenderer saving pictures of the heaps of the states where assertions held,
+                           and of the last state analyzed. None = no pictures
+                profiler - Profiler recording time and counters of the phases, edges and states. None = no profiling
+                max_heaps - bound on the heaps of every state, 0 = none. A state that goes over it partially joins
+                            its heaps (see State.bound_heaps), trading precision for memory and iterations
+                subsume - whether states keep only the most general heaps (see State.join_heaps) instead of
+                          every heap that is not equivalent to another. Same errors found, in fewer iterations
+                checkpoint - Checkpointer saving the analysis in progress now and then, None = no checkpoints
+                resume - file name of a checkpoint of this CFG to continue from, instead of from the start state.
+                         Reaches the same fixed point as the analysis that wrote it, given the same max_heaps and subsume.
+                         Checkpoints are pickles: only resume from files you trust
+                previous - Cfg of an earlier version of this program, analyzed to its fixed point with the same
+                           max_heaps and subsume (see reuse). Its states the edits cannot change keep their heaps,
+                           and only the others are analyzed again. None = analyze everything
+                checkpoint, resume and previous need component_workers = 0
+        Counts the iterations in self.stats, sets self.verdict
+        Notes: raises ErrorCheckpoint if 'resume' is not a checkpoint of this CFG
         """
-        
+        if component_workers > 0 and (checkpoint is not None or resume is not None or previous is not None):
+            raise ValueError("checkpoint, resume and previous need component_workers = 0")
+        heap_class = HEAP_BACKENDS[backend]
+        self.start_state.heaps = [h if type(h) is heap_class else heap_class.from_heap(h) for h in self.start_state.heaps]
+        self.stats = {"worklist": strategy, "iterations": 0, "edges": 0, "heaps": 0, "joined_heaps": 0,
+                      "capped_states": 0, "subsumed_heaps": 0, "reused_states": 0}
+        self._max_heaps = max_heaps
+        self._capped = set()
+        self._subsume = subsume
+        self._current_state = self.start_state
+        self._current_edge = None
+        self._renderer = renderer
+        self._profiler = profiler
+        self.verdict = None
+        self.failed_command = None
+        self.failed_state = None
+        cache = None
+        pool = None
         try:
-            worklist = set([self.start_state])
-            while not len(worklist) == 0:
-                current_src_state = worklist.pop()
-                print("Analyzing state:" + current_src_state.name)
-                for edge in current_src_state.out_edges:
-                    transformed = []
-                    src_heaps = current_src_state.heaps
-                    if edge.op.operation == TRANSFORMER_ASSERT and edge.dst == FAILSTATE_NAME:
-                        # For assertions, we need ALL the heaps in the source state to hold, otherwise its unprovable...
-                        for heap in src_heaps:
-                            focused = heap.focus(edge.op)
-                            for h in focused:
-                                heap_after_transformer = h.apply_transformer(edge.op)
-                                # If the transformer resulted in None then the assertion does not hold for this heap
-                                if heap_after_transformer == None:
-                                    raise ErrorAssertionFailed()
-                        print("Assertion Successfull!  " + edge.op.entire_command)
-                        # Save picture #################
-                        draw_state_to_png(current_src_state)
-                        ################################
-                    else:
-                        for heap in src_heaps:
-                            # Returns the heap after the transformer or None (if condition evaluated to 0)
-                            focused = heap.focus(edge.op)
-                            for h in focused:
-                                transformed.append(h.apply_transformer(edge.op))  
-                        # Remove all "None" heaps
-                        transformed = [heap for heap in transformed if heap != None]
-                        # Coerce results
-                        transformed = coerce_red(transformed)
-                        # Use canonical abstraction
-                        canon_abst  = canonical_abstraction(transformed)
-                        # If not all heaps in update are included in destination (disjunctive completion, all options already exist in edge.dst) update and add to worklist                
-                        all_included = True
-                        updated_state_heaps = heaps_join(self.states[edge.dst].heaps, canon_abst )
-                        if len(updated_state_heaps) > len(self.states[edge.dst].heaps):
-                            all_included = False
-                        if all_included == False:
-                            # Update destination by joining its heap with the transformed heap of the source
-                            self.states[edge.dst].heaps = updated_state_heaps
-                            worklist.add(self.states[edge.dst])
+            if component_workers > 0:
+                self.analyze_components(backend, strategy, cache_entries, cache_bytes, component_workers, renderer,
+                                        max_heaps, subsume)
+            else:
+                if cache_entries is not None:
+                    cache = TransferCache(cache_entries, cache_bytes)
+                if workers > 0:
+                    pool = ProcessPoolExecutor(workers)
+                worklist = WORKLISTS[strategy](self)
+                if resume is not None:
+                    self.restore(read_checkpoint(resume), heap_class, worklist)
+                    print ("Resuming from checkpoint " + resume + " after " + str(self.stats["iterations"]) +
+                           " iterations")
+                elif previous is not None and self.reuse(previous, heap_class, worklist):
+                    print ("Incremental: reused the heaps of " + str(self.stats["reused_states"]) + " of " +
+                           str(len(self.states)) + " states, analyzing again from " + str(len(worklist)))
+                else:
+                    worklist.add(self.start_state)
+                if checkpoint is not None:
+                    checkpoint.start(self.stats["iterations"])
+                self.fixpoint(worklist, backend, cache, pool, workers, checkpoint = checkpoint)
+                if checkpoint is not None:
+                    # The fixed point, to resume (nothing left to do) or to be 'previous' of the next version
+                    checkpoint.save(self, worklist)
+                if cache is not None:
+                    self.stats.update(cache.stats())
+            self.verdict = VERDICT_OK
             print ("Reached fixed point, analysis complete")
-            cd()
-            print ("Saving last analyzed state, before command " + edge.op.entire_command)
-            draw_state_to_png(current_src_state)
+            print ("Worklist " + strategy + ": " + str(self.stats["iterations"]) + " iterations")
+            if "cache_hits" in self.stats:
+                print ("Transfer cache: " + str(self.stats["cache_hits"]) + " hits, " +
+                       str(self.stats["cache_misses"]) + " misses")
+            if subsume:
+                print ("Subsumption: dropped " + str(self.stats["subsumed_heaps"]) + " heaps")
+            if checkpoint is not None:
+                print ("Checkpoints: wrote " + str(checkpoint.written) + " to " + checkpoint.filename)
+            self._report_precision()
+            if renderer is not None:
+                if self._current_edge is not None:
+                    print ("Saving last analyzed state, before command " + self._current_edge.op.entire_command)
+                renderer.draw_state(self._current_state)
         except ErrorNullDereference:
+            self._failed(VERDICT_NULL_DEREFERENCE)
+            self._report_precision()
             print("Error: NULL referenced by code (or maybe referenced)")
-            print("Command was:" + edge.op.entire_command)
-            draw_state_to_png(current_src_state)
+            print("Command was:" + self._current_edge.op.entire_command)
+            if renderer is not None:
+                renderer.draw_state(self._current_state)
         except ErrorAssertionFailed:
+            self._failed(VERDICT_ASSERTION_FAILED)
+            self._report_precision()
             print("Error: Failed to properly assert a required assertion")
-            print("Command was:" + edge.op.entire_command)
-            draw_state_to_png(current_src_state)
+            print("Command was:" + self._current_edge.op.entire_command)
+            if renderer is not None:
+                renderer.draw_state(self._current_state)
         except ErrorIllegalHeap:
+            self._failed(VERDICT_ILLEGAL_HEAP)
+            self._report_precision()
             print ("Error: The heap analyzed had an illegal/illogical structure")
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures = True)
+            if cache is not None:
+                self.stats.update(cache.stats())
+
+    def _report_precision(self):
+        """
+        Tells whether the heap bound (max_heaps) joined heaps, so the results are less precise
+        """
+        if self.stats["joined_heaps"]:
+            print ("Heap bound " + str(self._max_heaps) + ": joined " + str(self.stats["joined_heaps"]) +
+                   " heaps in " + str(self.stats["capped_states"]) + " states. " +
+                   "Results are sound but less precise: errors found may be false alarms")
+
+    def _failed(self, verdict):
+        """
+        Records the verdict of an analysis that found an error, and where it was found
+        @input: verdict - one of VERDICT_*
+        """
+        self.verdict = verdict
+        self.failed_state = self._current_state.name
+        if self._current_edge is not None:
+            self.failed_command = self._current_edge.op.entire_command
+
+    def fixpoint(self, worklist, backend = HEAP_BACKEND_DICT, cache = None, pool = None, workers = 0, component = None,
+                 checkpoint = None):
+        """
+        Analyzes the states in the worklist, adding every state that got new heaps, until the worklist is empty
+        @input: Worklist worklist
+                backend, cache, pool, workers - see transfer_heaps
+                set of state names component - if given, states outside it get their new heaps
+                                               but are not added to the worklist
+                Checkpointer checkpoint - saves the analysis between iterations when due, or None
+        @output: edits the states. Counts the iterations in self.stats, and more in self._profiler if set
+        """
+        profiler = self._profiler
+        while not len(worklist) == 0:
+            current_src_state = worklist.pop()
+            self._current_state = current_src_state
+            self.stats["iterations"] += 1
+            print("Analyzing state:" + current_src_state.name)
+            if profiler is not None:
+                visit_start = profiler.clock()
+            for edge in current_src_state.out_edges:
+                self._current_edge = edge
+                # Only heaps added since this edge was last taken: the others were already transformed along it
+                src_heaps = current_src_state.new_heaps(edge)
+                if not src_heaps:
+                    continue
+                self.stats["edges"] += 1
+                self.stats["heaps"] += len(src_heaps)
+                if profiler is not None:
+                    edge_start = profiler.clock()
+                if edge.checks_assertion:
+                    # For assertions, we need ALL the heaps in the source state to hold, otherwise its unprovable...
+                    for heap in src_heaps:
+                        focused = heap.focus(edge.op)
+                        for h in focused:
+                            heap_after_transformer = h.apply_transformer(edge.op)
+                            # If the transformer resulted in None then the assertion does not hold for this heap
+                            if heap_after_transformer == None:
+                                raise ErrorAssertionFailed()
+                    print("Assertion Successfull!  " + edge.op.entire_command)
+                    # Save picture #################
+                    if self._renderer is not None:
+                        self._renderer.draw_state(current_src_state)
+                    ################################
+                    if profiler is not None:
+                        profiler.edge(edge, edge_start, None, len(src_heaps), 0, 0)
+                else:
+                    # Focus, transform, coerce and abstract every heap. Each heap is handled on its own
+                    canon_abst = self.transfer_heaps(src_heaps, edge.op, backend, cache, pool, workers)
+                    # If not all heaps in update are included in destination (disjunctive completion, all options already exist in edge.dst) update and add to worklist                
+                    # Update destination by joining its heap with the transformed heap of the source
+                    if profiler is not None:
+                        join_start = profiler.clock()
+                    added = self.states[edge.dst].join_heaps(canon_abst, self._subsume)
+                    if self._subsume:
+                        self.stats["subsumed_heaps"] += self.states[edge.dst].subsumed
+                    if self._max_heaps and added and len(self.states[edge.dst].heaps) > self._max_heaps:
+                        added, joined = self.states[edge.dst].bound_heaps(added, self._max_heaps)
+                        if joined:
+                            self.stats["joined_heaps"] += joined
+                            if edge.dst not in self._capped:
+                                self._capped.add(edge.dst)
+                                self.stats["capped_states"] += 1
+                    if profiler is not None:
+                        profiler.edge(edge, edge_start, join_start, len(src_heaps), len(canon_abst), len(added))
+                    if added:
+                        if component is None or edge.dst in component:
+                            worklist.add(self.states[edge.dst])
+            if profiler is not None:
+                profiler.visit(current_src_state, visit_start)
+            if checkpoint is not None and checkpoint.due(self.stats["iterations"]):
+                checkpoint.save(self, worklist)
+
+    def digest(self):
+        """
+        Returns a digest of the variables and edges of this CFG, the same however it was parsed.
+        Checkpoints are only resumed on a CFG of the same digest
+        @output: string
+        """
+        digest = hashlib.blake2b(digest_size = 16)
+        digest.update(repr(self.variables).encode())
+        for edge in self.edges:
+            digest.update(repr((edge.src, edge.op.entire_command, edge.dst)).encode())
+        return digest.hexdigest()
+
+    def checkpoint_data(self, worklist):
+        """
+        Returns the analysis in progress, between two iterations of fixpoint, in the form checkpoints store
+        @input: Worklist worklist - of the analysis
+        @output: dictionary: version - CHECKPOINT_VERSION,
+                             digest - see digest,
+                             source - see source,
+                             max_heaps, subsume - of the analysis, see analyze,
+                             stats - self.stats,
+                             worklist - list of the names of the states in the worklist, in pop order,
+                             capped - list of the names of the states the heap bound joined heaps of,
+                             states - state name -> the state in compact form (see State.checkpoint),
+                                      for every state with heaps
+        """
+        return {"version": CHECKPOINT_VERSION, "digest": self.digest(), "source": self.source(),
+                "max_heaps": self._max_heaps, "subsume": self._subsume, "stats": dict(self.stats),
+                "worklist": worklist.names(), "capped": sorted(self._capped),
+                "states": dict((name, state.checkpoint()) for name, state in self.states.items() if state.heaps)}
+
+    def restore(self, data, heap_class, worklist):
+        """
+        Restores the analysis in progress saved by checkpoint_data, to continue it with fixpoint
+        @input: dictionary data - see checkpoint_data
+                heap_class - class of the heaps to restore, one of HEAP_BACKENDS. Any backend reads any checkpoint
+                Worklist worklist - empty, gets the states of the saved worklist
+        @output: edits the states, self.stats and self._capped
+        Notes: raises ErrorCheckpoint if 'data' was saved from another CFG
+        """
+        if data.get("digest") != self.digest():
+            raise ErrorCheckpoint("it was saved from another program")
+        for name, state in self.states.items():
+            state.restore(heap_class, *data["states"].get(name, ([], [])))
+        for key, value in data["stats"].items():
+            if key != "worklist":
+                self.stats[key] = value
+        self._capped = set(data["capped"])
+        for name in data["worklist"]:
+            worklist.add(self.states[name])
+
+    def reuse(self, previous, heap_class, worklist):
+        """
+        Starts an incremental analysis from the fixed point of 'previous', an earlier version of this program.
+        A state can lose heaps only if an edge the edits removed (a changed command is removed and added)
+        is on a path from the start state to it, that is if it is reachable from the destination of such an edge,
+        in 'previous' or in this CFG: these states start over without heaps. Every other state keeps the heaps
+        it had in 'previous', which it has in this CFG too, already transformed along its out edges that were
+        in 'previous' to states that keep theirs (and along its assertions that were there before).
+        Added edges only add heaps, so the worklist gets the states on the frontier, with heaps left to transform
+        along an out edge, and the start state if it starts over. Then fixpoint reaches the fixed point
+        of a full analysis.
+        With max_heaps or subsume, which heaps a state keeps depends on the order they reach it, so it reaches
+        one as sound that may keep other heaps
+        @input: Cfg previous - analyzed to its fixed point
+                heap_class - class of the heaps of this analysis, one of HEAP_BACKENDS
+                Worklist worklist - empty
+        @output: int - number of states that kept their heaps, also in self.stats["reused_states"].
+                 0 if 'previous' cannot be reused: it did not reach its fixed point, has other variables,
+                 another start state, or was analyzed with another max_heaps or subsume
+        """
+        if (getattr(previous, "verdict", None) != VERDICT_OK or previous.variables != self.variables or
+                previous.start_state.name != self.start_state.name or
+                (previous._max_heaps, previous._subsume) != (self._max_heaps, self._subsume)):
+            return 0
+        old_edges = Counter(edge_key(edge) for edge in previous.edges)
+        new_edges = Counter(edge_key(edge) for edge in self.edges)
+        roots = set(dst for _, _, dst in old_edges - new_edges)
+        changing = reachable_states(old_edges, roots) | reachable_states(new_edges, roots)
+        kept = set(name for name in self.states if name in previous.states and name not in changing)
+        for name, state in self.states.items():
+            if name in kept:
+                state.heaps = [h if type(h) is heap_class else heap_class.from_heap(h)
+                               for h in previous.states[name].heaps]
+            elif state is self.start_state:
+                state.heaps = [heap_class(self.symbols)]
+                worklist.add(state)
+            else:
+                state.heaps = []
+        for name in kept:
+            state = self.states[name]
+            frontier = False
+            for edge in state.out_edges:
+                done = edge_key(edge) in old_edges and (edge.checks_assertion or edge.dst in kept)
+                if done:
+                    state.mark_propagated(edge)
+                else:
+                    frontier = True
+            if frontier and state.heaps:
+                worklist.add(state)
+        self._capped = set(name for name in previous._capped if name in kept)
+        self.stats["reused_states"] = len(kept)
+        return len(kept)
+
+    def components(self):
+        """
+        Returns the strongly connected components of the CFG (Tarjan), in topological order:
+        an edge between two components goes from the earlier one to the later one
+        @input:
+        @output: list of lists of State
+        """
+        index = {}
+        low = {}
+        stack = []
+        on_stack = set()
+        result = []
+        for root in [self.start_state] + list(self.states.values()):
+            if root in index:
+                continue
+            index[root] = low[root] = len(index)
+            stack.append(root)
+            on_stack.add(root)
+            work = [(root, iter(self.successors(root)))]
+            while work:
+                state, succ = work[-1]
+                for dst in succ:
+                    if dst not in index:
+                        index[dst] = low[dst] = len(index)
+                        stack.append(dst)
+                        on_stack.add(dst)
+                        work.append((dst, iter(self.successors(dst))))
+                        break
+                    elif dst in on_stack:
+                        low[state] = min(low[state], index[dst])
+                else:
+                    work.pop()
+                    if work:
+                        parent = work[-1][0]
+                        low[parent] = min(low[parent], low[state])
+                    if low[state] == index[state]:
+                        component = []
+                        while True:
+                            member = stack.pop()
+                            on_stack.discard(member)
+                            component.append(member)
+                            if member is state:
+                                break
+                        result.append(component)
+        # Tarjan finds a component after all components it has edges to
+        result.reverse()
+        return result
+
+    def analyze_components(self, backend, strategy, cache_entries, cache_bytes, workers, renderer = None,
+                           max_heaps = 0, subsume = False):
+        """
+        Analyzes the strongly connected components of the CFG in a pool of 'workers' processes.
+        A component runs to its own fixed point (see analyze_component) as soon as every component with edges
+        into it has reached its own, so components ready at the same time, like loops in sibling branches,
+        run in parallel.
+        A component gets the heaps of the components before it in topological order, so states get the same heaps
+        in the same order whatever order the workers finish in
+        @input: see analyze
+        @output: edits the states, adds the counters of the workers to self.stats,
+                 passes the heaps the workers drew to 'renderer'
+        Notes: if components fail, raises the error of the earliest one in topological order, whatever order
+               the workers finish in. Components after it are not started
+        """
+        heap_class = HEAP_BACKENDS[backend]
+        code = self.source()
+        components = self.components()
+        component_of = dict((state, i) for i, component in enumerate(components) for state in component)
+        preds = [set() for _ in components]
+        succs = [set() for _ in components]
+        for i, component in enumerate(components):
+            for state in component:
+                for dst in self.successors(state):
+                    j = component_of[dst]
+                    if j != i:
+                        preds[j].add(i)
+                        succs[i].add(j)
+        waiting = [len(p) for p in preds]
+        # Heaps each finished component sent to states after it: component -> state name -> compact heaps
+        outputs = {}
+        ready = deque(i for i in range(len(components)) if waiting[i] == 0)
+        running = {}
+        # 2-tuple (component, error - see analyze_component) of the earliest failed component, None if none failed
+        failed = None
+        pool = ProcessPoolExecutor(workers)
+        try:
+            while ready or running:
+                while ready:
+                    i = ready.popleft()
+                    if failed is not None and i > failed[0]:
+                        # Its error could not be the one raised
+                        continue
+                    names = [state.name for state in components[i]]
+                    for p in sorted(preds[i]):
+                        for state in components[i]:
+                            compact_heaps = outputs[p].get(state.name)
+                            if compact_heaps:
+                                state.join_heaps([heap_class.from_compact(data) for data in compact_heaps], subsume)
+                    entry = dict((state.name, [h.compact() for h in state.heaps]) for state in components[i] if state.heaps)
+                    if entry:
+                        future = pool.submit(analyze_component, code, names, entry, backend, strategy,
+                                             cache_entries, cache_bytes, renderer is not None, max_heaps, subsume)
+                        running[future] = i
+                    else:
+                        # Nothing reaches this component
+                        outputs[i] = {}
+                        for j in sorted(succs[i]):
+                            waiting[j] -= 1
+                            if waiting[j] == 0:
+                                ready.append(j)
+                if not running:
+                    continue
+                done, _ = wait(running, return_when = FIRST_COMPLETED)
+                for future in sorted(done, key = running.get):
+                    i = running.pop(future)
+                    heaps, stats, error, drawings = future.result()
+                    for name, compact_heaps in drawings:
+                        renderer.draw_heaps(name, compact_heaps)
+                    for key, value in stats.items():
+                        if key != "worklist":
+                            self.stats[key] = self.stats.get(key, 0) + value
+                    if error is not None:
+                        if failed is None or i < failed[0]:
+                            failed = (i, error)
+                        continue
+                    names = set(state.name for state in components[i])
+                    for state in components[i]:
+                        state.heaps = [heap_class.from_compact(data) for data in heaps.get(state.name, [])]
+                    outputs[i] = dict((name, compact_heaps) for name, compact_heaps in heaps.items() if name not in names)
+                    for j in sorted(succs[i]):
+                        waiting[j] -= 1
+                        if waiting[j] == 0:
+                            ready.append(j)
+        finally:
+            pool.shutdown(cancel_futures = True)
+        if failed is not None:
+            exception, state_name, edge_index = failed[1]
+            self._current_state = self.states[state_name]
+            self._current_edge = self._current_state.out_edges[edge_index]
+            raise exception
+
+    def analyze_component(self, names, heaps, backend = HEAP_BACKEND_DICT, strategy = WORKLIST_FIFO,
+                          cache_entries = TRANSFER_CACHE_ENTRIES, cache_bytes = TRANSFER_CACHE_BYTES, draw = False,
+                          max_heaps = 0, subsume = False):
+        """
+        Runs the analysis on a single strongly connected component until its fixed point, given the heaps
+        its states got from the components before it. States after the component collect the heaps it sends them,
+        but are not analyzed.
+        @input: list of state names - names, the component
+                dictionary of state name to list of compact heaps (see Heap.compact) - heaps, the heaps of the
+                component's states on entry
+                backend, strategy, cache_entries, cache_bytes, max_heaps, subsume - see analyze
+                bool draw - whether to queue the heaps to draw (see HeapRenderer.draw_heaps)
+        @output: 4-tuple (dictionary of state name to list of compact heaps: every state with heaps at the end,
+                          dictionary stats,
+                          error: None, or 3-tuple (exception, name of the state and index of the edge it was raised on),
+                          list of (state name, list of compact heaps) to draw, in order)
+        """
+        heap_class = HEAP_BACKENDS[backend]
+        # Only queues the heaps, drawn by the renderer of the main process
+        self._renderer = HeapRenderer(workers = 0) if draw else None
+        self._profiler = None
+        for state in self.states.values():
+            state.heaps = [heap_class.from_compact(data) for data in heaps.get(state.name, [])]
+        self.stats = {"worklist": strategy, "iterations": 0, "edges": 0, "heaps": 0, "joined_heaps": 0,
+                      "capped_states": 0, "subsumed_heaps": 0, "reused_states": 0}
+        self._max_heaps = max_heaps
+        self._capped = set()
+        self._subsume = subsume
+        cache = None
+        if cache_entries is not None:
+            cache = TransferCache(cache_entries, cache_bytes)
+        worklist = WORKLISTS[strategy](self)
+        for name in names:
+            if self.states[name].heaps:
+                worklist.add(self.states[name])
+        error = None
+        try:
+            self.fixpoint(worklist, backend, cache, component = set(names))
+        except (ErrorNullDereference, ErrorAssertionFailed, ErrorIllegalHeap) as e:
+            error = (e, self._current_state.name, self._current_state.out_edges.index(self._current_edge))
+        if cache is not None:
+            self.stats.update(cache.stats())
+        heaps_out = dict((name, [h.compact() for h in state.heaps]) for name, state in self.states.items() if state.heaps)
+        drawings = self._renderer.queued if draw else []
+        return heaps_out, self.stats, error, drawings
+
+    def transfer_heaps(self, heaps, transformer, backend = HEAP_BACKEND_DICT, cache = None, pool = None, workers = 0):
+        """
+        Returns transfer(heap, transformer) of every heap in 'heaps', concatenated in order
+        @input: list of Heap heaps
+                Transformer transformer
+                backend - heap backend of the heaps
+                TransferCache cache - results to reuse and to add to, or None
+                ProcessPoolExecutor pool - runs the heaps missing from the cache in 'workers' batches, or None
+        @output: list of Heap
+        """
+        results = [None] * len(heaps)
+        missing = []
+        for i, heap in enumerate(heaps):
+            if cache is not None:
+                results[i] = cache.lookup(heap, transformer)
+            if results[i] is None:
+                missing.append(i)
+        if pool is None or len(missing) < 2:
+            for i in missing:
+                results[i] = transfer(heaps[i], transformer, self._profiler)
+        else:
+            # Heaps travel in compact form, a batch per worker. Batches are collected in order,
+            # so the first error raised is the one a sequential run would raise
+            heap_class = HEAP_BACKENDS[backend]
+            size = -(-len(missing) // workers)
+            batches = [missing[k:k + size] for k in range(0, len(missing), size)]
+            futures = [pool.submit(transfer_compact, backend, transformer.entire_command,
+                                   [heaps[i].compact() for i in batch]) for batch in batches]
+            for batch, future in zip(batches, futures):
+                for i, compact_heaps in zip(batch, future.result()):
+                    results[i] = [heap_class.from_compact(data) for data in compact_heaps]
+        if cache is not None:
+            for i in missing:
+                cache.store(heaps[i], transformer, results[i])
+        transformed = []
+        for result in results:
+            transformed += result
+        return transformed
+
+    def successors(self, state):
+        """
+        Returns the states 'state' has an edge to, in edge order, without repetitions
+        @input: State state
+        @output: list of State
+        """
+        succ = []
+        for edge in state.out_edges:
+            dst = self.states[edge.dst]
+            if dst not in succ:
+                succ.append(dst)
+        return succ
+
+    def reverse_postorder(self):
+        """
+        Orders the states reachable from the start state by reverse postorder of a DFS.
+        Every edge goes forward in this order, except back edges, which enter loop heads
+        @input:
+        @output: 2-tuple (list of State in reverse postorder, set of State - loop heads)
+        """
+        postorder = []
+        loop_heads = set()
+        on_stack = set([self.start_state])
+        visited = set([self.start_state])
+        stack = [(self.start_state, iter(self.successors(self.start_state)))]
+        while stack:
+            state, succ = stack[-1]
+            for dst in succ:
+                if dst in on_stack:
+                    loop_heads.add(dst)
+                elif dst not in visited:
+                    visited.add(dst)
+                    on_stack.add(dst)
+                    stack.append((dst, iter(self.successors(dst))))
+                    break
+            else:
+                stack.pop()
+                on_stack.discard(state)
+                postorder.append(state)
+        postorder.reverse()
+        return postorder, loop_heads
+
+    def weak_topological_order(self):
+        """
+        Computes a weak topological order of the states reachable from the start state (Bourdoncle, 1993):
+        a topological order in which every strongly connected component (a loop) is a contiguous component
+        whose first state, its head, is the only one entered from outside it.
+        @input:
+        @output: list of State and components. A component is a 2-tuple (State head, list of State and components)
+        """
+        dfn = {}
+        stack = []
+        counter = 0
+        partition = []
+        # The depth-first search keeps its own stack of frames instead of recursing once per state:
+        # ["visit", state, partition, successors left, head, loop] while visiting a state, and
+        # ["component", state, partition, successors left, head, component partition] while building the component
+        # of a loop head. 'returned' is the head of the visit that finished last
+        frames = []
+        returned = None
+
+        def visit(state, partition):
+            stack.append(state)
+            dfn[state] = counter
+            frames.append(["visit", state, partition, iter(self.successors(state)), counter, False])
+
+        counter += 1
+        visit(self.start_state, partition)
+        while frames:
+            frame = frames[-1]
+            kind, state, outer, successors, head = frame[:5]
+            if kind == "visit":
+                if returned is not None:
+                    # A successor was visited
+                    if returned <= head:
+                        frame[4] = head = returned
+                        frame[5] = True
+                    returned = None
+                for dst in successors:
+                    if dfn.get(dst, 0) == 0:
+                        counter += 1
+                        visit(dst, outer)
+                        break
+                    if dfn[dst] <= head:
+                        frame[4] = head = dfn[dst]
+                        frame[5] = True
+                else:
+                    if head == dfn[state]:
+                        dfn[state] = float("inf")
+                        element = stack.pop()
+                        if frame[5]:
+                            while element != state:
+                                dfn[element] = 0
+                                element = stack.pop()
+                            # Build the component of the loop, then return 'head'
+                            frames[-1] = ["component", state, outer, iter(self.successors(state)), head, []]
+                            continue
+                        outer.insert(0, state)
+                    frames.pop()
+                    returned = head
+            else:
+                returned = None
+                inner = frame[5]
+                for dst in successors:
+                    if dfn.get(dst, 0) == 0:
+                        counter += 1
+                        visit(dst, inner)
+                        break
+                else:
+                    outer.insert(0, (state, inner))
+                    frames.pop()
+                    returned = head
+        return partition
+
+
+class Worklist:
+    """
+    Class for the worklist of Cfg.analyze: the states left to analyze, each held once.
+    Pops the states in no particular order. Subclasses choose an order (see WORKLISTS)
+    Fields:
+        * Cfg - graph_ptr
+        * set of State - pending
+    """
+    def __init__(self, graph):
+        """
+        Constructor
+        @input: Cfg graph - the analyzed graph
+        """
+        self.graph_ptr = graph
+        self.pending = set()
+
+    def add(self, state):
+        self.pending.add(state)
+
+    def pop(self):
+        return self.pending.pop()
+
+    def names(self):
+        """
+        @output: list of the names of the pending states, in the order pop returns them
+        """
+        return [state.name for state in self.pending]
+
+    def __len__(self):
+        return len(self.pending)
+
+
+class FifoWorklist(Worklist):
+    """
+    Worklist popping states in the order they were added
+    """
+    def __init__(self, graph):
+        Worklist.__init__(self, graph)
+        self.queue = deque()
+
+    def add(self, state):
+        if state not in self.pending:
+            self.pending.add(state)
+            self.queue.append(state)
+
+    def pop(self):
+        state = self.queue.popleft()
+        self.pending.discard(state)
+        return state
+
+    def names(self):
+        return [state.name for state in self.queue]
+
+
+class PriorityWorklist(Worklist):
+    """
+    Worklist popping the state of lowest priority(state) first. Ties are popped by state name
+    Fields:
+        * function State -> comparable - priority
+        * list of (priority, name) - queue, a heapq
+    """
+    def __init__(self, graph, priority):
+        """
+        Constructor
+        @input: Cfg graph - the analyzed graph
+                function priority - State -> comparable, the lowest is popped first
+        """
+        Worklist.__init__(self, graph)
+        self.priority = priority
+        self.queue = []
+
+    def add(self, state):
+        if state not in self.pending:
+            self.pending.add(state)
+            heapq.heappush(self.queue, (self.priority(state), state.name))
+
+    def pop(self):
+        _, name = heapq.heappop(self.queue)
+        state = self.graph_ptr.states[name]
+        self.pending.discard(state)
+        return state
+
+    def names(self):
+        return [name for _, name in sorted(self.queue)]
+
+
+class RpoWorklist(PriorityWorklist):
+    """
+    Worklist popping states in reverse postorder, pending loop heads first:
+    a loop head collects what its loop body sent back before anything downstream of it runs again
+    Fields:
+        * dictionary State -> int - order, position in reverse postorder
+        * set of State - loop_heads
+    """
+    def __init__(self, graph):
+        rpo, self.loop_heads = graph.reverse_postorder()
+        self.order = dict((state, i) for i, state in enumerate(rpo))
+        PriorityWorklist.__init__(self, graph, self.rpo_priority)
+
+    def rpo_priority(self, state):
+        return (state not in self.loop_heads, self.order.get(state, len(self.order)))
+
+
+class WtoWorklist(PriorityWorklist):
+    """
+    Worklist popping states by their position in the weak topological order of the graph.
+    A loop (component) is iterated until it is stable before the states following it run,
+    and inner loops stabilize before their outer loop's head is analyzed again
+    Fields:
+        * dictionary State -> int - order, position in the flattened weak topological order
+    """
+    def __init__(self, graph):
+        PriorityWorklist.__init__(self, graph, self.wto_priority)
+        self.order = {}
+        elements = list(reversed(graph.weak_topological_order()))
+        while elements:
+            element = elements.pop()
+            if isinstance(element, tuple):
+                head, body = element
+                elements.extend(reversed(body))
+                element = head
+            self.order[element] = len(self.order)
+
+    def wto_priority(self, state):
+        return self.order.get(state, len(self.order))
+
+
+WORKLISTS = {WORKLIST_SET: Worklist, WORKLIST_FIFO: FifoWorklist, WORKLIST_RPO: RpoWorklist, WORKLIST_WTO: WtoWorklist}
+
+
+class TransferCache:
+    """
+    LRU cache of transfer(heap, transformer): the abstract heaps a heap becomes along an edge.
+    Keyed by the heap's fingerprint and the transformer's command, so equivalent heaps reaching edges with
+    the same command share the entry. A hit is confirmed with is_equivalent.
+    The cached heaps are never edited in place (like the heaps of a State), so they are returned as they are
+    Fields:
+        * OrderedDict - entries. (fingerprint, command, joined) -> list of (Heap, list of Heap - transfer result, int size),
+          least recently used first
+        * int max_entries - bound on the number of entries, 0 = unbounded
+        * int max_bytes - bound on the estimated size (Heap.nbytes) of the cached heaps, 0 = unbounded
+        * int nbytes - estimated size of the cached heaps
+        * int hits, misses, evictions - counters
+    """
+    def __init__(self, max_entries = TRANSFER_CACHE_ENTRIES, max_bytes = TRANSFER_CACHE_BYTES):
+        """
+        Constructor
+        @input: int max_entries
+                int max_bytes
+        """
+        self.entries = OrderedDict()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def transfer(self, heap, transformer):
+        """
+        Returns transfer(heap, transformer), from the cache if an equivalent heap was already transferred
+        @input: Heap heap
+                Transformer transformer
+        @output: list of Heap
+        """
+        result = self.lookup(heap, transformer)
+        if result is None:
+            result = transfer(heap, transformer)
+            self.store(heap, transformer, result)
+        return result
+
+    def lookup(self, heap, transformer):
+        """
+        Returns the cached transfer(heap, transformer), or None if it is not cached. Counts a hit or a miss
+        @input: Heap heap
+                Transformer transformer
+        @output: list of Heap or None
+        """
+        key = (heap.fingerprint(), transformer.entire_command, heap.joined)
+        bucket = self.entries.get(key)
+        if bucket is not None:
+            for cached_heap, result, _ in bucket:
+                if cached_heap is heap or heap.is_equivalent(cached_heap):
+                    self.hits += 1
+                    self.entries.move_to_end(key)
+                    return result
+        self.misses += 1
+        return None
+
+    def store(self, heap, transformer, result):
+        """
+        Caches 'result' as transfer(heap, transformer), evicting old entries if needed
+        @input: Heap heap
+                Transformer transformer
+                list of Heap result
+        """
+        size = heap.nbytes() + sum(h.nbytes() for h in result)
+        if self.max_bytes and size > self.max_bytes:
+            return
+        key = (heap.fingerprint(), transformer.entire_command, heap.joined)
+        self.entries.setdefault(key, []).append((heap, result, size))
+        self.nbytes += size
+        self._evict()
+
+    def _evict(self):
+        """
+        Drops least recently used entries until the cache is within its bounds
+        """
+        while self.entries and ((self.max_entries and len(self.entries) > self.max_entries) or
+                                (self.max_bytes and self.nbytes > self.max_bytes)):
+            _, bucket = self.entries.popitem(last = False)
+            self.nbytes -= sum(size for _, _, size in bucket)
+            self.evictions += 1
+
+    def stats(self):
+        """
+        Returns the counters of this cache
+        @output: dictionary
+        """
+        return {"cache_hits": self.hits, "cache_misses": self.misses, "cache_evictions": self.evictions,
+                "cache_entries": len(self.entries), "cache_bytes": self.nbytes}
 
-            
-        
-        
         
+class Profiler:
+    """
+    Instrumentation of an analysis, given to Cfg.analyze. Records:
+    the calls and time of every phase of PROFILER_PHASES, the visits of every state,
+    the heaps in and out of every edge, the heaps discarded by coercion or by unsatisfied conditions,
+    and the largest heap made. Exported as JSON (summary, write_json) and Chrome trace events (write_chrome_trace).
+    When no Profiler is given, the analysis only checks for None, once per state, edge and heap transferred.
+    Transfers run in worker processes (Cfg.analyze with workers or component_workers) are not timed
+    Fields:
+        * dictionary - phases. Phase name -> [calls, seconds]
+        * dictionary - counters. coerce_discarded - heaps coerce_red found illegal,
+                                 infeasible - focused heaps where an assume or assert did not hold,
+                                 largest_heap - most heap items (NULL included) of a heap made
+        * dictionary - states. State name -> visits
+        * dictionary - edges. Edge -> [visits, heaps in, heaps out, heaps added to the destination, seconds]
+        * bool - trace. Whether to record 'events'
+        * list of dictionary - events. Chrome trace events: a complete event for every state visit, edge and phase
+        * float - start. Time 0 of the trace, clock() when created
+    """
+    clock = staticmethod(time.perf_counter)
+
+    def __init__(self, trace = False):
+        self.phases = dict((phase, [0, 0.0]) for phase in PROFILER_PHASES)
+        self.counters = {"coerce_discarded": 0, "infeasible": 0, "largest_heap": 0}
+        self.states = {}
+        self.edges = {}
+        self.trace = trace
+        self.events = []
+        self.start = self.clock()
+
+    def transferred(self, times, focused, transformed, coerced, result):
+        """
+        Records a transfer(heap, transformer) of a heap, which ends now
+        @input: 4-tuple of clock() times - start, end of focus, end of apply_transformer, end of coerce_red
+                int focused, transformed, coerced - heaps after focus, apply_transformer and coerce_red
+                list of Heap result
+        """
+        start, focus_end, apply_end, coerce_end = times
+        self.counters["infeasible"] += focused - transformed
+        self.counters["coerce_discarded"] += transformed - coerced
+        self.phase("focus", start, focus_end)
+        self.phase("apply_transformer", focus_end, apply_end, focused)
+        self.phase("coerce_red", apply_end, coerce_end)
+        self.phase("canonical_abstraction", coerce_end, self.clock())
+        for h in result:
+            if len(h.heap_items) > self.counters["largest_heap"]:
+                self.counters["largest_heap"] = len(h.heap_items)
+        return result
+
+    def phase(self, name, start, end, calls = 1):
+        """
+        Records 'calls' calls of phase 'name', from clock() 'start' to 'end'
+        """
+        totals = self.phases[name]
+        totals[0] += calls
+        totals[1] += end - start
+        if self.trace:
+            self._event(name, "phase", start, end)
+
+    def edge(self, edge, start, join_start, heaps_in, heaps_out, heaps_added):
+        """
+        Records a transfer of heaps along 'edge', which started at 'start' and joined the heaps into
+        the destination from 'join_start' (None for assertion checks) until now
+        @input: Edge edge
+                float start, join_start - clock()
+                int heaps_in, heaps_out, heaps_added
+        """
+        end = self.clock()
+        if join_start is not None:
+            self.phase("heaps_join", join_start, end)
+        totals = self.edges.setdefault(edge, [0, 0, 0, 0, 0.0])
+        totals[0] += 1
+        totals[1] += heaps_in
+        totals[2] += heaps_out
+        totals[3] += heaps_added
+        totals[4] += end - start
+        if self.trace:
+            self._event(edge.op.entire_command, "edge", start, end,
+                        {"src": edge.src, "dst": edge.dst, "heaps_in": heaps_in, "heaps_out": heaps_out,
+                         "heaps_added": heaps_added})
+
+    def visit(self, state, start):
+        """
+        Records a visit of 'state', from 'start' until now
+        """
+        self.states[state.name] = self.states.get(state.name, 0) + 1
+        if self.trace:
+            self._event(state.name, "state", start, self.clock())
+
+    def _event(self, name, category, start, end, args = None):
+        event = {"name": name, "cat": category, "ph": "X", "pid": os.getpid(), "tid": 0,
+                 "ts": (start - self.start) * 1e6, "dur": (end - start) * 1e6}
+        if args:
+            event["args"] = args
+        self.events.append(event)
+
+    def summary(self):
+        """
+        @output: dictionary of everything recorded but the trace events, ready for json
+        """
+        return {"phases": dict((name, {"calls": calls, "seconds": seconds})
+                               for name, (calls, seconds) in self.phases.items()),
+                "counters": dict(self.counters),
+                "states": dict(self.states),
+                "edges": [{"src": edge.src, "command": edge.op.entire_command, "dst": edge.dst, "visits": visits,
+                           "heaps_in": heaps_in, "heaps_out": heaps_out, "heaps_added": heaps_added,
+                           "seconds": seconds}
+                          for edge, (visits, heaps_in, heaps_out, heaps_added, seconds) in self.edges.items()]}
+
+    def write_json(self, filename):
+        with open(filename, "w") as out:
+            json.dump(self.summary(), out, indent = 1)
+
+    def write_chrome_trace(self, filename):
+        """
+        Writes the trace events in the Chrome trace format, for chrome://tracing or Perfetto
+        """
+        with open(filename, "w") as out:
+            json.dump({"traceEvents": self.events, "displayTimeUnit": "ms"}, out)
+
+
+class Checkpointer:
+    """
+    Periodic checkpoints of an analysis, given to Cfg.analyze: the worklist, the heaps of every state,
+    how far they went along the out edges, and the counters (see Cfg.checkpoint_data), saved to one file
+    that Cfg.analyze(resume = filename) continues from to the same fixed point.
+    A checkpoint is saved between two iterations, once 'iterations' iterations or 'seconds' seconds went by since
+    the last one (or since the start), and once more at the fixed point: then the file holds the result,
+    which Cfg.from_checkpoint reads back, for example as the previous analysis of an incremental one (see Cfg.reuse).
+    Saving is atomic (see write_checkpoint), so if the process dies while saving, the file still holds the previous
+    checkpoint
+    Fields:
+        * string - filename
+        * int - iterations. Iterations between checkpoints, 0 = not counted
+        * float - seconds. Wall time between checkpoints, 0 = not counted
+        * int - last_iteration. Cfg.stats["iterations"] at the last checkpoint
+        * float - last_time. clock() at the last checkpoint
+        * int - written. Checkpoints saved
+    """
+    clock = staticmethod(time.monotonic)
+
+    def __init__(self, filename, iterations = 0, seconds = CHECKPOINT_SECONDS):
+        self.filename = filename
+        self.iterations = iterations
+        self.seconds = seconds
+        self.written = 0
+        self.start(0)
+
+    def start(self, iteration):
+        """
+        Starts counting towards the next checkpoint from iteration 'iteration', now
+        """
+        self.last_iteration = iteration
+        self.last_time = self.clock()
+
+    def due(self, iteration):
+        """
+        @input: int iteration - iterations so far
+        @output: bool - whether to save a checkpoint
+        """
+        if self.iterations and iteration - self.last_iteration >= self.iterations:
+            return True
+        return bool(self.seconds) and self.clock() - self.last_time >= self.seconds
+
+    def save(self, graph, worklist):
+        """
+        Saves the analysis of 'graph', between two iterations
+        @input: Cfg graph
+                Worklist worklist - of the analysis
+        """
+        write_checkpoint(self.filename, graph.checkpoint_data(worklist))
+        self.written += 1
+        self.start(graph.stats["iterations"])
+
+
 class State:
     """
     Class for a state in the control flow graph (Cfg)
@@ -195,6 +1502,13 @@ class State:
         * list of Edge - out_edges    
         * list of Edge - in_edges
         * Cfg - the containing graph (pointer)
+        * dictionary of fingerprint to list of Heap - _heap_index. Heaps of this state by Heap.fingerprint,
+          built on demand and reset when 'heaps' is assigned
+        * dictionary of Edge to int - _propagated. Number of heaps (a prefix of 'heaps', which only grows)
+          already transformed along each out edge. Reset when 'heaps' is assigned
+        * dictionary of tuple of heap items to list of (Heap, subsumption_key) - _layout_index. Heaps of this state
+          by heap items, built on demand by join_heaps with subsumption and reset when 'heaps' is assigned
+        * int subsumed - number of heaps the last join_heaps dropped from this state
     """
       
     def __init__(self,name, graph):
@@ -211,6 +1525,136 @@ class State:
         self.in_edges = []
         self.heaps = []
         self.graph_ptr = graph
+        self.subsumed = 0
+
+    @property
+    def heaps(self):
+        return self._heaps
+
+    @heaps.setter
+    def heaps(self, heaps):
+        self._heaps = heaps
+        self._heap_index = None
+        self._layout_index = None
+        self._propagated = {}
+
+    def new_heaps(self, edge):
+        """
+        Returns the heaps of this state not yet transformed along 'edge', and marks them as transformed
+        Since transformers, coerce and canonical abstraction work on every heap alone, the heaps already
+        transformed along 'edge' would add nothing to its destination
+        @input: Edge edge - an out edge of this state
+        @output: list of Heap
+        """
+        start = self._propagated.get(edge, 0)
+        self._propagated[edge] = len(self._heaps)
+        return self._heaps[start:]
+
+    def join_heaps(self, heaps, subsume = False):
+        """
+        Adds every heap of 'heaps' that is not equivalent to a heap already in this state (disjunctive completion)
+        With subsume, adds every heap no heap already in this state subsumes (see subsumes), and drops the heaps
+        of this state the heaps added subsume, counted in 'subsumed'
+        @input: list of Heap heaps
+                bool subsume
+        @output: list of Heap - the heaps added. Empty if the state already included all of them
+        """
+        if subsume:
+            return self._subsume_heaps(heaps)
+        if self._heap_index is None:
+            self._heap_index = {}
+            for heap in self._heaps:
+                self._heap_index.setdefault(heap.fingerprint(), []).append(heap)
+        return [h for h in heaps if add_distinct_heap(h, self._heaps, self._heap_index)]
+
+    def _subsume_heaps(self, heaps):
+        """
+        join_heaps with subsumption. Heaps subsume only heaps with the same heap items, so only those are compared
+        The heaps left keep their order, and those already transformed along an out edge stay so (see new_heaps)
+        """
+        if self._layout_index is None:
+            self._layout_index = {}
+            for heap in self._heaps:
+                key = subsumption_key(heap.codes())
+                self._layout_index.setdefault(tuple(heap.heap_items), []).append((heap, key))
+        added = []
+        dropped = set()
+        for heap in heaps:
+            key = subsumption_key(heap.codes())
+            same_layout = self._layout_index.setdefault(tuple(heap.heap_items), [])
+            if any(subsumes(other_key, key) for _, other_key in same_layout):
+                continue
+            kept = [(other, other_key) for other, other_key in same_layout if not subsumes(key, other_key)]
+            if len(kept) < len(same_layout):
+                dropped.update(id(other) for other, other_key in same_layout if subsumes(key, other_key))
+                same_layout[:] = kept
+            same_layout.append((heap, key))
+            added.append(heap)
+        self.subsumed = 0
+        if dropped:
+            old = self._heaps
+            for edge, count in self._propagated.items():
+                self._propagated[edge] = len([h for h in old[:count] if id(h) not in dropped])
+            self._heaps = [h for h in old if id(h) not in dropped]
+            self._heap_index = None
+            self.subsumed = len(old) - len(self._heaps)
+            added = [h for h in added if id(h) not in dropped]
+        self._heaps.extend(added)
+        return added
+
+    def mark_propagated(self, edge):
+        """
+        Marks every heap of this state as transformed along 'edge' (see new_heaps)
+        @input: Edge edge - an out edge of this state
+        """
+        self._propagated[edge] = len(self._heaps)
+
+    def checkpoint(self):
+        """
+        Returns the heaps of this state and how far they went along its out edges, in the form checkpoints store
+        @output: 2-tuple (list of (tuple heap_items, int max_heap_index, bytes codes, bool joined) - the heaps in order,
+                          as Heap.compact without the variables, which are those of the graph, and the fingerprint,
+                          list of int - the number of heaps already transformed along each out edge, in order)
+        """
+        return ([heap.compact()[1:4] + (heap.joined,) for heap in self._heaps],
+                [self._propagated.get(edge, 0) for edge in self.out_edges])
+
+    def restore(self, heap_class, heaps, propagated):
+        """
+        Sets the heaps of this state and how far they went along its out edges, from checkpoint()
+        @input: heap_class - one of HEAP_BACKENDS
+                heaps, propagated - see checkpoint
+        """
+        variables = self.graph_ptr.symbols.names
+        self.heaps = [heap_class.from_compact((variables, items, max_heap_index, codes, None, joined))
+                      for items, max_heap_index, codes, joined in heaps]
+        for edge, count in zip(self.out_edges, propagated):
+            if count:
+                self._propagated[edge] = count
+
+    def bound_heaps(self, added, max_heaps):
+        """
+        Bounded disjunction: partially joins the heaps of this state (see partial_join) so it keeps at most
+        'max_heaps', or one per aliasing of the variables if they alias in more ways, after join_heaps added 'added' to it
+        @input: list of Heap added - the result of join_heaps
+                int max_heaps
+        @output: 2-tuple (list of Heap - the heaps of this state not equivalent to a heap it had before 'added',
+                          int - number of heaps joined into others)
+        """
+        old = self._heaps[:len(self._heaps) - len(added)]
+        bounded, joined = partial_join(self._heaps, max_heaps)
+        index = {}
+        for heap in old:
+            add_distinct_heap(heap, [], index)
+        new = [heap for heap in bounded if add_distinct_heap(heap, [], index)]
+        if new:
+            # Every heap is transformed along the out edges again
+            self.heaps = bounded
+        else:
+            # 'added' joined into heaps this state already had: nothing changed
+            del self._heaps[len(old):]
+            self._heap_index = None
+        return new, joined
             
 class Edge:
     """
@@ -219,19 +1663,69 @@ class Edge:
         * State - src 
         * State - dst 
         * Transformer - op  
+        * bool - checks_assertion. Whether this is the edge of an assert to the fail state
     """
       
     def __init__(self, source, operation, destination):
         """
         Constructor
         Creates a node with all lattices at bottom.
-        @input: 
+        @input: string source, string destination - state names
+                operation - Transformer, or the string of its command
         """
         self.src = source
         self.dst = destination
-        self.op = Transformer(operation)
-        
-        
+        if isinstance(operation, Transformer):
+            self.op = operation
+        else:
+            self.op = Transformer(operation)
+        self.checks_assertion = self.op.operation == TRANSFORMER_ASSERT and destination == FAILSTATE_NAME
+
+
+class SymbolTable:
+    """
+    Dense integer index of the variables of a program, in the order they are declared (NULL_VAR first, at 0).
+    One per list of variables in a process (see of), shared by all heaps of the program and their copies:
+    it is the row order of the variable predicates of ArrayHeap and of Heap.compact
+    Fields:
+        * tuple of string - names. Interned
+        * dictionary of string to int - index
+    """
+    # Tuple of names -> SymbolTable, see of
+    _tables = {}
+
+    def __init__(self, names):
+        self.names = tuple(sys.intern(name) for name in names)
+        self.index = dict((name, i) for i, name in enumerate(self.names))
+
+    @classmethod
+    def of(cls, names):
+        """
+        Returns the symbol table of 'names', the same one for the same names
+        @input: iterable of string names, or a SymbolTable
+        @output: SymbolTable
+        """
+        if isinstance(names, SymbolTable):
+            return names
+        names = tuple(names)
+        table = cls._tables.get(names)
+        if table is None:
+            table = cls._tables[names] = cls(names)
+        return table
+
+    def __getitem__(self, name):
+        return self.index[name]
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
 class Heap:
     """
     Class for a (partially) concrete node on the heap, i.e. , a collection of predicates describing a heap
@@ -245,8 +1739,32 @@ class Heap:
             * unary predicate. dictionary of node to 3-val bool - is_shared
         * int max_heap_index = integer to upper bound on all heap addresses.
                                Used to draw heap addresses with 'new'
-        * heap_items = list of indexes/addresses used in this heap. Does not garbage-collect
+        * heap_items = list of indexes/addresses used in this heap, NULL (0) first. Does not garbage-collect
+        * set of int - _items. The same addresses as heap_items, for membership tests
+        * set of int - _free_set. The addresses below max_heap_index not in heap_items
+        * list of int - _free. A heapq over _free_set, the lowest first for new_node
+        * set of predicate table names - _cow. Tables still shared with a copy of this heap (copy-on-write)
+        * set of predicate table names - _dirty. Tables written to since the coercion constraints last held (see coerce)
+        * bytes _fingerprint = cached result of fingerprint(), None until computed or after a write
+        * bytes _codes = cached result of codes(), None until computed or after a write
+        * _closure = cached result of closure(), None until computed or after 'next' was written to
+        * bool joined = whether partial_join joined this heap, or a heap it was transformed from. Only then may
+                        'next' be 1/2 where focus_next and focus_var need it definite, and they split it into cases
     """
+    # Predicate tables shared copy-on-write between a heap and its copies
+    _tables = ("var_pts_to", "reachable", "next", "is_summary", "in_cycle", "is_shared")
+    _binary_tables = ("var_pts_to", "reachable", "next")
+    # The table closure() is computed from
+    _next_table = "next"
+    # Coercion constraints, in the order coerce evaluates them: (method, predicate tables the constraint reads).
+    # exists v: not is_shared(v) and n(v1,v) and n(v2,v) |> v1 = v2 is left out: check_shared(v) is 1
+    # whenever v has two definite predecessors, so its left hand side is never 1
+    _constraints = (("_coerce_unique_var", frozenset(["var_pts_to"])),
+                    ("_coerce_unique_next", frozenset(["next", "var_pts_to", "reachable", "is_shared", "in_cycle"])),
+                    ("_coerce_reachable", frozenset(["var_pts_to", "next", "reachable"])),
+                    ("_coerce_unshared_next", frozenset(["next", "is_shared"])),
+                    ("_coerce_cycle", frozenset(["next", "is_summary", "in_cycle"])),
+                    ("_coerce_shared", frozenset(["next", "is_shared"])))
       
     def __init__(self, variables):
         """
@@ -265,24 +1783,209 @@ class Heap:
         self.is_shared = {NULL : LOGIC3_1}
         self.max_heap_index = 0
         self.heap_items = [NULL]
+        self._items = set([NULL])
+        self._free = []
+        self._free_set = set()
+        self._cow = set()
+        self._dirty = set(self._tables)
+        self._fingerprint = None
+        self._codes = None
+        self._closure = None
+        self.joined = False
         
         
     def copy_Heap(self, other):
         """
         Copies all properties of 'other' to this. 
+        The predicate tables are not copied but shared, copy-on-write: from now on both heaps
+        clone a table (see _own) the first time they write to it
         @input: Heap other
         @output:
         """
-        self.var_pts_to = deepcopy(other.var_pts_to)
-        self.next = deepcopy(other.next)
-        self.is_summary = deepcopy(other.is_summary)
-        self.reachable = deepcopy(other.reachable)
-        self.in_cycle = deepcopy(other.in_cycle)
-        self.is_shared = deepcopy(other.is_shared)
-        self.max_heap_index = deepcopy(other.max_heap_index)
-        self.heap_items = deepcopy(other.heap_items)
-        
-    
+        for name in self._tables:
+            setattr(self, name, getattr(other, name))
+        self.max_heap_index = other.max_heap_index
+        self.heap_items = list(other.heap_items)
+        self._items = set(other._items)
+        self._free = list(other._free)
+        self._free_set = set(other._free_set)
+        self._cow = set(self._tables)
+        other._cow = set(self._tables)
+        self._dirty = set(other._dirty)
+        self._fingerprint = other._fingerprint
+        self._codes = other._codes
+        self._closure = other._closure
+        self.joined = other.joined
+
+    def _own(self, *names):
+        """
+        Makes the given predicate tables private to this heap, cloning those still shared with another heap.
+        Must be called before writing to a predicate table
+        @input: names of predicate tables (from _tables)
+        @output: edits 'this'
+        """
+        self._dirty.update(names)
+        self._fingerprint = None
+        self._codes = None
+        if self._next_table in names:
+            self._closure = None
+        for name in names:
+            if name in self._cow:
+                self._cow.discard(name)
+                setattr(self, name, self._clone_table(name, getattr(self, name)))
+
+    def _clone_table(self, name, table):
+        """
+        Returns a private copy of a predicate table
+        @input: string name - name of the table
+                table
+        @output: copy of the table
+        """
+        if name in self._binary_tables:
+            return dict((key, dict(row)) for key, row in table.items())
+        return dict(table)
+
+    def fingerprint(self):
+        """
+        Returns a structural fingerprint of this heap. Equivalent heaps (see is_equivalent) have equal fingerprints,
+        so heaps with different fingerprints are surely not equivalent.
+        Computed once, and again only after the heap was written to
+        @input:
+        @output: bytes
+        """
+        if self._fingerprint is None:
+            digest = hashlib.blake2b(repr(self.heap_items).encode(), digest_size=16)
+            digest.update(self.codes())
+            self._fingerprint = digest.digest()
+        return self._fingerprint
+
+    def compact(self):
+        """
+        Returns this heap in a compact picklable form, for sending heaps between processes.
+        Holds the predicates as in fingerprint, so from_compact of any heap backend can read it
+        @input:
+        @output: 6-tuple (tuple of variables, tuple heap_items, int max_heap_index,
+                          bytes - the predicates as _predicate_bytes, bytes - fingerprint, bool - joined)
+        """
+        return (tuple(self.var_pts_to.keys()), tuple(self.heap_items), self.max_heap_index,
+                self.codes(), self.fingerprint(), self.joined)
+
+    @classmethod
+    def from_compact(cls, data):
+        """
+        Builds a heap of this class from the result of compact()
+        @input: 6-tuple data
+        @output: Heap
+        """
+        variables, items, max_heap_index, codes, fingerprint, joined = data
+        heap = cls.__new__(cls)
+        heap.heap_items = list(items)
+        values = [ARRAY3_DECODE[c] for c in codes]
+        n = len(items)
+        rows = iter(values[k:k + n] for k in range(0, len(values), n))
+        heap.var_pts_to = dict((x, dict(zip(items, next(rows)))) for x in variables)
+        heap.reachable = dict((x, dict(zip(items, next(rows)))) for x in variables)
+        heap.next = dict((v, dict(zip(items, next(rows)))) for v in items)
+        heap.is_summary = dict(zip(items, next(rows)))
+        heap.in_cycle = dict(zip(items, next(rows)))
+        heap.is_shared = dict(zip(items, next(rows)))
+        heap.max_heap_index = max_heap_index
+        heap._items = set(items)
+        heap._free = free_addresses(items, max_heap_index)
+        heap._free_set = set(heap._free)
+        heap._cow = set()
+        heap._dirty = set(cls._tables)
+        heap._fingerprint = fingerprint
+        heap._codes = codes
+        heap._closure = None
+        heap.joined = joined
+        return heap
+
+    def nbytes(self):
+        """
+        Returns an estimate of the memory held by this heap, in bytes
+        Tables still shared with copies (copy-on-write) are counted in each of them
+        @input:
+        @output: int
+        """
+        total = sys.getsizeof(self.heap_items)
+        for name in self._tables:
+            table = getattr(self, name)
+            total += sys.getsizeof(table)
+            if name in self._binary_tables:
+                total += sum(sys.getsizeof(row) for row in table.values())
+        return total
+
+    def codes(self):
+        """
+        Returns all predicates of this heap as bytes (see _predicate_bytes).
+        Computed once, and again only after the heap was written to
+        @input:
+        @output: bytes
+        """
+        if self._codes is None:
+            self._codes = self._predicate_bytes()
+        return self._codes
+
+    def _predicate_bytes(self):
+        """
+        Returns all predicates of this heap as bytes of ARRAY3 values, laid out like the arrays of ArrayHeap
+        (var_pts_to and reachable by variable, then next by predecessor, then is_summary, in_cycle, is_shared)
+        so both heap backends give the same fingerprint
+        @input:
+        @output: bytes
+        """
+        items = self.heap_items
+        codes = bytearray()
+        for table in (self.var_pts_to, self.reachable):
+            for x in table.keys():
+                row = table[x]
+                codes.extend(int(row[v] * 2) for v in items)
+        for v1 in items:
+            row = self.next[v1]
+            codes.extend(int(row[v2] * 2) for v2 in items)
+        for table in (self.is_summary, self.in_cycle, self.is_shared):
+            codes.extend(int(table[v] * 2) for v in items)
+        return bytes(codes)
+
+    def copy(self):
+        """
+        Returns a copy of this heap, of the same heap class
+        @input:
+        @output: Heap
+        """
+        heap_copy = type(self).__new__(type(self))
+        heap_copy.copy_Heap(self)
+        return heap_copy
+
+    @classmethod
+    def from_heap(cls, other):
+        """
+        Builds a heap of this class holding the same predicates as 'other', which may use any heap backend
+        @input: Heap other
+        @output: Heap
+        """
+        heap = cls.__new__(cls)
+        heap.heap_items = list(other.heap_items)
+        heap.var_pts_to = dict((x, dict((v, other.var_pts_to[x][v]) for v in heap.heap_items)) for x in other.var_pts_to.keys())
+        heap.reachable = dict((x, dict((v, other.reachable[x][v]) for v in heap.heap_items)) for x in other.var_pts_to.keys())
+        heap.next = dict((v1, dict((v2, other.next[v1][v2]) for v2 in heap.heap_items)) for v1 in heap.heap_items)
+        heap.is_summary = dict((v, other.is_summary[v]) for v in heap.heap_items)
+        heap.in_cycle = dict((v, other.in_cycle[v]) for v in heap.heap_items)
+        heap.is_shared = dict((v, other.is_shared[v]) for v in heap.heap_items)
+        heap.max_heap_index = other.max_heap_index
+        heap._items = set(other._items)
+        heap._free = list(other._free)
+        heap._free_set = set(other._free_set)
+        heap._cow = set()
+        heap._dirty = set(cls._tables)
+        heap._fingerprint = None
+        heap._codes = None
+        heap._closure = None
+        heap.joined = other.joined
+        return heap
+
+
     
     def apply_transformer(self, transformer):
         """
@@ -293,25 +1996,9 @@ class Heap:
         
         Notes: does not update 'this' according to transformer
         """
-        self_copy = Heap(self.var_pts_to.keys())
-        self_copy.copy_Heap(self)
-        if transformer.operation == TRANSFORMER_ASSERT:
-            ans = self_copy.transformer_assert(transformer.expression)
-            # Returns None if condition did not hold
-        elif transformer.operation == TRANSFORMER_ASSIGN_NEXT:
-            ans = self_copy.transformer_assign_next(transformer.arg1, transformer.arg2)
-        elif transformer.operation == TRANSFORMER_ASSIGN_VAR:
-            ans = self_copy.transformer_assign_var(transformer.arg1, transformer.arg2)
-        elif transformer.operation == TRANSFORMER_ASSUME:
-            ans = self_copy.transformer_assume(transformer.expression)
-            # Returns None if condition did not hold
-        elif transformer.operation == TRANSFORMER_NEW:
-            ans = self_copy.transformer_new(transformer.arg1)
-        elif transformer.operation == TRANSFORMER_NEXT_ASSIGN:
-            ans = self_copy.transformer_next_assign(transformer.arg1, transformer.arg2)
-        else:
-            raise Exception()
-        return ans
+        # transformer_$operation$ with the arguments of the transformer, compiled in Transformer.compile
+        # Assume and assert return None if condition did not hold
+        return transformer.apply(self.copy())
         
     def transformer_assign_var(self, var_assignee, var_assigned):
         """
@@ -358,6 +2045,9 @@ class Heap:
         # Zeroize where var_assignee_pred.next points to
         at_x = self.get(x)
         at_t = self.get(t)
+        # The closure of 'next' before the assignment, updated below instead of computed again
+        closure = self.closure()
+        self._own("next", "reachable", "is_shared", "in_cycle")
         # Disconnect current '.n' fields from *x
         for addr in self.next[at_x].keys():
             self.next[at_x][addr] = LOGIC3_0
@@ -374,13 +2064,29 @@ class Heap:
                 self.is_shared[at_t] = LOGIC3_HALF
         
         
-        # Update reachability: remap reachability for every variable to every item
+        # Update reachability: only paths through *x changed, so only variables and items reaching *x are remapped
+        position, definite, maybe = closure
+        bit = 1 << position[at_x]
+        affected = set(v for v in self.heap_items if maybe[position[v]] & bit or v == at_x)
+        self._closure = self._next_assign_closure(closure, at_x, at_t)
+        position, definite, maybe = self._closure
         for y in self.var_pts_to.keys():
-            for u in self.heap_items:
-                self.reachable[y][u] = self.check_reachable(self.get(y), u)
+            y_node = self.get(y)
+            if y_node in affected:
+                reach_definite = definite[position[y_node]]
+                reach_maybe = maybe[position[y_node]]
+                row = self.reachable[y]
+                for j, u in enumerate(self.heap_items):
+                    if u == y_node or reach_definite >> j & 1:
+                        row[u] = LOGIC3_1
+                    elif reach_maybe >> j & 1:
+                        row[u] = LOGIC3_HALF
+                    else:
+                        row[u] = LOGIC3_0
         # Check if cycle is formed, update accordingly.
         for v in self.heap_items:
-            self.in_cycle[v] = self.check_cycle(v)
+            if v in affected:
+                self.in_cycle[v] = self.check_cycle(v)
         return self
         
     def transformer_new (self,var_assignee):
@@ -426,7 +2132,7 @@ class Heap:
         @output: node = node this variable points to
         """
         # Get all heap addresses who have a 1 boolean value
-        if var == "NULL":
+        if var == NULL_VAR:
             return NULL
         this_var_pts_to_list = [addr for addr in self.var_pts_to[var] if self.var_pts_to[var][addr] == LOGIC3_1]
         if len(this_var_pts_to_list) != 1:
@@ -484,6 +2190,7 @@ class Heap:
     """  
         if v1 == NULL or v2 == NULL:
             return NULL
+        self._own("reachable", "next", "is_shared", "is_summary", "in_cycle")
         # Merging two nodes on the heap:
         #   Merge v2 into v1 using join
         #   Copy abstraction predicates from either (they are identical) - is(v), x(v), 
@@ -510,7 +2217,65 @@ class Heap:
         self.in_cycle[v1] = LOGIC3_HALF
         self.remove_node(v2)
         return v1
-    
+
+    def summarize(self):
+        """
+        Merges heap items with the same abstraction properties (see is_mergable) into summary nodes.
+        Goes over heap_items like canonical_abstraction always did: merges an item with the first other item
+        mergable with it, the higher ID into the lower one (see merge), and looks again at the same position,
+        until no item is left mergable. A merge changes the abstraction properties of the summary, so which items
+        end up merged depends on this order.
+        The items are bucketed once by their abstraction properties (_abstraction_keys), in heap_items order,
+        so the first item mergable with another is the first of its bucket. A merge only changes the properties
+        of the summary, which alone moves to another bucket
+        @input:
+        @output: edits 'this'
+        """
+        keys = self._abstraction_keys()
+        position = dict((v, i) for i, v in enumerate(self.heap_items))
+        buckets = {}
+        for v in self.heap_items:
+            # NULL has no key, it cannot be summarized with anything
+            if v in keys:
+                buckets.setdefault(keys[v], []).append((position[v], v))
+        i = 0
+        while len(self.heap_items) > i:
+            v1 = self.heap_items[i]
+            bucket = buckets.get(keys.get(v1), [])
+            mergable = [v2 for _, v2 in bucket[:2] if v2 != v1]
+            if mergable:
+                v2 = mergable[0]
+                bucket.remove((position[v1], v1))
+                bucket.remove((position[v2], v2))
+                # For consistency, always merge upper id into lower id
+                summary = self.merge(min(v1, v2), max(v1, v2))
+                del keys[max(v1, v2)]
+                keys[summary] = self._abstraction_key(summary)
+                bisect.insort(buckets.setdefault(keys[summary], []), (position[summary], summary))
+            else:
+                i += 1
+
+    def _abstraction_keys(self):
+        """
+        Returns the abstraction properties of every heap item but NULL (see _abstraction_key)
+        @input:
+        @output: dictionary node -> bytes
+        """
+        items = [v for v in self.heap_items if v != NULL]
+        tables = [self.var_pts_to[x] for x in self.var_pts_to] + [self.reachable[x] for x in self.var_pts_to]
+        columns = [[int(table[v] * 2) for v in items] for table in tables + [self.is_shared, self.in_cycle]]
+        return dict(zip(items, map(bytes, zip(*columns))))
+
+    def _abstraction_key(self, v):
+        """
+        Returns the abstraction properties of heap item 'v': x(v), reachable(x,v), is_shared(v), in_cycle(v)
+        @input: node v
+        @output: bytes
+        """
+        values = [self.var_pts_to[x][v] for x in self.var_pts_to] + [self.reachable[x][v] for x in self.var_pts_to]
+        values += [self.is_shared[v], self.in_cycle[v]]
+        return bytes(int(val * 2) for val in values)
+
     def new_node(self):
         """
         Creates a new item in this heap and returns it
@@ -518,15 +2283,8 @@ class Heap:
         @output:  the new node
                   updates 'this' accordingly
         """
-        # Find first available "memory address" (id)
-        new_node = 0
-        for i in range(1,self.max_heap_index):
-            if i not in self.heap_items:
-                new_node = i
-                break
-        if new_node == 0:
-            new_node = self.max_heap_index + 1
-            self.max_heap_index += 1
+        new_node = self._new_address()
+        self._own(*self._tables)
         # Add to all variables that they don't point to the new one
         for x in self.var_pts_to.keys():
             self.var_pts_to[x][new_node] = LOGIC3_0
@@ -547,9 +2305,34 @@ class Heap:
         self.is_shared[new_node] = LOGIC3_0
         self.in_cycle[new_node] = LOGIC3_0
         # Add to heap items
-        self.heap_items += [new_node]
+        self.heap_items.append(new_node)
+        self._items.add(new_node)
         return new_node
 
+    def _new_address(self):
+        """
+        Returns the first available "memory address" (id) for a new node: the lowest free one below max_heap_index,
+        or else max_heap_index + 1
+        @input:
+        @output: int
+        """
+        if self._free and self._free[0] < self.max_heap_index:
+            v = heapq.heappop(self._free)
+            self._free_set.remove(v)
+            return v
+        self.max_heap_index += 1
+        return self.max_heap_index
+
+    def _release_address(self, v):
+        """
+        Makes the address of a node removed from heap_items available to _new_address
+        @input: int v
+        @output: edits 'this'
+        """
+        if v not in self._free_set:
+            self._free_set.add(v)
+            heapq.heappush(self._free, v)
+
     def remove_node(self, v):
         """
         Removes node 'v' from the heap along with all its predicates. Used after a 'merge' command
@@ -557,7 +2340,10 @@ class Heap:
         @output: edits 'this'
         """
         # Remove from heap list
-        self.heap_items = [item for item in self.heap_items if item != v]        
+        self._items.remove(v)
+        self.heap_items.remove(v)
+        self._release_address(v)
+        self._own(*self._tables)
         # Remove from predicates: var_pts_to, next, reachable, cycle, is_summary, is_shared
         for x in self.var_pts_to.keys():
             self.var_pts_to[x].pop(v)
@@ -584,20 +2370,14 @@ class Heap:
         current_dst = [addr for addr in self.heap_items if self.var_pts_to[var][addr] == LOGIC3_1]
         if len(current_dst) != 1:
             raise ErrorIllegalHeap
+        self._own("var_pts_to", "reachable")
         self.var_pts_to[var][current_dst[0]] = LOGIC3_0
-        # Clear variable reachable
-        for v in self.heap_items:
-            self.reachable[var][v] = LOGIC3_0
         # Set var to point to the new address
         self.var_pts_to[var][new_address] = LOGIC3_1
-        self.reachable[var][new_address] = LOGIC3_1
-        # Set reachability from 'var' to every item on the heap
-        definite_reachable = self.get_all_reachable(new_address)
-        maybe_reachable = self.get_all_maybe_reachable(new_address)
-        for v in maybe_reachable:
-            self.reachable[var][v] = LOGIC3_HALF
-        for v in definite_reachable:
-            self.reachable[var][v] = LOGIC3_1
+        # Set reachability from 'var' to every item on the heap: 1 along definite paths, 1/2 along maybe paths
+        row = self.reachable[var]
+        for v in self.heap_items:
+            row[v] = self.check_reachable(new_address, v)
         
     def focus(self,transformer):
         """
@@ -605,7 +2385,7 @@ class Heap:
         Formula is a result of the transformer and its arguments (Compiler Design handbook,12-26):
         x:=NULL      emptyset 
         x:=t         {t(v)} 
-        x:=t.n       {\exists v_1 : t(v_1)and n(v_1,v)} i.e. t points to a specific heap item and its next is definite
+        x:=t.n       {\\exists v_1 : t(v_1)and n(v_1,v)} i.e. t points to a specific heap item and its next is definite
         x.n:=t       {x(v), t(v)}
         x:=new       emptyset
         x==NULL      {x(v)}
@@ -620,159 +2400,99 @@ class Heap:
         @input: Transformer - the transformer to focus for
         @output: A list of Heap with 3-value logic predicates
         """
+        heaps = [self]
+        # Steps compiled in Transformer.compile, each focusing every heap focused so far
+        for step, var in transformer.focus_plan:
+            heaps = step(heaps, var)
+        return heaps
+
+    def focus_next(self, t):
+        """
+        Focuses t.n, {\\exists v_1 : t(v_1)and n(v_1,v)}, after t(v) was focused:
+        splits and flattens every summary node t may point to with next
+        @input: string t - variable
+        @output: list of Heap - the focused heaps. Empty if t.n has no summary node, so is already focused
+        """
         focused_heaps = []
-        if transformer.operation == TRANSFORMER_NEW:
-            return [self]
-        
-        elif transformer.operation == TRANSFORMER_ASSIGN_VAR:
-            ########################
-            # x:=t   phi = {t(v)}  #
-            ########################
-            return self.focus_var(transformer.arg2)
-        
-        elif transformer.operation == TRANSFORMER_ASSIGN_NEXT:
-            ###################################################
-            # x:=t.n:phi = {\exists v_1 : t(v_1)and n(v_1,v)} #
-            ###################################################
-            
-            # Focus so phi is 0 or 1 with every combination
-            # t(v_1) --> if t points to a summary node, split it
-            t = transformer.arg2
-            focused_heaps1 = self.focus_var(t)
-            # Check if t.n has more than one value. if it does, focus it
-            focused_heaps2 = []
-            for h1 in focused_heaps1:
-                at_t =  h1.get(t)
-                t_nexts = [v for v in h1.heap_items if h1.next[at_t][v] != LOGIC3_0]
-                if len(t_nexts) > 0:
-                    # Then must duplicate and focus each in a different case
-                    # But a summary node is always pointed with 1/2. So need to split again
-                    for v_1 in t_nexts:
-                        if h1.is_summary[v_1] == LOGIC3_1:
-                            # Split:
-                            # Create new item
-                            # Connect all predecessors of v_1 to new item
-                            # Connect new item to v_1
-                            # set t to point to new item
-                            heap_split = Heap(h1.var_pts_to.keys())
-                            heap_split.copy_Heap(h1)
-                            new_item = heap_split.new_node()
-                            heap_split.next[new_item][NULL] = LOGIC3_0
-                            for v in heap_split.heap_items:
-                                if heap_split.next[v][v_1] != LOGIC3_0:
-                                    heap_split.next[v][new_item] = LOGIC3_1
-                                heap_split.next[v][v_1] = LOGIC3_0
-                            # summary node doesn't point back to what we just split
-                            heap_split.next[v_1][new_item] = LOGIC3_0 
-                            # new item must point with 1/2 to old item since it is a summary
-                            heap_split.next[new_item][v_1] = LOGIC3_HALF
-                            # Update reachable for the new item
-                            # The reachability of the new item is its predecessors and3 the connecting edge
-                            reaching_vars = [x for x in heap_split.var_pts_to.keys() if heap_split.reachable[x][v_1] != LOGIC3_0]
-                            predecessors = [v for v in heap_split.heap_items if heap_split.next[v][new_item] != LOGIC3_0]
-                            if len(predecessors) > 1:
-                                definite_predecessors = [v for v in heap_split.heap_items if heap_split.next[v][new_item] == LOGIC3_1]
-                                if len(definite_predecessors) > 1:
-                                    heap_split.is_shared[new_item] = LOGIC3_1
-                                else:
-                                    heap_split.is_shared[new_item] = LOGIC3_HALF
-                            for x in reaching_vars:
-                                for v in predecessors:
-                                    heap_split.reachable[x][new_item] = or3(heap_split.reachable[x][new_item],
-                                                                      and3 (heap_split.reachable[x][v], heap_split.next[v][new_item]))
-                                    # Since v_1 is a summary still, only half reachable from all the variables and only if new item is reachable
-                                    heap_split.reachable[x][v_1] = and3(heap_split.reachable[x][new_item], LOGIC3_HALF)
-                            # Flatten:
-                            # Turn summary node to non-summary
-                            # Cancel self-edge
-                            # turn all incoming 'next' ptrs to definite
-                            # focus over outgoing 'next' edges - not necessary, assuming singly linked lists only in the program (raise error otherwise)
-                            heap_flat = Heap(h1.var_pts_to.keys())
-                            heap_flat.copy_Heap(h1)
-                            heap_flat.is_summary[v_1] = LOGIC3_0
-                            heap_flat.in_cycle[v_1] = LOGIC3_HALF
-                            heap_flat.next[v_1][v_1]  = LOGIC3_0
-                            for v in heap_flat.heap_items:
-                                if heap_flat.next[v][v_1] != LOGIC3_0:
-                                    heap_flat.next[v][v_1] = LOGIC3_1
-                            heaps_flat = []
-                            v_1_nexts = [v for v in heap_flat.heap_items if heap_flat.next[v_1][v] != LOGIC3_0]
-                            for dst in v_1_nexts:
-                                new_heap = Heap(heap_flat.var_pts_to.keys())
-                                new_heap.copy_Heap(heap_flat)
-                                for disconnect in v_1_nexts:
-                                    new_heap.next[v_1][disconnect] = LOGIC3_0
-                                new_heap.next[v_1][dst] = LOGIC3_1
-                                heaps_flat.append(new_heap)
-                            focused_heaps2 +=  [heap_split]
-                            focused_heaps2 += heaps_flat
-            # If no edges were focused, return focused_heaps1
-            if not focused_heaps2:
-                return focused_heaps1
-            else:
-                return focused_heaps2
-                        
+        at_t = self.get(t)
+        t_nexts = [v for v in self.heap_items if self.next[at_t][v] != LOGIC3_0]
+        if len(t_nexts) > 0:
+            # Then must duplicate and focus each in a different case
+            # But a summary node is always pointed with 1/2. So need to split again
+            for v_1 in t_nexts:
+                heap = self
+                if self.joined and (len(t_nexts) > 1 or
+                                    (self.next[at_t][v_1] == LOGIC3_HALF and self.is_summary[v_1] == LOGIC3_0)):
+                    # *t has more than one next, or a 1/2 next that is not a summary (left by partial_join):
+                    # a case for each item *t may point to
+                    heap = self.copy()
+                    heap._own("next")
+                    for dst in t_nexts:
+                        heap.next[at_t][dst] = LOGIC3_0
+                    if self.is_summary[v_1] == LOGIC3_0:
+                        heap.next[at_t][v_1] = LOGIC3_1
+                        focused_heaps.append(heap)
+                        continue
+                    heap.next[at_t][v_1] = LOGIC3_HALF
+                if heap.is_summary[v_1] == LOGIC3_1:
+                    # Split:
+                    # Create new item
+                    # Connect all predecessors of v_1 to new item
+                    # Connect new item to v_1
+                    # set t to point to new item
+                    heap_split = heap.copy()
+                    new_item = heap_split.new_node()
+                    heap_split.next[new_item][NULL] = LOGIC3_0
+                    for v in heap_split.heap_items:
+                        if heap_split.next[v][v_1] != LOGIC3_0:
+                            heap_split.next[v][new_item] = LOGIC3_1
+                        heap_split.next[v][v_1] = LOGIC3_0
+                    # summary node doesn't point back to what we just split
+                    heap_split.next[v_1][new_item] = LOGIC3_0 
+                    # new item must point with 1/2 to old item since it is a summary
+                    heap_split.next[new_item][v_1] = LOGIC3_HALF
+                    # Update reachable for the new item
+                    # The reachability of the new item is its predecessors and3 the connecting edge
+                    reaching_vars = [x for x in heap_split.var_pts_to.keys() if heap_split.reachable[x][v_1] != LOGIC3_0]
+                    predecessors = [v for v in heap_split.heap_items if heap_split.next[v][new_item] != LOGIC3_0]
+                    if len(predecessors) > 1:
+                        definite_predecessors = [v for v in heap_split.heap_items if heap_split.next[v][new_item] == LOGIC3_1]
+                        if len(definite_predecessors) > 1:
+                            heap_split.is_shared[new_item] = LOGIC3_1
+                        else:
+                            heap_split.is_shared[new_item] = LOGIC3_HALF
+                    for x in reaching_vars:
+                        for v in predecessors:
+                            heap_split.reachable[x][new_item] = or3(heap_split.reachable[x][new_item],
+                                                              and3 (heap_split.reachable[x][v], heap_split.next[v][new_item]))
+                            # Since v_1 is a summary still, only half reachable from all the variables and only if new item is reachable
+                            heap_split.reachable[x][v_1] = and3(heap_split.reachable[x][new_item], LOGIC3_HALF)
+                    # Flatten:
+                    # Turn summary node to non-summary
+                    # Cancel self-edge
+                    # turn all incoming 'next' ptrs to definite
+                    # focus over outgoing 'next' edges - not necessary, assuming singly linked lists only in the program (raise error otherwise)
+                    heap_flat = heap.copy()
+                    heap_flat._own("is_summary", "in_cycle", "next")
+                    heap_flat.is_summary[v_1] = LOGIC3_0
+                    heap_flat.in_cycle[v_1] = LOGIC3_HALF
+                    heap_flat.next[v_1][v_1]  = LOGIC3_0
+                    for v in heap_flat.heap_items:
+                        if heap_flat.next[v][v_1] != LOGIC3_0:
+                            heap_flat.next[v][v_1] = LOGIC3_1
+                    heaps_flat = []
+                    v_1_nexts = [v for v in heap_flat.heap_items if heap_flat.next[v_1][v] != LOGIC3_0]
+                    for dst in v_1_nexts:
+                        new_heap = heap_flat.copy()
+                        new_heap._own("next")
+                        for disconnect in v_1_nexts:
+                            new_heap.next[v_1][disconnect] = LOGIC3_0
+                        new_heap.next[v_1][dst] = LOGIC3_1
+                        heaps_flat.append(new_heap)
+                    focused_heaps +=  [heap_split]
+                    focused_heaps += heaps_flat
+        return focused_heaps
 
-        elif transformer.operation == TRANSFORMER_NEXT_ASSIGN:
-            ################################
-            # x.n:=t   phi = {x(v), t(v)}  #
-            ################################
-            focused_heaps = []
-            focused_heaps += self.focus_var(transformer.arg1)
-            focused_heaps2 = []
-            for h in focused_heaps:
-                focused_heaps2 += h.focus_var(transformer.arg2)
-            # If did not focus anything, return self. In this case, it means heap is already focused.
-            return focused_heaps2
-            
-        elif transformer.operation == TRANSFORMER_ASSERT or transformer.operation == TRANSFORMER_ASSUME:
-            accumulated_focused_heaps = [self]
-            for atomic_expr in transformer.expression.atomics:
-                if atomic_expr.type == EXPR_VAREQNULL or atomic_expr.type == EXPR_VARNEQNULL:
-                    ######################################
-                    # x==NULL or x!=NULL   phi = {x(v)}  #
-                    ######################################
-                    current_focus_heaps = []
-                    for heap in accumulated_focused_heaps:
-                        current_focus_heaps += heap.focus_var(atomic_expr.arg1)
-                    # Focused, remove self and add focused ones
-                    accumulated_focused_heaps = current_focus_heaps
-                    
-                elif atomic_expr.type == EXPR_VAREQVAR or atomic_expr.type == EXPR_VARNEQVAR or \
-                atomic_expr.type == EXPR_LS or atomic_expr.type == EXPR_ODD or atomic_expr.type == EXPR_EVEN:
-                    ######################################
-                    # x==t or x!= t  phi = {x(v), t(v)}  #
-                    ######################################
-                    current_focus_heaps1 = []
-                    for heap in accumulated_focused_heaps:
-                        current_focus_heaps1 += heap.focus_var(atomic_expr.arg1)
-                        current_focus_heaps2 = []
-                    for h in current_focus_heaps1:
-                        current_focus_heaps2 += h.focus_var(atomic_expr.arg2)
-                    accumulated_focused_heaps = current_focus_heaps2
-                        
-                elif atomic_expr.type == EXPR_LEN:
-                    #######################################################
-                    # LEN x,y == LEN w,z  phi = {x(v), y(v), w(v), z(v)}  #
-                    #######################################################
-                    current_focus_heaps1 = []
-                    for heap in accumulated_focused_heaps:
-                        current_focus_heaps1 += heap.focus_var(atomic_expr.arg1)
-                    current_focus_heaps2 = []
-                    for h1 in current_focus_heaps1:
-                        current_focus_heaps2 += h1.focus_var(atomic_expr.arg2)
-                    current_focus_heaps3 = []
-                    for h2 in current_focus_heaps2:
-                        current_focus_heaps3 += h2.focus_var(atomic_expr.arg3)
-                    current_focus_heaps4 = []
-                    for h3 in current_focus_heaps3:
-                        current_focus_heaps4 += h3.focus_var(atomic_expr.arg4)
-                    accumulated_focused_heaps = current_focus_heaps4
-            return accumulated_focused_heaps
-        else:
-            raise ErrorParsing()
-        
-        
     def focus_var(self,var):
         """
         Focuses a variable predicate x(v)
@@ -789,8 +2509,7 @@ class Heap:
             # Connect all predecessors of v_1 to new item
             # Connect new item to v_1
             # set t to point to new item
-            heap_split = Heap(self.var_pts_to.keys())
-            heap_split.copy_Heap(self)
+            heap_split = self.copy()
             new_item = heap_split.new_node()
             heap_split.next[new_item][NULL] = LOGIC3_0
             for v in heap_split.heap_items:
@@ -814,8 +2533,8 @@ class Heap:
             # Cancel self-edge
             # turn all incoming 'next' ptrs to definite
             # focus over outgoing 'next' edges - not necessary, assuming singly linked lists only in the program (raise error otherwise)
-            heap_flat = Heap(self.var_pts_to.keys())
-            heap_flat.copy_Heap(self)
+            heap_flat = self.copy()
+            heap_flat._own("is_summary", "next")
             heap_flat.is_summary[v_1] = LOGIC3_0
             heap_flat.next[v_1][v_1]  = LOGIC3_0
             for v in heap_flat.heap_items:
@@ -823,15 +2542,179 @@ class Heap:
                     heap_flat.next[v][v_1] = LOGIC3_1
             v_1_nexts = [v for v in heap_flat.heap_items if heap_flat.next[v_1][v] != LOGIC3_0]
             if len(v_1_nexts) > 1:
-                raise ErrorIllegalHeap()
+                if not self.joined:
+                    raise ErrorIllegalHeap()
+                # The flattened node may point to more than one item (left by partial_join): a case for each
+                heaps_flat = []
+                for dst in v_1_nexts:
+                    new_heap = heap_flat.copy()
+                    new_heap._own("next")
+                    for disconnect in v_1_nexts:
+                        new_heap.next[v_1][disconnect] = LOGIC3_0
+                    new_heap.next[v_1][dst] = LOGIC3_1
+                    heaps_flat.append(new_heap)
+                return [heap_split] + heaps_flat
+            else:
+                for v in v_1_nexts:
+                    heap_flat.next[v_1][v] = LOGIC3_1 
+            return [heap_split, heap_flat]
+        else:
+            return [self]
+        
+        
+    def coerce(self):
+        """
+        Uses the coercion constraints to refine 'this', until all of them hold.
+        A constraint is evaluated only if a predicate table it reads (see _constraints) was written to
+        since it last held, in _constraints order, and again every time a constraint writes to one of these tables
+        @input:
+        @output: bool - False if a constraint does not hold and the heap must be discarded
+        Notes: edits 'this'
+        """
+        pending = set(name for name, reads in self._constraints if not self._dirty.isdisjoint(reads))
+        self._dirty = set()
+        while pending:
+            name = next(name for name, _ in self._constraints if name in pending)
+            pending.discard(name)
+            if not getattr(self, name)():
+                return False
+            if self._dirty:
+                # Every constraint leaves the tables it wrote consistent with itself
+                pending.update(other for other, reads in self._constraints
+                               if other != name and not self._dirty.isdisjoint(reads))
+                self._dirty = set()
+        return True
+
+    def _coerce_unique_var(self):
+        """
+        forall x in vars, x(v1) and x(v2) |> v1 = v2
+        @input:
+        @output: bool - False if the constraint does not hold
+        """
+        # v1 = v2 is never half. only discarding is possible with this coercion
+        for x in self.var_pts_to.keys():
+            row = self.var_pts_to[x]
+            if len([addr for addr in self.heap_items if row[addr] != LOGIC3_0]) > 1:
+                return False
+        return True
+
+    def _coerce_unique_next(self):
+        """
+        exists v3: n(v3, v1) and n(v3,v2) |> v1 = v2
+        Merges the definite nexts of an item, if they are mergable
+        @input:
+        @output: bool - False if the constraint does not hold
+        """
+        for v3 in self.heap_items:
+            item_definite_nexts = [addr for addr in self.heap_items if self.next[v3][addr] == LOGIC3_1 ]
+            j = 0
+            while len(item_definite_nexts) > 1:
+                v1 = item_definite_nexts[j]
+                v2 =  item_definite_nexts[j+1]
+                if self.is_mergable(v1, v2) == LOGIC3_0:
+                    return False
+                elif v1 != v2:
+                    item_definite_nexts.remove(v1)
+                    item_definite_nexts.remove(v2)
+                    merged = self.merge(min(v1,v2), max(v1, v2))
+                    item_definite_nexts.append(merged)
+        return True
+
+    def _coerce_reachable(self):
+        """
+        x(v) or (exists v1 : x(v1) and n*(v1,v)) |> reachable(x,v)
+        @input:
+        @output: bool - False if the constraint does not hold
+        """
+        for x in self.var_pts_to.keys():
+            # Only items x may point to take part in phi
+            x_targets = [v1 for v1 in self.heap_items if self.var_pts_to[x][v1] != LOGIC3_0]
+            for v in self.heap_items:
+                # phi = (exists v1 : x(v1) and n*(v1,v))
+                phi = LOGIC3_0
+                for v1 in x_targets:
+                    phi = or3(phi, and3(self.var_pts_to[x][v1], self.check_reachable(v1,v)))
+                LHS = or3(self.var_pts_to[x][v], phi)
+                # if reachable(x,v) is indefinite, set it the evaluated LHS
+                if self.reachable[x][v] == LOGIC3_HALF:
+                    if LHS != LOGIC3_HALF:
+                        self._own("reachable")
+                        self.reachable[x][v] = LHS
+                # If LHS is definite and reachable != 1/2 and != LHS
+                elif LHS != LOGIC3_HALF and self.reachable[x][v] != LHS:
+                    return False
+        return True
+
+    def _coerce_unshared_next(self):
+        """
+        (exists v1: not is_shared(v) and v1!=v2 and n(v1,v)) |> not n(v2,v)
+        if v is not shared and is v1's next, it isn't anyone else's next
+        @input:
+        @output: bool - False if the constraint does not hold
+        """
+        for v in self.heap_items:
+            if v == NULL or self.is_shared[v] != LOGIC3_0:
+                continue
+            definite_predecessors = [u for u in self.heap_items if self.next[u][v] == LOGIC3_1]
+            # Each definite predecessor is the v1 of the others
+            if len(definite_predecessors) > 1:
+                return False
+            if definite_predecessors:
+                for v2 in self.heap_items:
+                    if self.next[v2][v] == LOGIC3_HALF:
+                        self._own("next")
+                        self.next[v2][v] = LOGIC3_0
+        return True
+
+    def _coerce_cycle(self):
+        """
+        n*(v1,v1) |> c(v1)
+        @input:
+        @output: bool - False if the constraint does not hold
+        """
+        for v in self.heap_items:
+            if v == NULL:
+                continue
+            c = self.check_cycle(v)
+            if c != LOGIC3_HALF:
+                if c != self.in_cycle[v] and self.in_cycle[v] != LOGIC3_HALF:
+                    return False
+                elif c != self.in_cycle[v]:
+                    # Didn't discard because they're not contradicting - so put calculated 'c' in
+                    self._own("in_cycle")
+                    self.in_cycle[v] = c
+        return True
+
+    def _coerce_shared(self):
+        """
+        exists v1,v2 : v1 != v2 and n(v1,v) and n(v2,v) |> is_shared(v)
+        @input:
+        @output: bool - False if the constraint does not hold
+        """
+        items_except_null = [u for u in self.heap_items if u != NULL]
+        for v in items_except_null:
+            predecessors = [u for u in items_except_null if self.next[u][v] != LOGIC3_0]
+            # more than one predecessor
+            if len(predecessors) > 1:
+                definite_predecessors = [u for u in predecessors if self.next[u][v] == LOGIC3_1]
+                if len(definite_predecessors) > 1:
+                    # two definite predecessors. If is_shared == 0 - discard. else, update is_shared to 1
+                    if self.is_shared[v] == LOGIC3_0:
+                        return False
+                    shared = LOGIC3_1
+                else:
+                    # More than one predecessor, only 1 or less definite - maybe shared
+                    shared = LOGIC3_HALF
+            # Only one or less predecessor:
+            elif self.is_shared[v] == LOGIC3_1:
+                return False
             else:
-                for v in v_1_nexts:
-                    heap_flat.next[v_1][v] = LOGIC3_1 
-            return [heap_split, heap_flat]
-        else:
-            return [self]
-        
-        
+                shared = LOGIC3_0
+            if self.is_shared[v] != shared:
+                self._own("is_shared")
+                self.is_shared[v] = shared
+        return True
+
     def is_equivalent(self,other):
         """
         Checks if 'other' is logically equivalent in its heap structure and pointers to 'this'.
@@ -865,39 +2748,108 @@ class Heap:
                     return equivalent
         return equivalent
         
+    def closure(self):
+        """
+        Returns the transitive closure of 'next': for every pair of items, whether a path of one step or more,
+        definite (only 1 edges) or maybe (any non-0 edges), leads from the first to the second.
+        Computed once with a bitset Floyd-Warshall, and again only after 'next' was written to
+        @input:
+        @output: 3-tuple (dictionary node -> position in heap_items,
+                          list of definite bitsets, list of maybe bitsets),
+                 bit j of the bitsets at position i is set when heap_items[j] is reachable from heap_items[i]
+        """
+        if self._closure is None:
+            items = self.heap_items
+            position = dict((v, i) for i, v in enumerate(items))
+            definite = []
+            maybe = []
+            for v1 in items:
+                row = self.next[v1]
+                definite.append(sum(1 << j for j, v2 in enumerate(items) if row[v2] == LOGIC3_1))
+                maybe.append(sum(1 << j for j, v2 in enumerate(items) if row[v2] != LOGIC3_0))
+            for k in range(len(items)):
+                bit = 1 << k
+                for i in range(len(items)):
+                    if definite[i] & bit:
+                        definite[i] |= definite[k]
+                    if maybe[i] & bit:
+                        maybe[i] |= maybe[k]
+            self._closure = (position, definite, maybe)
+        return self._closure
+
+    def _next_assign_closure(self, closure, x, t):
+        """
+        Returns the closure of 'next' after x.n:=t (see closure), from the closure before it.
+        Deleting the edges out of x only changes the rows of the items reaching x: they are built again from
+        their own 'next', the rows of the items not reaching x (kept as they are), and a Floyd-Warshall over
+        the items reaching x only. Inserting the edge x -> t then adds t and what t reaches to every item reaching x
+        @input: 3-tuple closure - the closure of 'next' before the assignment, not edited
+                node x, t
+        @output: 3-tuple, like closure
+        """
+        position, definite, maybe = closure
+        items = self.heap_items
+        at_x = position[x]
+        bit_x = 1 << at_x
+        affected = [i for i in range(len(items)) if maybe[i] & bit_x or i == at_x]
+        rows = []
+        for old, definite_only in ((definite, True), (maybe, False)):
+            new = list(old)
+            # Delete the edges out of x
+            for i in affected:
+                reach = 0
+                if i != at_x:
+                    row = self.next[items[i]]
+                    for j, v in enumerate(items):
+                        if row[v] == LOGIC3_1 or (row[v] == LOGIC3_HALF and not definite_only):
+                            reach |= 1 << j
+                            if not old[j] & bit_x and j != at_x:
+                                reach |= old[j]
+                new[i] = reach
+            for k in affected:
+                bit = 1 << k
+                for i in affected:
+                    if new[i] & bit:
+                        new[i] |= new[k]
+            # Insert the edge x -> t
+            at_t = position[t]
+            reach_t = new[at_t] | 1 << at_t
+            for i in affected:
+                if new[i] & bit_x or i == at_x:
+                    new[i] |= reach_t
+            rows.append(new)
+        return (position, rows[0], rows[1])
+
     def get_all_reachable(self,v):
-        reachables = []
-        nextq = deque([v])
-        visited = set([v])
-        while len(nextq) > 0:
-            current = nextq.popleft()
-            visited.add(current)
-            current_nexts = [v1 for v1 in self.heap_items if self.next[current][v1] == LOGIC3_1 and v1 != current]
-            for u in current_nexts:
-                if u not in visited:
-                    reachables.append(u)
-                    nextq.append(u)
-        return reachables
+        """
+        Returns a list of all heap items definitely reachable from 'v', 'v' excluded
+        @input: node v
+        @output: list of heap items
+        """
+        position, definite, _ = self.closure()
+        reach = definite[position[v]]
+        return [u for j, u in enumerate(self.heap_items) if reach >> j & 1 and u != v]
 
     def get_all_maybe_reachable(self, v):
         """
-        Returns a list of all heap items reachable from 'v'
+        Returns a list of all heap items reachable from 'v', 'v' excluded
         @input: node v
         @output: list of heap items
         """
-        # Implements BFS - "maybe next" is good enough
+        # "maybe next" is good enough
+        position, _, maybe = self.closure()
+        reach = maybe[position[v]]
+        return [u for j, u in enumerate(self.heap_items) if reach >> j & 1 and u != v]
 
-        reachables = []
-        nextq = deque([v])
-        visited = set([v])
-        while len(nextq) > 0:
-            current = nextq.popleft()
-            visited.add(current)
-            current_nexts = [v1 for v1 in self.heap_items if self.next[current][v1] != LOGIC3_0 and v1 != current and v1 not in visited]
-            for u in current_nexts:
-                reachables.append(u)
-                nextq.append(u)         
-        return reachables
+    def get_all_maybe_reachers(self, v):
+        """
+        Returns a list of all heap items 'v' is reachable from, 'v' excluded
+        @input: node v
+        @output: list of heap items
+        """
+        position, _, maybe = self.closure()
+        bit = 1 << position[v]
+        return [u for i, u in enumerate(self.heap_items) if maybe[i] & bit and u != v]
 
     def check_reachable(self,src, dst):
         """
@@ -906,18 +2858,17 @@ class Heap:
                 node dst
         @output: 3-val bool
         """
-        # Implements a BFS - two queues, "definite_next" and "maybe_next". 
-        # If "definite_next" reaches dst, return 1
-        # otherwise, if "maybe_next" reaches dst, return 1/2
-        # else return 0
-        path = self.path(src,dst)
-        if path == -1:
-            return LOGIC3_0
-        half_edges = [e[0] for e in path if e[0] == LOGIC3_HALF]
-        if half_edges:
-            return LOGIC3_HALF
-        else:
+        # 1 if a definite path reaches dst, otherwise 1/2 if a maybe path does, else 0
+        if src == dst:
             return LOGIC3_1
+        position, definite, maybe = self.closure()
+        i = position[src]
+        bit = 1 << position[dst]
+        if definite[i] & bit:
+            return LOGIC3_1
+        if maybe[i] & bit:
+            return LOGIC3_HALF
+        return LOGIC3_0
         
         
     def check_shared(self, dst):
@@ -944,17 +2895,19 @@ class Heap:
     def check_cycle(self,v):
         """
         Checks whether 'v' is part of a cycle
-        Uses check_reachable
+        Uses closure
         @input: node dst
         @output: 3-val bool
         """
         if self.is_summary[v] == LOGIC3_1:
             return LOGIC3_HALF
-        v_next = [u for u in self.heap_items if self.next[v][u] != LOGIC3_0]
-        for u in v_next:
-            cycle = self.check_reachable(u,v)
-            if cycle != LOGIC3_0:
-                return cycle
+        # 'v' reaches itself in one step or more
+        position, definite, maybe = self.closure()
+        i = position[v]
+        if definite[i] >> i & 1:
+            return LOGIC3_1
+        if maybe[i] >> i & 1:
+            return LOGIC3_HALF
         return LOGIC3_0
     
     def path(self,src, dst, definite = 0):
@@ -1009,73 +2962,840 @@ class Heap:
     
     def rename(self):
         """
-        Renames the IDs in the heap to include 1,2...n without gaps.
-        Used to limit the amount of options in the disjunctive completion
-        @input: 
-        @output: 
+        Renames the IDs in the heap to 1,2...n in a canonical order, so heaps of the same shape get the same IDs
+        (and the same heap_items) regardless of the order their nodes were allocated in.
+        Used to limit the amount of options in the disjunctive completion
+        @input: 
+        @output: edits 'this'
+        """
+        order = self._canonical_order()
+        if order == list(range(1, len(order) + 1)) and self.heap_items[1:] == order:
+            # Already canonical
+            self.max_heap_index = len(order)
+            return
+        self._relabel(order)
+
+    def _canonical_order(self):
+        """
+        Returns the heap nodes (without NULL) in canonical order:
+        A BFS over 'next' from the nodes pointed by the variables, in variable order,
+        then a BFS from each node left, ordered by its key.
+        The successors of a node are visited definite 'next' first, then by key.
+        A node's key holds the variables pointing to and reaching it and its unary predicates.
+        Only nodes no predicate tells apart are ordered by their current ID
+        @input:
+        @output: list of nodes
+        """
+        keys = self._node_keys()
+        successors = self._successors()
+        labeled = set([NULL])
+        order = []
+
+        def visit(root):
+            labeled.add(root)
+            order.append(root)
+            queue = deque([root])
+            while queue:
+                v = queue.popleft()
+                for _, _, u in sorted((-val, keys[u], u) for val, u in successors[v] if u not in labeled):
+                    labeled.add(u)
+                    order.append(u)
+                    queue.append(u)
+
+        for v in self._var_targets():
+            if v not in labeled:
+                visit(v)
+        for v in sorted((v for v in self.heap_items if v not in labeled), key=lambda v: (keys[v], v)):
+            if v not in labeled:
+                visit(v)
+        return order
+
+    def _var_targets(self):
+        """
+        Returns the nodes pointed by the variables, in variable order
+        @input:
+        @output: list of nodes
+        """
+        return [v for x in self.var_pts_to.keys() for v in self.heap_items if self.var_pts_to[x][v] == LOGIC3_1]
+
+    def _node_keys(self):
+        """
+        Returns the key of every node, used to order it in _canonical_order
+        @input:
+        @output: dictionary node -> bytes
+        """
+        variables = list(self.var_pts_to.keys())
+        keys = {}
+        for v in self.heap_items:
+            values = [self.var_pts_to[x][v] for x in variables] + [self.reachable[x][v] for x in variables]
+            values += [self.is_summary[v], self.is_shared[v], self.in_cycle[v]]
+            keys[v] = bytes(int(val * 2) for val in values)
+        return keys
+
+    def _successors(self):
+        """
+        Returns the nodes every node may point to by 'next', NULL excluded
+        @input:
+        @output: dictionary node -> list of (ARRAY3 value of next, node)
+        """
+        return dict((v1, [(int(self.next[v1][v2] * 2), v2) for v2 in self.heap_items
+                          if v2 != NULL and self.next[v1][v2] != LOGIC3_0])
+                    for v1 in self.heap_items)
+
+    def _relabel(self, order):
+        """
+        Renames order[i] to i+1 and makes heap_items [NULL, 1, ... n]
+        @input: list of nodes order - every node of the heap but NULL
+        @output: edits 'this'
+        """
+        items = [NULL] + order
+        new_id = dict((v, i) for i, v in enumerate(items))
+        new_id[NULL] = NULL
+        for name in ("var_pts_to", "reachable"):
+            table = getattr(self, name)
+            setattr(self, name, dict((x, dict((new_id[v], table[x][v]) for v in items)) for x in table.keys()))
+        self.next = dict((new_id[v1], dict((new_id[v2], self.next[v1][v2]) for v2 in items)) for v1 in items)
+        for name in ("is_summary", "in_cycle", "is_shared"):
+            table = getattr(self, name)
+            setattr(self, name, dict((new_id[v], table[v]) for v in items))
+        self.heap_items = [new_id[v] for v in items]
+        self.max_heap_index = len(order)
+        self._items = set(self.heap_items)
+        self._free = []
+        self._free_set = set()
+        # Every table was replaced by a new one
+        self._cow = set()
+        self._fingerprint = None
+        self._codes = None
+        self._closure = None
+
+
+class ArrayHeap(Heap):
+    """
+    Heap backend keeping every predicate in a dense int8 NumPy array instead of nested dictionaries
+    Same transformer/focus/merge API as Heap, and the same results.
+    Fields:
+        * list of variables - variables. Row order of the variable predicates
+        * heap_items = list of nodes. heap_items[i] is row/column i of every node predicate
+        * 3-value logic predicates, stored as ARRAY3_* values:
+            * variables x nodes array - _pts (var_pts_to)
+            * variables x nodes array - _reach (reachable)
+            * nodes x nodes array - _next (predecessor, next)
+            * nodes array - _summary (is_summary), _cycle (in_cycle), _shared (is_shared)
+        * int max_heap_index = integer to upper bound on all heap addresses.
+    The predicates can still be read and written as heap.next[v1][v2], heap.var_pts_to[x][v], ...
+    through dictionary-like views, so code shared with Heap (focus, expressions, drawing) works unchanged.
+    Like in Heap, the arrays are shared copy-on-write with copies of the heap (see Heap._own)
+    """
+    _tables = ("_pts", "_reach", "_next", "_summary", "_cycle", "_shared")
+    _next_table = "_next"
+    # Same constraints as Heap._constraints, by array
+    _constraints = (("_coerce_unique_var", frozenset(["_pts"])),
+                    ("_coerce_unique_next", frozenset(["_next", "_pts", "_reach", "_shared", "_cycle"])),
+                    ("_coerce_reachable", frozenset(["_pts", "_next", "_reach"])),
+                    ("_coerce_unshared_next", frozenset(["_next", "_shared"])),
+                    ("_coerce_cycle", frozenset(["_next", "_summary", "_cycle"])),
+                    ("_coerce_shared", frozenset(["_next", "_shared"])))
+
+    def __init__(self, variables):
+        """
+        Constructor
+        @input: variables = list of variables to include, or their SymbolTable
+        """
+        import_numpy()
+        symbols = SymbolTable.of(variables)
+        self.variables = symbols.names
+        self._var_index = symbols.index
+        # Point all variables to NULL in this new heap
+        self._pts = np.full((len(self.variables), 1), ARRAY3_1, dtype=np.int8)
+        self._reach = np.full((len(self.variables), 1), ARRAY3_1, dtype=np.int8)
+        self._next = np.zeros((1, 1), dtype=np.int8)
+        self._summary = np.zeros(1, dtype=np.int8)
+        self._cycle = np.zeros(1, dtype=np.int8)
+        self._shared = np.full(1, ARRAY3_1, dtype=np.int8)
+        self.max_heap_index = 0
+        self.heap_items = [NULL]
+        self._index = {NULL: 0}
+        self._items = set([NULL])
+        self._free = []
+        self._free_set = set()
+        self._cow = set()
+        self._dirty = set(self._tables)
+        self._fingerprint = None
+        self._codes = None
+        self._closure = None
+        self.joined = False
+
+    @classmethod
+    def from_heap(cls, other):
+        """
+        Builds an ArrayHeap holding the same predicates as 'other', which may use any heap backend
+        @input: Heap other
+        @output: ArrayHeap
+        """
+        heap = cls(other.var_pts_to.keys())
+        heap.heap_items = list(other.heap_items)
+        heap._rebuild_index()
+        items = heap.heap_items
+        encode = lambda values: np.array([int(val * 2) for val in values], dtype=np.int8)
+        heap._pts = np.array([encode([other.var_pts_to[x][v] for v in items]) for x in heap.variables], dtype=np.int8)
+        heap._reach = np.array([encode([other.reachable[x][v] for v in items]) for x in heap.variables], dtype=np.int8)
+        heap._next = np.array([encode([other.next[v1][v2] for v2 in items]) for v1 in items], dtype=np.int8)
+        heap._summary = encode([other.is_summary[v] for v in items])
+        heap._cycle = encode([other.in_cycle[v] for v in items])
+        heap._shared = encode([other.is_shared[v] for v in items])
+        heap.max_heap_index = other.max_heap_index
+        heap._items = set(other._items)
+        heap._free = list(other._free)
+        heap._free_set = set(other._free_set)
+        heap.joined = other.joined
+        return heap
+
+    @classmethod
+    def from_compact(cls, data):
+        """
+        Builds an ArrayHeap from the result of Heap.compact()
+        @input: 6-tuple data
+        @output: ArrayHeap
+        """
+        variables, items, max_heap_index, codes, fingerprint, joined = data
+        heap = cls(variables)
+        heap.heap_items = list(items)
+        heap._rebuild_index()
+        n = len(items)
+        m = len(heap.variables) * n
+        codes = np.frombuffer(codes, dtype=np.int8)
+        heap._pts = codes[:m].reshape(-1, n).copy()
+        heap._reach = codes[m:2 * m].reshape(-1, n).copy()
+        heap._next = codes[2 * m:2 * m + n * n].reshape(n, n).copy()
+        heap._summary, heap._cycle, heap._shared = codes[2 * m + n * n:].reshape(3, n).copy()
+        heap.max_heap_index = max_heap_index
+        heap._items = set(items)
+        heap._free = free_addresses(items, max_heap_index)
+        heap._free_set = set(heap._free)
+        heap._fingerprint = fingerprint
+        heap._codes = data[3]
+        heap.joined = joined
+        return heap
+
+    def copy_Heap(self, other):
+        """
+        Copies all properties of 'other' to this. The arrays are shared copy-on-write
+        @input: ArrayHeap other
+        @output:
+        """
+        # The variable list and its index never change, share them
+        self.variables = other.variables
+        self._var_index = other._var_index
+        Heap.copy_Heap(self, other)
+        self._index = dict(other._index)
+
+    def _clone_table(self, name, table):
+        return table.copy()
+
+    def nbytes(self):
+        return sys.getsizeof(self.heap_items) + sum(getattr(self, name).nbytes for name in self._tables)
+
+    def _predicate_bytes(self):
+        return b"".join(array.tobytes() for array in (self._pts, self._reach, self._next,
+                                                      self._summary, self._cycle, self._shared))
+
+    # Dictionary-like views of the predicates
+    @property
+    def var_pts_to(self):
+        return _ArrayPredicate(self, "_pts", self._var_index)
+
+    @property
+    def reachable(self):
+        return _ArrayPredicate(self, "_reach", self._var_index)
+
+    @property
+    def next(self):
+        return _ArrayPredicate(self, "_next", self._index)
+
+    @property
+    def is_summary(self):
+        return _ArrayRow(self, "_summary", None)
+
+    @property
+    def in_cycle(self):
+        return _ArrayRow(self, "_cycle", None)
+
+    @property
+    def is_shared(self):
+        return _ArrayRow(self, "_shared", None)
+
+    def _rebuild_index(self):
+        """
+        Recomputes the node to row/column map after heap_items changed order
+        """
+        self._index = dict((v, i) for i, v in enumerate(self.heap_items))
+
+    def get(self, var):
+        """
+        Returns the heap address this var is assigned to from the vars_pts_to predicates
+        @input: string var = variable to lookup
+        @output: node = node this variable points to
+        """
+        if var == NULL_VAR:
+            return NULL
+        definite = np.flatnonzero(self._pts[self._var_index[var]] == ARRAY3_1)
+        if len(definite) != 1:
+            raise ErrorIllegalHeap()
+        return self.heap_items[definite[0]]
+
+    def get_next(self, pred_node):
+        """
+        Returns the heap address in pred_node.next
+        @input: node pred_node
+        @output: node = pred_node.next
+        """
+        definite = np.flatnonzero(self._next[self._index[pred_node]] == ARRAY3_1)
+        if len(definite) != 1:
+            raise ErrorIllegalHeap()
+        return self.heap_items[definite[0]]
+
+    def transformer_next_assign(self, x, t):
+        """
+        x.n:=t
+        Applies the transformer onto 'this' by setting where var_assignee_pred's "next" points to the node var_assigned points to
+        @input: string var_assignee_pred = variable who's "next" ptr is being edited
+                string var_assigned = name of the variable who is set to point to the ancestor
+        @output: 'this'
+        Notes: implements transformer on "self"
+        """
+        at_x = self._index[self.get(x)]
+        at_t = self._index[self.get(t)]
+        # The closure of 'next' before the assignment, updated below instead of computed again
+        closure = self.closure()
+        self._own("_next", "_reach", "_shared", "_cycle")
+        # Disconnect current '.n' fields from *x and set the next to point where it should
+        self._next[at_x, :] = ARRAY3_0
+        self._next[at_x, at_t] = ARRAY3_1
+        self._reach[self._var_index[x], at_t] = ARRAY3_1
+        # Update to shared if it is shared
+        t_preds = self._next[:, at_t]
+        if np.count_nonzero(t_preds != ARRAY3_HALF) > 1:
+            if np.count_nonzero(t_preds == ARRAY3_1) > 1:
+                self._shared[at_t] = ARRAY3_1
+            else:
+                self._shared[at_t] = ARRAY3_HALF
+        # Update reachability: only paths through *x changed, so only variables and items reaching *x are remapped
+        affected = closure[1][:, at_x].copy()
+        affected[at_x] = True
+        self._closure = self._next_assign_closure(closure, at_x, at_t)
+        reach = self._reach_matrix()
+        for y in self.variables:
+            src = self._index[self.get(y)]
+            if affected[src]:
+                self._reach[self._var_index[y]] = reach[src]
+        # Check if cycle is formed, update accordingly.
+        self._cycle[affected] = self._cycles()[affected]
+        return self
+
+    def is_mergable(self, heap_arg1, heap_arg2):
+        """
+        Checks whether in this heap heap_arg1 and heap_arg2 have the same abstraction properties
+        (see Heap.is_mergable)
+        @input: heap_adress heap_arg1
+                heap_adress heap_arg2
+        @output: bool
+        """
+        # NULL cannot be summarized with anything
+        if heap_arg1 == NULL or heap_arg2 == NULL:
+            return False
+        i = self._index[heap_arg1]
+        j = self._index[heap_arg2]
+        return bool(self._shared[i] == self._shared[j] and self._cycle[i] == self._cycle[j] and
+                    np.array_equal(self._pts[:, i], self._pts[:, j]) and
+                    np.array_equal(self._reach[:, i], self._reach[:, j]))
+
+    def merge(self, v1, v2):
+        """
+        Merges a v2 into v1 and updates predicates accordingly
+        for consistency purposes, v1 is the lower address and v2 the higher address
+        @input: heap item v1
+                heap item v2
+        @output: merged heap item
+        """
+        if v1 == NULL or v2 == NULL:
+            return NULL
+        i = self._index[v1]
+        j = self._index[v2]
+        self._own("_reach", "_next", "_shared", "_summary", "_cycle")
+        nxt = self._next
+        # Every variable that reaches v1 or v2 reaches the merged item
+        self._reach[:, i] = np.maximum(self._reach[:, i], self._reach[:, j])
+        # A summary is never definitely anyone's next and never has a definite next:
+        # every 'next' of v1 or v2 becomes 1/2 (and3(1/2, join3(...)) in Heap.merge)
+        row = ((nxt[i] != ARRAY3_0) | (nxt[j] != ARRAY3_0)).astype(np.int8)
+        col = ((nxt[:, i] != ARRAY3_0) | (nxt[:, j] != ARRAY3_0)).astype(np.int8)
+        # Heap.merge updates the v1/v2 corner entries in heap_items order. Their values before
+        # the self-edge is set to 1/2 still count when looking for predecessors of the merged item
+        self_edge = nxt[i, i] or nxt[j, i] or nxt[i, j] or (i > j and nxt[j, j])
+        v2_edge = nxt[j, i] or nxt[j, j]
+        col[i] = col[j] = ARRAY3_0
+        nxt[i] = row
+        nxt[:, i] = col
+        # If now more than one pointer - its shared
+        if np.count_nonzero(col) + bool(self_edge) + bool(v2_edge) > 1:
+            self._shared[i] = ARRAY3_HALF
+        self._summary[i] = ARRAY3_1
+        nxt[i, i] = ARRAY3_HALF
+        self._cycle[i] = ARRAY3_HALF
+        self.remove_node(v2)
+        return v1
+
+    def _abstraction_keys(self):
+        columns = np.ascontiguousarray(np.vstack((self._pts, self._reach, self._shared, self._cycle)).T)
+        return dict((v, columns[i].tobytes()) for i, v in enumerate(self.heap_items) if v != NULL)
+
+    def _abstraction_key(self, v):
+        i = self._index[v]
+        return np.concatenate((self._pts[:, i], self._reach[:, i], self._shared[i:i + 1], self._cycle[i:i + 1])).tobytes()
+
+    def new_node(self):
+        """
+        Creates a new item in this heap and returns it
+        @input:
+        @output:  the new node
+                  updates 'this' accordingly
+        """
+        new_node = self._new_address()
+        n = len(self.heap_items)
+        # New item is pointed by no variable, reachable from none, not shared, not in a cycle and not a summary
+        self._pts = np.concatenate((self._pts, np.zeros((len(self.variables), 1), dtype=np.int8)), axis=1)
+        self._reach = np.concatenate((self._reach, np.zeros((len(self.variables), 1), dtype=np.int8)), axis=1)
+        nxt = np.zeros((n + 1, n + 1), dtype=np.int8)
+        nxt[:n, :n] = self._next
+        # Its next is NULL
+        nxt[n, self._index[NULL]] = ARRAY3_1
+        self._next = nxt
+        self._summary = np.append(self._summary, np.int8(ARRAY3_0))
+        self._cycle = np.append(self._cycle, np.int8(ARRAY3_0))
+        self._shared = np.append(self._shared, np.int8(ARRAY3_0))
+        self.heap_items.append(new_node)
+        self._items.add(new_node)
+        self._index[new_node] = n
+        # Every array was replaced by a new one
+        self._cow = set()
+        self._dirty.update(self._tables)
+        self._fingerprint = None
+        self._codes = None
+        self._closure = None
+        return new_node
+
+    def remove_node(self, v):
+        """
+        Removes node 'v' from the heap along with all its predicates. Used after a 'merge' command
+        @input: v
+        @output: edits 'this'
+        """
+        i = self._index[v]
+        self._items.remove(v)
+        del self.heap_items[i]
+        self._release_address(v)
+        self._pts = np.delete(self._pts, i, axis=1)
+        self._reach = np.delete(self._reach, i, axis=1)
+        self._next = np.delete(np.delete(self._next, i, axis=0), i, axis=1)
+        self._summary = np.delete(self._summary, i)
+        self._cycle = np.delete(self._cycle, i)
+        self._shared = np.delete(self._shared, i)
+        self._rebuild_index()
+        self._cow = set()
+        self._dirty.update(self._tables)
+        self._fingerprint = None
+        self._codes = None
+        self._closure = None
+
+    def _var_targets(self):
+        variables, nodes = np.nonzero(self._pts == ARRAY3_1)
+        return [self.heap_items[i] for i in nodes[np.argsort(variables, kind="stable")]]
+
+    def _node_keys(self):
+        columns = np.ascontiguousarray(np.vstack((self._pts, self._reach, self._summary, self._shared, self._cycle)).T)
+        return dict((v, columns[i].tobytes()) for i, v in enumerate(self.heap_items))
+
+    def _successors(self):
+        items = self.heap_items
+        successors = dict((v, []) for v in items)
+        nxt = self._next.copy()
+        nxt[:, self._index[NULL]] = ARRAY3_0
+        for i, j in zip(*np.nonzero(nxt)):
+            successors[items[i]].append((int(nxt[i, j]), items[j]))
+        return successors
+
+    def _relabel(self, order):
+        perm = [self._index[NULL]] + [self._index[v] for v in order]
+        self._pts = self._pts[:, perm]
+        self._reach = self._reach[:, perm]
+        self._next = self._next[perm][:, perm]
+        self._summary = self._summary[perm]
+        self._cycle = self._cycle[perm]
+        self._shared = self._shared[perm]
+        self.heap_items = [NULL] + list(range(1, len(order) + 1))
+        self.max_heap_index = len(order)
+        self._items = set(self.heap_items)
+        self._free = []
+        self._free_set = set()
+        self._rebuild_index()
+        self._cow = set()
+        self._fingerprint = None
+        self._codes = None
+        self._closure = None
+
+    def set_var(self, var, new_address):
+        """
+        Sets var to point to node instead of its previous location in the heap
+        @input: var
+                node new_address
+        """
+        x = self._var_index[var]
+        current_dst = np.flatnonzero(self._pts[x] == ARRAY3_1)
+        if len(current_dst) != 1:
+            raise ErrorIllegalHeap
+        self._own("_pts", "_reach")
+        self._pts[x, current_dst[0]] = ARRAY3_0
+        v = self._index[new_address]
+        self._pts[x, v] = ARRAY3_1
+        # Reachability from 'var': 1 along definite paths, 1/2 along maybe paths
+        self._reach[x] = self._reach_matrix()[v]
+
+    def closure(self):
+        """
+        Returns the transitive closure of 'next' (see Heap.closure), computed by repeated squaring
+        @input:
+        @output: 2-tuple of boolean nodes x nodes arrays (definite, maybe)
+        """
+        if self._closure is None:
+            self._closure = (self._transitive(self._next == ARRAY3_1), self._transitive(self._next != ARRAY3_0))
+        return self._closure
+
+    def _next_assign_closure(self, closure, at_x, at_t):
+        """
+        Returns the closure of 'next' after x.n:=t (see Heap._next_assign_closure), from the closure before it
+        @input: 2-tuple closure - the closure of 'next' before the assignment, not edited
+                int at_x, at_t - positions of *x and *t
+        @output: 2-tuple, like closure
+        """
+        affected = closure[1][:, at_x].copy()
+        affected[at_x] = True
+        kept = ~affected
+        x_row = np.flatnonzero(affected) == at_x
+        arrays = []
+        for old, edges in zip(closure, (self._next == ARRAY3_1, self._next != ARRAY3_0)):
+            # Delete the edges out of x: rows of the items reaching x, through the items not reaching x
+            steps = edges[affected]
+            steps[x_row] = False
+            rows = steps | (np.dot(steps[:, kept].astype(np.int32), old[kept].astype(np.int32)) > 0)
+            # Then through the items reaching x, doubling the length of the paths every time
+            while True:
+                longer = rows | (np.dot(rows[:, affected].astype(np.int32), rows.astype(np.int32)) > 0)
+                if np.array_equal(longer, rows):
+                    break
+                rows = longer
+            new = old.copy()
+            new[affected] = rows
+            # Insert the edge x -> t
+            reach_t = new[at_t].copy()
+            reach_t[at_t] = True
+            sources = new[:, at_x].copy()
+            sources[at_x] = True
+            new[sources] |= reach_t
+            arrays.append(new)
+        return tuple(arrays)
+
+    @staticmethod
+    def _transitive(edges):
+        """
+        Returns the transitive closure (paths of one step or more) of a boolean nodes x nodes array
+        """
+        closure = edges
+        while True:
+            # Paths of up to twice the length
+            paths = closure.astype(np.int32)
+            squared = closure | (np.dot(paths, paths) > 0)
+            if np.array_equal(squared, closure):
+                return closure
+            closure = squared
+
+    def _reach_matrix(self):
+        """
+        Returns check_reachable(v1, v2) for every pair of items, as an ARRAY3 nodes x nodes array
+        """
+        definite, maybe = self.closure()
+        definite = definite | np.eye(len(self.heap_items), dtype=bool)
+        return np.where(definite, ARRAY3_1, np.where(maybe, ARRAY3_HALF, ARRAY3_0)).astype(np.int8)
+
+    def _cycles(self):
+        """
+        Returns check_cycle(v) for every item, as an ARRAY3 nodes array
+        """
+        definite, maybe = self.closure()
+        cycles = np.where(definite.diagonal(), ARRAY3_1, np.where(maybe.diagonal(), ARRAY3_HALF, ARRAY3_0)).astype(np.int8)
+        cycles[self._summary == ARRAY3_1] = ARRAY3_HALF
+        return cycles
+
+    def _shared_all(self):
+        """
+        Returns check_shared(v) for every item, as an ARRAY3 nodes array
+        """
+        definite = np.count_nonzero(self._next == ARRAY3_1, axis=0)
+        maybe = np.count_nonzero(self._next == ARRAY3_HALF, axis=0)
+        return np.where(definite > 1, ARRAY3_1, np.where(maybe > 1, ARRAY3_HALF, ARRAY3_0)).astype(np.int8)
+
+    def get_all_reachable(self, v):
+        i = self._index[v]
+        mask = self.closure()[0][i].copy()
+        mask[i] = False
+        return [self.heap_items[k] for k in np.flatnonzero(mask)]
+
+    def get_all_maybe_reachable(self, v):
+        i = self._index[v]
+        mask = self.closure()[1][i].copy()
+        mask[i] = False
+        return [self.heap_items[k] for k in np.flatnonzero(mask)]
+
+    def get_all_maybe_reachers(self, v):
+        i = self._index[v]
+        mask = self.closure()[1][:, i].copy()
+        mask[i] = False
+        return [self.heap_items[k] for k in np.flatnonzero(mask)]
+
+    def check_reachable(self, src, dst):
+        """
+        Checks dst is reachable from src using "next"
+        @input: node src
+                node dst
+        @output: 3-val bool
+        """
+        if src == dst:
+            return LOGIC3_1
+        definite, maybe = self.closure()
+        i = self._index[src]
+        j = self._index[dst]
+        if definite[i, j]:
+            return LOGIC3_1
+        if maybe[i, j]:
+            return LOGIC3_HALF
+        return LOGIC3_0
+
+    def check_shared(self, dst):
+        """
+        Checks whether dst is the 'next' of more than 1 item
+        @input: node dst
+        @output: 3-val bool
+        """
+        return ARRAY3_DECODE[self._shared_all()[self._index[dst]]]
+
+    def check_cycle(self, v):
+        """
+        Checks whether 'v' is part of a cycle
+        @input: node dst
+        @output: 3-val bool
+        """
+        return ARRAY3_DECODE[self._cycles()[self._index[v]]]
+
+    def path(self, src, dst, definite = 0):
+        """
+        Returns the path from src to dst, if one exists (see Heap.path)
+        @input: node src
+                node dst
+                definite - bool whether 1/2 path is acceptable or not.
+        @output: path - list of 2-tuples (edge type = 1 or 1/2, dst). If no path exists, returns -1
+        """
+        if src == dst:
+            return [(1, src)]
+        if definite == 1:
+            edges = self._next == ARRAY3_1
+        else:
+            edges = self._next != ARRAY3_0
+        visited = set([src])
+        to_visit = deque([[(1, src)]])
+        while to_visit:
+            path = to_visit.popleft()
+            node = path[-1][1]
+            visited.add(node)
+            if node == dst:
+                return path
+            i = self._index[node]
+            for k in np.flatnonzero(edges[i]):
+                v = self.heap_items[k]
+                if v not in visited:
+                    new_path = list(path)
+                    new_path.append((ARRAY3_DECODE[self._next[i, k]] if definite != 1 else 1, v))
+                    to_visit.append(new_path)
+        return -1
+
+    def _coerce_unique_var(self):
+        # forall x in vars, x(v1) and x(v2) |> v1 = v2
+        return not (np.count_nonzero(self._pts != ARRAY3_0, axis=1) > 1).any()
+
+    def _coerce_unique_next(self):
+        # exists v3: n(v3, v1) and n(v3,v2) |> v1 = v2
+        # Merges items, so only run the general version when some item has two definite nexts
+        if (np.count_nonzero(self._next == ARRAY3_1, axis=1) > 1).any():
+            for v3 in self.heap_items:
+                item_definite_nexts = [addr for addr in self.heap_items if self.next[v3][addr] == LOGIC3_1]
+                while len(item_definite_nexts) > 1:
+                    v1 = item_definite_nexts[0]
+                    v2 = item_definite_nexts[1]
+                    if not self.is_mergable(v1, v2):
+                        return False
+                    item_definite_nexts.remove(v1)
+                    item_definite_nexts.remove(v2)
+                    item_definite_nexts.append(self.merge(min(v1, v2), max(v1, v2)))
+        return True
+
+    def _coerce_reachable(self):
+        # x(v) or (exists v1 : x(v1) and n*(v1,v)) |> reachable(x,v)
+        reach = self._reach_matrix()
+        phi = np.minimum(self._pts[:, :, None], reach[None, :, :]).max(axis=1)
+        lhs = np.maximum(self._pts, phi)
+        if ((self._reach != ARRAY3_HALF) & (lhs != ARRAY3_HALF) & (self._reach != lhs)).any():
+            return False
+        changed = (self._reach == ARRAY3_HALF) & (lhs != ARRAY3_HALF)
+        if changed.any():
+            self._own("_reach")
+            self._reach[changed] = lhs[changed]
+        return True
+
+    def _coerce_unshared_next(self):
+        # (exists v1: not is_shared(v) and v1!=v2 and n(v1,v)) |> not n(v2,v)
+        unshared = self._shared == ARRAY3_0
+        unshared[self._index[NULL]] = False
+        definite_preds = np.count_nonzero(self._next == ARRAY3_1, axis=0)
+        if (unshared & (definite_preds > 1)).any():
+            return False
+        # An unshared item with a definite predecessor has no other predecessor
+        single = unshared & (definite_preds == 1)
+        if single.any():
+            changed = single[None, :] & (self._next == ARRAY3_HALF)
+            if changed.any():
+                self._own("_next")
+                self._next[changed] = ARRAY3_0
+        return True
+
+    def _coerce_cycle(self):
+        # n*(v1,v1) |> c(v1)
+        rows = [self._index[v] for v in self.heap_items if v != NULL]
+        cycles = self._cycles()[rows]
+        current = self._cycle[rows]
+        known = cycles != ARRAY3_HALF
+        if (known & (cycles != current) & (current != ARRAY3_HALF)).any():
+            return False
+        if (known & (cycles != current)).any():
+            self._own("_cycle")
+            self._cycle[rows] = np.where(known, cycles, current)
+        return True
+
+    def _coerce_shared(self):
+        # \exists v1,v2 : v1 != v2 and n(v1,v) and n(v2,v) |> is_shared(v)
+        rows = [self._index[v] for v in self.heap_items if v != NULL]
+        nxt = self._next[rows][:, rows]
+        preds = np.count_nonzero(nxt != ARRAY3_0, axis=0)
+        definite = np.count_nonzero(nxt == ARRAY3_1, axis=0)
+        current = self._shared[rows]
+        if ((preds > 1) & (definite > 1) & (current == ARRAY3_0)).any() or ((preds <= 1) & (current == ARRAY3_1)).any():
+            return False
+        shared = np.where(preds > 1, np.where(definite > 1, ARRAY3_1, ARRAY3_HALF), ARRAY3_0)
+        if not np.array_equal(shared, current):
+            self._own("_shared")
+            self._shared[rows] = shared
+        return True
+
+    def is_equivalent(self, other):
+        """
+        Checks if 'other' is logically equivalent in its heap structure and pointers to 'this'.
+        Return is DEFINITE
+        @input: ArrayHeap other - The abstract node evaluated
+        @output: bool
         """
-        min_free_id = 1
-        max_id = None
-        while (min_free_id != max_id):
-            # Find first free id
-            ids = [v for v in self.heap_items if v != NULL]
-            max_id = max(ids)
-            # No need for max_id + 1 - since its the max id, it is surely taken
-            for i in range(1, max_id+1):
-                min_free_id = i
-                if i not in ids:
-                    break
-            if min_free_id != max_id:
-                # Set the max_id item's id to min_free_id
-                self.rename_item(max_id, min_free_id)
-                min_free_id = 1
-                self.max_heap_index = max_id
-            
-    def rename_item (self, current_id, new_id):
-        """
-        Renames the current_id item to the new id
-        @input: node current_id
-                node new id
-        @output:  edits 'this'
-        """
-        # Remove current_id from heap_items
-        self.heap_items.remove(current_id)
-        self.heap_items.append(new_id)
-        # Go over every type of predicate, rename keys
-        # var_pts_to & reachable
-        for x in self.var_pts_to.keys():
-            self.var_pts_to[x][new_id] = self.var_pts_to[x][current_id]
-            del self.var_pts_to[x][current_id]
-            # Every variable that reaches current id must reach new id
-            self.reachable[x][new_id] = self.reachable[x][current_id]
-            del self.reachable[x][current_id] 
-        # is summary
-        self.is_summary[new_id] = self.is_summary[current_id]
-        del self.is_summary[current_id]
-        # in cycle
-        self.in_cycle[new_id] = self.in_cycle[current_id]
-        del self.in_cycle[current_id]
-        # next
-        # Make new id's next those of the current id
-        self.next[new_id] = deepcopy(self.next[current_id])
-        for v in self.heap_items:
-            # Make the new item the next of anyone whose next is current_id. Remove mention of current id from all heap_item's nexts ( 0 or 1)
-            self.next[v][new_id] = self.next[v][current_id]
-            del self.next[v][current_id]
-        del self.next[current_id] 
-        
-        # is shared
-        self.is_shared[new_id] = self.is_shared[current_id]
-        del self.is_shared[current_id]
-        
-        
+        return (self.heap_items == other.heap_items and
+                np.array_equal(self._pts, other._pts) and
+                np.array_equal(self._reach, other._reach) and
+                np.array_equal(self._shared, other._shared) and
+                np.array_equal(self._cycle, other._cycle) and
+                np.array_equal(self._summary, other._summary) and
+                np.array_equal(self._next, other._next))
+
+
+class _ArrayPredicate:
+    """
+    Dictionary-like view of a 2-dimensional ArrayHeap predicate, indexed by variable or node
+    Fields:
+        * ArrayHeap heap
+        * string name - attribute of the array in heap
+        * dictionary of key to row - rows
+    """
+
+    def __init__(self, heap, name, rows):
+        self.heap = heap
+        self.name = name
+        self.rows = rows
+
+    def __getitem__(self, key):
+        return _ArrayRow(self.heap, self.name, self.rows[key])
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __contains__(self, key):
+        return key in self.rows
+
+    def keys(self):
+        if self.rows is self.heap._var_index:
+            return list(self.heap.variables)
+        return list(self.heap.heap_items)
+
+
+class _ArrayRow:
+    """
+    Dictionary-like view of an ArrayHeap predicate over nodes: a row of a 2-dimensional array, or a unary predicate
+    Fields:
+        * ArrayHeap heap
+        * string name - attribute of the array in heap
+        * int row - row of the array, None for unary predicates
+    """
+
+    def __init__(self, heap, name, row):
+        self.heap = heap
+        self.name = name
+        self.row = row
+
+    def __getitem__(self, v):
+        array = getattr(self.heap, self.name)
+        if self.row is None:
+            return ARRAY3_DECODE[array[self.heap._index[v]]]
+        return ARRAY3_DECODE[array[self.row, self.heap._index[v]]]
+
+    def __setitem__(self, v, value):
+        self.heap._own(self.name)
+        array = getattr(self.heap, self.name)
+        if self.row is None:
+            array[self.heap._index[v]] = int(value * 2)
+        else:
+            array[self.row, self.heap._index[v]] = int(value * 2)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.heap.heap_items)
+
+    def __contains__(self, v):
+        return v in self.heap._index
+
+    def keys(self):
+        return list(self.heap.heap_items)
+
+
+HEAP_BACKENDS = {HEAP_BACKEND_DICT: Heap, HEAP_BACKEND_NUMPY: ArrayHeap}
+
 
-        
-    
-    
-    
-    
-    
 class Transformer:
     """
     Class for a transformer
@@ -1117,6 +3837,41 @@ class Transformer:
             self.operation = TRANSFORMER_ASSERT
         else:
             raise ErrorParsing()
+        self.compile()
+
+    def compile(self):
+        """
+        Compiles the transformer once, so the analysis of every heap does no dispatch on its operation:
+            * focus_plan - tuple of (function, variable) steps. Each function takes the list of heaps focused so far
+                           and the variable, and returns the heaps focused for it (see focus_vars, focus_nexts)
+            * apply - function applying the transformer onto a heap, one of Heap.transformer_$operation$
+        """
+        if self.operation == TRANSFORMER_NEW:
+            self.focus_plan = ()
+            self.apply = methodcaller("transformer_new", self.arg1)
+        elif self.operation == TRANSFORMER_ASSIGN_VAR:
+            # x:=t   phi = {t(v)}
+            self.focus_plan = ((focus_vars, self.arg2),)
+            self.apply = methodcaller("transformer_assign_var", self.arg1, self.arg2)
+        elif self.operation == TRANSFORMER_ASSIGN_NEXT:
+            # x:=t.n   phi = {\exists v_1 : t(v_1)and n(v_1,v)}
+            self.focus_plan = ((focus_vars, self.arg2), (focus_nexts, self.arg2))
+            self.apply = methodcaller("transformer_assign_next", self.arg1, self.arg2)
+        elif self.operation == TRANSFORMER_NEXT_ASSIGN:
+            # x.n:=t   phi = {x(v), t(v)}
+            self.focus_plan = ((focus_vars, self.arg1), (focus_vars, self.arg2))
+            self.apply = methodcaller("transformer_next_assign", self.arg1, self.arg2)
+        else:
+            # assume and assert: the variables of every atomic expression
+            self.focus_plan = tuple((focus_vars, var) for atomic_expr in self.expression.atomics
+                                    for var in atomic_expr.focus_variables())
+            self.apply = methodcaller("transformer_" + self.operation, self.expression)
+
+    def focus_variables(self):
+        """
+        @output: list of string - the variables focus_plan focuses, in order
+        """
+        return [var for step, var in self.focus_plan]
    
 
 class AtomicExpression:
@@ -1151,7 +3906,7 @@ class AtomicExpression:
         if eq_pos != -1 and len_pos == -1:
             self.arg2 = expr_string[eq_pos+2:]
             self.arg1 = expr_string[:eq_pos]
-            if self.arg2 == "NULL":
+            if self.arg2 == NULL_VAR:
                 self.type = EXPR_VAREQNULL
             else:
                 if self.arg2.find(".n") != -1:
@@ -1164,7 +3919,7 @@ class AtomicExpression:
         if neq_pos != -1:
             self.arg2 = expr_string[neq_pos+2:]
             self.arg1 = expr_string[:neq_pos]
-            if self.arg2 == "NULL":
+            if self.arg2 == NULL_VAR:
                 self.type = EXPR_VARNEQNULL
             else:
                 if self.arg2.find(".n") != -1:
@@ -1203,6 +3958,12 @@ class AtomicExpression:
             self.type = EXPR_TRUE
         elif expr_string == EXPR_FALSE:
             self.type = EXPR_FALSE
+
+    def focus_variables(self):
+        """
+        @output: list of string - the variables Heap.focus must focus before evaluating the expression, in order
+        """
+        return [getattr(self, arg) for arg in EXPR_FOCUS_ARGS.get(getattr(self, "type", None), ())]
             
     def evaluate(self, heap):
         """
@@ -1475,16 +4236,174 @@ class ErrorIllegalHeap(Exception):
 class ErrorParsing(Exception):
     pass
 
+class ErrorTimeout(Exception):
+    pass
+
 class ErrorAssertionFailed(Exception):
     pass
 
+class ErrorCheckpoint(Exception):
+    pass
+
+
+def transfer(heap, transformer, profiler = None):
+    """
+    The transfer function of an edge for a single heap:
+    focus, apply_transformer, coerce_red and canonical_abstraction
+    @input: Heap heap
+            Transformer transformer
+            Profiler profiler - times the phases (see Profiler.transferred), None = not profiled
+    @output: list of Heap - the abstract heaps after the transformer
+    """
+    clock = no_clock if profiler is None else profiler.clock
+    start = clock()
+    focused = heap.focus(transformer)
+    focus_end = clock()
+    # Returns the heap after the transformer or None (if condition evaluated to 0)
+    apply = transformer.apply
+    transformed = [apply(h.copy()) for h in focused]
+    # Remove all "None" heaps
+    transformed = [h for h in transformed if h != None]
+    apply_end = clock()
+    coerced = coerce_red(transformed)
+    coerce_end = clock()
+    result = canonical_abstraction(coerced)
+    if profiler is not None:
+        profiler.transferred((start, focus_end, apply_end, coerce_end), len(focused), len(transformed), len(coerced),
+                             result)
+    return result
+
+def no_clock():
+    """
+    The clock of transfer when it is not profiled
+    """
+    return 0.0
+
+def focus_vars(heaps, var):
+    """
+    Focus step of Transformer.focus_plan: focuses var(v) in every heap (see Heap.focus_var)
+    @input: list of Heap heaps
+            string var
+    @output: list of Heap
+    """
+    return [focused for heap in heaps for focused in heap.focus_var(var)]
+
+def focus_nexts(heaps, t):
+    """
+    Focus step of Transformer.focus_plan: focuses t.n in every heap (see Heap.focus_next)
+    @input: list of Heap heaps - t(v) already focused in all of them
+            string t
+    @output: list of Heap - 'heaps' if none of them had anything to focus
+    """
+    focused = [f for heap in heaps for f in heap.focus_next(t)]
+    return focused if focused else heaps
+
+def analyze_component(code, names, heaps, backend, strategy, cache_entries, cache_bytes, draw, max_heaps, subsume):
+    """
+    Cfg.analyze_component on the graph of 'code'. Runs in the worker processes of Cfg.analyze_components
+    @input: string code - the code of the graph
+            see Cfg.analyze_component
+    @output: see Cfg.analyze_component
+    """
+    return Cfg(code).analyze_component(names, heaps, backend, strategy, cache_entries, cache_bytes, draw,
+                                       max_heaps, subsume)
+
+def edge_key(edge):
+    """
+    @input: Edge edge
+    @output: 3-tuple (string source state name, string command, string destination state name).
+             The same for the same edge of two versions of a program
+    """
+    return edge.src, edge.op.entire_command, edge.dst
+
+def reachable_states(edges, roots):
+    """
+    Returns the names of the states reachable from 'roots' along 'edges', 'roots' included
+    @input: iterable of edge_key edges
+            set of state names roots
+    @output: set of state names
+    """
+    successors = {}
+    for src, _, dst in edges:
+        successors.setdefault(src, []).append(dst)
+    reached = set(roots)
+    stack = list(roots)
+    while stack:
+        for dst in successors.get(stack.pop(), ()):
+            if dst not in reached:
+                reached.add(dst)
+                stack.append(dst)
+    return reached
+
+def write_checkpoint(filename, data):
+    """
+    Writes a checkpoint atomically: to a new file in the same directory, flushed to disk, then renamed over 'filename'.
+    Until the rename, 'filename' holds the previous checkpoint, whole
+    @input: string filename
+            dictionary data - see Cfg.checkpoint_data
+    """
+    directory = os.path.dirname(os.path.abspath(filename))
+    handle, temporary = tempfile.mkstemp(prefix = os.path.basename(filename) + ".", suffix = ".tmp", dir = directory)
+    try:
+        with os.fdopen(handle, "wb") as out:
+            out.write(CHECKPOINT_MAGIC)
+            out.write(zlib.compress(pickle.dumps(data, pickle.HIGHEST_PROTOCOL), 1))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temporary, filename)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temporary)
+        raise
+    if hasattr(os, "O_DIRECTORY"):
+        # So the rename itself survives a crash
+        descriptor = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+def read_checkpoint(filename):
+    """
+    Reads a checkpoint written by write_checkpoint
+    @input: string filename
+    @output: dictionary - see Cfg.checkpoint_data
+    Notes: raises ErrorCheckpoint if the file is not a checkpoint of this version
+    """
+    try:
+        with open(filename, "rb") as checkpoint_file:
+            contents = checkpoint_file.read()
+    except OSError as e:
+        raise ErrorCheckpoint(str(e)) from e
+    if not contents.startswith(CHECKPOINT_MAGIC):
+        raise ErrorCheckpoint("not a checkpoint file")
+    try:
+        data = pickle.loads(zlib.decompress(contents[len(CHECKPOINT_MAGIC):]))
+    except Exception as e:
+        raise ErrorCheckpoint("damaged checkpoint file") from e
+    if data.get("version") != CHECKPOINT_VERSION:
+        raise ErrorCheckpoint("checkpoint version " + str(data.get("version")) + ", expected " + str(CHECKPOINT_VERSION))
+    return data
+
+def transfer_compact(backend, command, heaps):
+    """
+    transfer() for a batch of heaps in compact form (see Heap.compact).
+    Runs in the worker processes of Cfg.analyze
+    @input: backend - heap backend, one of HEAP_BACKENDS
+            string command - the command of the transformer
+            list of compact heaps
+    @output: list of lists of compact heaps, transfer() of each input heap
+    """
+    heap_class = HEAP_BACKENDS[backend]
+    transformer = Transformer(command)
+    return [[h.compact() for h in transfer(heap_class.from_compact(data), transformer)] for data in heaps]
 
 def canonical_abstraction(heaps):
     """
     Canonical abstraction function.
     Derives abstract heaps from a list of heaps by using canonical abstraction
-    Uses the current abstraction properties in heap.is_mergable
-    Goes over every heap in heaps, merges heap items with identical abstraction properties
+    Uses the abstraction properties of heap.is_mergable
+    Goes over every heap in heaps, merges heap items with identical abstraction properties (see Heap.summarize)
     Discards equivalent heaps 
     Renames items to 1,....n 
     @input: heaps - list of heaps to abstract
@@ -1493,41 +4412,22 @@ def canonical_abstraction(heaps):
     # Rules for canonical abstraction:
     # 
     #    Merge all heap items that are the same in the 'abstraction properties' into summary nodes
-    #        For our analysis - 'abstraction properties' will be var_pts_to[var], reachable[var], is_shared
+    #        For our analysis - 'abstraction properties' will be var_pts_to[var], reachable[var], is_shared, in_cycle
     #    Predicates that are 1 in all heaps are 1 in the abstract state
     #                        0 in all heaps are 0
     #                        else they are 1/2
     # Go over all heaps. merge heap items that are identical in abstraction properties
     for heap in heaps:
-        # For every item, if a different one exists with the same item, merge them.
-        i = 0
-        while len(heap.heap_items) > i:
-            v1 = heap.heap_items[i]
-            items_without_v1 = [v for v in heap.heap_items if v != v1]
-            j = 0
-            merged = False
-            while len(items_without_v1) > j:
-                v2 = items_without_v1[j]
-                if heap.is_mergable(v1,v2):
-                    # Merge clears v1, v2 from heap items anyway and appends the new, merged item
-                    # For consistency, always merge upper id into lower id
-                    heap.merge(min(v1,v2), max(v1,v2))
-                    merged = True
-                    break
-                else:
-                    j += 1
-            if merged == False:
-                i += 1
+        heap.summarize()
     # After summarizing nodes, for every heap, update heap to include only non-equivalent heaps
     # Rename first to try and catch more equivalent heaps
     for h in heaps:
         h.rename()
+    # Each heap's fingerprint is computed here, once, and compared by hash. is_equivalent only on collisions
     heaps_out = []
+    index = {}
     for h in heaps:
-        equivalents = [heap for heap in heaps_out if h.is_equivalent(heap) or heap is h]
-        if not equivalents:
-            heaps_out.append(h)
-        
+        add_distinct_heap(h, heaps_out, index)
     return heaps_out
             
 def coerce_red(heaps):
@@ -1541,158 +4441,7 @@ def coerce_red(heaps):
     # every coercion property holds that if X |> Y then if X is 1, Y must be 1. if Y = 1/2, make it 1. if Y = 0, discard heap
     #                                                   if X is 0, Y must be 0. if Y = 1/2, make it 0, if Y = 1, discard heap
     # Expressions on the left hand side must be evaluated (reachable, etc...) while on the rhs its only the instrumentation predicates
-    i = 0
-    # increment i every iteration. If discarded heap, do not increment
-    while len(heaps) > i:
-        # Variable coercions:
-        # \forall x in vars, x(v1) and x(v2) |> v1 = v2
-        heap = heaps[i]
-        items_except_null = [u for u in heap.heap_items if u != NULL]
-        discard = 0
-        for x in heap.var_pts_to.keys():
-            x_points_to = [addr for addr in heap.heap_items if heap.var_pts_to[x][addr] != LOGIC3_0]
-            # v1 = v2 is never half. only discarding is possible with this coercion
-            if len (x_points_to) > 1:
-                discard = 1
-                break           
-        if discard == 1:
-            heaps.remove(heap)
-            continue
-            
-        # exists v3: n(v3, v1) and n(v3,v2) |> v1 = v2
-        for v3 in heap.heap_items:
-            item_definite_nexts = [addr for addr in heap.heap_items if heap.next[v3][addr] == LOGIC3_1 ]
-            j = 0
-            while len(item_definite_nexts) > 1:
-                v1 = item_definite_nexts[j]
-                v2 =  item_definite_nexts[j+1]
-                if heap.is_mergable(v1, v2) == LOGIC3_0:
-                    discard = 1
-                    break
-                elif v1 != v2:
-                    item_definite_nexts.remove(v1)
-                    item_definite_nexts.remove(v2)
-                    merged = heap.merge(min(v1,v2), max(v1, v2))
-                    item_definite_nexts.append(merged)
-            if discard == 1:
-                break
-        if discard == 1:
-            heaps.remove(heap)
-            continue
-        
-        # x(v) or (exists v1 : x(v1) and n*(v1,v)) |> reachable(x,v)
-        for x in heap.var_pts_to.keys():
-            for v in heap.heap_items:
-                # phi = (exists v1 : x(v1) and n*(v1,v))
-                phi = LOGIC3_0
-                for v1 in heap.heap_items:
-                    phi = or3(phi, and3(heap.var_pts_to[x][v1], heap.check_reachable(v1,v)))
-                LHS = or3(heap.var_pts_to[x][v], phi)
-                # if reachable(x,v) is indefinite, set it the evaluated LHS
-                if heap.reachable[x][v] == LOGIC3_HALF:
-                    heap.reachable[x][v] = LHS
-                # If LHS is definite and reachable != 1/2 and != LHS
-                elif LHS != LOGIC3_HALF and heap.reachable[x][v] != LHS:
-                    discard = 1
-                    break
-            if discard == 1:
-                break
-        if discard == 1:
-            heaps.remove(heap)
-            continue
-        
-
-        # (exists v1: not is_shared(v) and v1!=v2 and n(v1,v)) |> not n(v2,v)
-        # if v is not shared and is v1's next, it isn't anyone else's next
-        for v in heap.heap_items:
-            if v != NULL:
-                for v2 in heap.heap_items:
-                    phi = LOGIC3_0
-                    # phi = (exists v1: not is_shared(v) and v1!=v2 and n(v1,v))
-                    for v1 in heap.heap_items:
-                        phi = or3(phi, and3(and3(not3(heap.is_shared[v]), v1 != v2), heap.next[v1][v]))
-                    # if v isn't shared and v1 is its predecessor, it can't be that v2!=v1 points to it so discard
-                    if phi == LOGIC3_1 and heap.next[v2][v] == LOGIC3_1:
-                        discard = 1
-                        break
-                    # If phi is definite 1 and n(v2,v) isn't definite, it must be a 0
-                    elif phi == LOGIC3_1:
-                        heap.next[v2][v] = LOGIC3_0
-                if discard == 1:
-                    break
-        if discard == 1:
-            heaps.remove(heap)
-            continue
-        
-        # exists v: not is_shared(v) and n(v1,v) and n(v2,v) |> v1 = v2
-        for v in heap.heap_items:
-            merged = 0
-            for v1 in heap.heap_items:
-                for v2 in heap.heap_items:
-                        LHS = and3(not3(heap.check_shared(v)), and3(heap.next[v1][v], heap.next[v2][v]))
-                        if LHS == LOGIC3_1:
-                            # v1 = v2 is only a 2-val predicate...
-                            if v1 != v2:
-                                discard = 1
-                                break
-                            elif v1 != v2 and heap.is_mergable(v1,v2):
-                                merged = 1
-                                heap.merge(min (v1,v2), max(v1,v2))
-                                # If merged, heap.heap_items had changed, so need to restart whole loop
-                                break
-                if merged == 1: break
-            if merged == 1:
-                continue
-            if discard == 1:
-                break
-        if discard == 1:
-            heaps.remove(heap)
-            continue
-        
-        # n*(v1,v1) |> c(v1)
-        for v in items_except_null:
-            c = heap.check_cycle(v)
-            if c != LOGIC3_HALF:
-                if c != heap.in_cycle[v] and heap.in_cycle[v] != LOGIC3_HALF:
-                    discard = 1
-                    break
-                else:
-                    # Didn't discard because they're not contradicting - so put calculated 'c' in
-                    heap.in_cycle[v] = c
-        if discard == 1:
-            heaps.remove(heap)
-            continue
-        
-        # \exists v1,v2 : v1 != v2 and n(v1,v) and n(v2,v) |> is_shared(v)
-        for v in items_except_null:
-            predecessors = set([u for u in items_except_null if 
-                                heap.next[u][v] != LOGIC3_0])
-            # more than one predecessor
-            if len(predecessors) > 1:
-                definite_predecessors = set([u for u in items_except_null if 
-                                heap.next[u][v] == LOGIC3_1])
-                if len(definite_predecessors) > 1:
-                    # two definite predecessors. If is_shared == 0 - discard. else, update is_shared to 1
-                    if heap.is_shared[v] == LOGIC3_0:
-                        discard = 1
-                        break
-                    else:
-                        heap.is_shared[v] = LOGIC3_1
-                # More than one predecessor, only 1 or less definite - maybe shared
-                else:
-                    heap.is_shared[v] = LOGIC3_HALF
-            # Only one or less predecessor:
-            elif heap.is_shared[v] == LOGIC3_1:
-                discard = 1
-                break
-            else:
-                heap.is_shared[v] = LOGIC3_0
-        if discard == 1:
-            heaps.remove(heap)
-            continue
-        
-        i += 1
-    return heaps
+    return [heap for heap in heaps if heap.coerce()]
     
 def heaps_join(heaps1, heaps2):
     """
@@ -1702,15 +4451,234 @@ def heaps_join(heaps1, heaps2):
     @output: list of heaps - join(heaps1, heaps2)
     """
     # Merge two lists. get rid of duplicates.
-    heaps_out = deepcopy(heaps1) 
+    # Heaps stored in a state are never edited in place (transformers work on copies), so they need no copy
+    heaps_out = []
+    index = {}
+    for h in heaps1:
+        index.setdefault(h.fingerprint(), []).append(h)
+        heaps_out.append(h)
     for h in heaps2:
-        equivalents = [heap for heap in heaps_out if h.is_equivalent(heap) or heap is h]
-        if not equivalents:
-            heaps_out.append(h)
-        
-        # heaps_out = filter(lambda x:  (not h.is_equivalent(x)) or x is h, heaps_out)
+        add_distinct_heap(h, heaps_out, index)
     return heaps_out
 
+def partial_join(heaps, max_heaps):
+    """
+    Joins heaps that agree on the variable-pointer abstraction until at most 'max_heaps' are left.
+    The largest groups of agreeing heaps are joined first, each into a single heap, then canonical_abstraction.
+    Heaps agree when they have the same heap items, every variable points to the same item and the same items
+    are summary nodes (variable_summary_key): they are joined predicate-wise, 'next' included (join_compact).
+    If that leaves more than 'max_heaps', heaps agree when their variables alias alike (variable_alias_key), and
+    are joined on their variables' items and the list segments between them (join_aliased).
+    A joined heap represents every heap of its group, but less precisely: focus splits the 'next' it
+    left 1/2 again when a transformer reads it (see Heap.joined).
+    A heap needs every variable to point to one item, so heaps where the variables alias differently are never
+    joined: if a state has more aliasings than 'max_heaps', it keeps one heap for each
+    @input: list of Heap heaps - canonical, like the heaps of a State
+            int max_heaps
+    @output: 2-tuple (list of Heap, int - number of heaps joined into others)
+    """
+    bounded = heaps
+    for key_function, join in ((variable_summary_key, join_compact_group), (variable_alias_key, join_aliased)):
+        if len(bounded) <= max_heaps:
+            break
+        groups = {}
+        for heap in bounded:
+            data = heap.compact()
+            groups.setdefault(key_function(data), []).append((heap, data))
+        count = len(bounded)
+        joined = {}
+        for key in sorted(groups, key = lambda key: -len(groups[key])):
+            group = groups[key]
+            if count <= max_heaps or len(group) < 2:
+                break
+            data = join([data for heap, data in group])
+            joined[key] = canonical_abstraction([type(group[0][0]).from_compact(data)])
+            count -= len(group) - len(joined[key])
+        bounded = []
+        for key, group in groups.items():
+            bounded += joined[key] if key in joined else [heap for heap, data in group]
+    return bounded, len(heaps) - len(bounded)
+
+def free_addresses(items, max_heap_index):
+    """
+    Returns the addresses up to max_heap_index that no heap item uses, as Heap._free
+    @input: iterable of heap items
+            int max_heap_index
+    @output: sorted list of int
+    """
+    used = set(items)
+    return [v for v in range(1, max_heap_index + 1) if v not in used]
+
+def variable_summary_key(data):
+    """
+    Returns what heaps partial_join joins predicate-wise must agree on
+    @input: 6-tuple data - a heap in compact form (see Heap.compact)
+    @output: tuple - heap items, var_pts_to and is_summary
+    """
+    variables, items, max_heap_index, codes, fingerprint, joined = data
+    n = len(items)
+    m = len(variables) * n
+    # compact bytes: var_pts_to, reachable, next, is_summary, in_cycle, is_shared
+    return (items, codes[:m], codes[2 * m + n * n:2 * m + n * n + n])
+
+def variable_alias_key(data):
+    """
+    Returns what heaps join_aliased joins must agree on: which variables point to NULL, and which to the same item
+    @input: 6-tuple data - a heap in compact form (see Heap.compact)
+    @output: tuple - for every variable, -1 if it points to NULL, else the first variable pointing to its item
+    """
+    variables, items, max_heap_index, codes, fingerprint, joined = data
+    n = len(items)
+    targets = [codes[k * n:(k + 1) * n].index(ARRAY3_1) for k in range(len(variables))]
+    null = items.index(NULL)
+    return tuple(-1 if target == null else targets.index(target) for target in targets)
+
+def join_compact(data1, data2):
+    """
+    Predicate-wise join3 of two heaps in compact form (see Heap.compact) with the same heap items
+    @input: 6-tuple data1, data2
+    @output: 6-tuple - joined
+    """
+    variables, items, max_heap_index, codes1, fingerprint, joined = data1
+    codes = bytes(c1 if c1 == c2 else ARRAY3_HALF for c1, c2 in zip(codes1, data2[3]))
+    return (variables, items, max(max_heap_index, data2[2]), codes, None, True)
+
+def join_compact_group(datas):
+    """
+    Predicate-wise join3 of heaps in compact form with the same heap items (see join_compact)
+    @input: list of 6-tuple datas
+    @output: 6-tuple - joined
+    """
+    data = datas[0]
+    for other in datas[1:]:
+        data = join_compact(data, other)
+    return data
+
+def join_aliased(datas):
+    """
+    Joins heaps in compact form whose variables alias alike (see variable_alias_key), whatever their items.
+    The items of every heap are sorted into classes: NULL, the item of each variable (named by the first
+    variable pointing to it), and for the other items, the variables' items they are reachable from without
+    passing another variable's item (the list segments after them, garbage for none). Each class is an item of
+    the joined heap, a summary node if it has more than one item or a summary in some heap, or no items in some.
+    Its predicates in every heap are the join3 of those of its items ('next' between two classes is 1/2 unless
+    both are single items that are not summary nodes), 0 for a class without items, and are then join3-ed over the heaps.
+    A class a heap has no items of stands for unreachable items, which no transformer or condition can see
+    @input: list of 6-tuple datas - heaps in compact form (see Heap.compact), with the same variables
+    @output: 6-tuple - the joined heap in compact form
+    """
+    variables = datas[0][0]
+    heaps = []
+    classes = set()
+    for variables, items, max_heap_index, codes, fingerprint, joined in datas:
+        n = len(items)
+        v = len(variables)
+        rows = [codes[k:k + n] for k in range(0, len(codes), n)]
+        # compact bytes: var_pts_to, reachable, next, is_summary, in_cycle, is_shared
+        heap = {"pts": rows[:v], "reach": rows[v:2 * v], "next": rows[2 * v:2 * v + n],
+                "summary": rows[2 * v + n], "cycle": rows[2 * v + n + 1], "shared": rows[2 * v + n + 2]}
+        named = {items.index(NULL): ("null",)}
+        for k in range(v):
+            named.setdefault(heap["pts"][k].index(ARRAY3_1), ("variable", k))
+        # The variables' items every other item is reachable from, not passing another one
+        owners = dict((i, set()) for i in range(n) if i not in named)
+        for i, name in named.items():
+            nextq = deque([i])
+            while nextq:
+                row = heap["next"][nextq.popleft()]
+                for j in range(n):
+                    if row[j] != ARRAY3_0 and j not in named and name not in owners[j]:
+                        owners[j].add(name)
+                        nextq.append(j)
+        members = {}
+        for i in range(n):
+            members.setdefault(named[i] if i in named else ("segment",) + tuple(sorted(owners[i])), []).append(i)
+        heap["members"] = members
+        classes.update(members)
+        heaps.append(heap)
+    # NULL first, then the other classes as items 1..n
+    classes = [("null",)] + sorted(c for c in classes if c != ("null",))
+    items = (NULL,) + tuple(range(1, len(classes)))
+
+    def join_values(values):
+        values = set(values)
+        return values.pop() if len(values) == 1 else ARRAY3_HALF
+
+    def class_value(heap, row, c):
+        members = heap["members"].get(c)
+        return join_values(row[i] for i in members) if members else ARRAY3_0
+
+    def class_next(heap, c1, c2):
+        if c1 not in heap["members"] or c2 not in heap["members"]:
+            return ARRAY3_0
+        sources = heap["members"][c1]
+        destinations = heap["members"][c2]
+        edges = [heap["next"][i][j] for i in sources for j in destinations]
+        if len(edges) == 1 and heap["summary"][sources[0]] == ARRAY3_0 and heap["summary"][destinations[0]] == ARRAY3_0:
+            return edges[0]
+        # Like merge: a summary is never definitely anyone's next, and never has a definite next
+        return ARRAY3_HALF if any(edges) else ARRAY3_0
+
+    is_summary = [ARRAY3_1 if any(c not in heap["members"] or len(heap["members"][c]) > 1 or
+                                  heap["summary"][heap["members"][c][0]] == ARRAY3_1 for heap in heaps)
+                  else ARRAY3_0 for c in classes]
+    codes = bytearray()
+    for table in ("pts", "reach"):
+        for k in range(len(variables)):
+            codes.extend(join_values(class_value(heap, heap[table][k], c) for heap in heaps) for c in classes)
+    for a, c1 in enumerate(classes):
+        for b, c2 in enumerate(classes):
+            # Like merge: a summary may point to itself
+            if a == b and is_summary[a] == ARRAY3_1:
+                codes.append(ARRAY3_HALF)
+            else:
+                codes.append(join_values(class_next(heap, c1, c2) for heap in heaps))
+    codes.extend(is_summary)
+    for a, c in enumerate(classes):
+        # Like merge: a summary may be in a cycle
+        if is_summary[a] == ARRAY3_1:
+            codes.append(ARRAY3_HALF)
+        else:
+            codes.append(join_values(class_value(heap, heap["cycle"], c) for heap in heaps))
+    codes.extend(join_values(class_value(heap, heap["shared"], c) for heap in heaps) for c in classes)
+    return (variables, items, len(items) - 1, bytes(codes), None, True)
+
+def add_distinct_heap(heap, heaps_out, index):
+    """
+    Appends 'heap' to heaps_out unless an equivalent heap is already there.
+    Only heaps with the same fingerprint are compared with is_equivalent
+    @input: Heap heap
+            list of Heap heaps_out
+            dictionary of fingerprint to list of Heap - index of heaps_out, updated as well
+    @output: bool - whether 'heap' was added
+    """
+    same_fingerprint = index.setdefault(heap.fingerprint(), [])
+    for other in same_fingerprint:
+        if other is heap or heap.is_equivalent(other):
+            return False
+    same_fingerprint.append(heap)
+    heaps_out.append(heap)
+    return True
+
+def subsumption_key(codes):
+    """
+    Returns the key subsumes compares heaps by
+    @input: bytes codes - the predicates of a heap, as Heap._predicate_bytes
+    @output: 2-tuple (int - the predicates, int - 0xFF in every byte of a definite predicate, else 0)
+    """
+    return (int.from_bytes(codes, "big"), int.from_bytes(codes.translate(ARRAY3_DEFINITE), "big"))
+
+def subsumes(key1, key2):
+    """
+    Checks whether a heap subsumes another with the same heap items in the 3-valued information order:
+    every predicate definite in the first is the same in the second (0, 1 below 1/2),
+    so the first represents every heap the second represents
+    @input: subsumption_key of both heaps - key1, key2
+    @output: bool
+    """
+    predicates1, definite1 = key1
+    return predicates1 & definite1 == key2[0] & definite1
+
 def or3(arg1, arg2):
     """
     Returns the Kleene 3-value logical OR
@@ -1759,23 +4727,154 @@ def join3(arg1, arg2):
 
 
     
+class HeapRenderer:
+    """
+    Output stage saving pictures of the heaps of states as PNG files.
+    Heaps are queued (as Heap.compact data) to a background worker process, which draws them with the headless
+    Agg backend, so drawing does not hold the analysis up. Call close (or use 'with') to wait for the pictures
+    Fields:
+        * string directory - where the pictures are saved
+        * list of string - files. Pictures queued so far (see png_names)
+        * list of (state name, list of compact heaps) - queued. Heaps queued when there is no worker (workers = 0)
+        * ProcessPoolExecutor - _pool
+        * list of Future - _pending
+    """
+    def __init__(self, directory = ".", workers = 1):
+        """
+        Constructor
+        @input: string directory
+                int workers - number of worker processes. 0 = only queue the heaps, in 'queued'
+        """
+        self.directory = directory
+        self.files = []
+        self.queued = []
+        self._pool = ProcessPoolExecutor(workers, initializer = use_headless_backend) if workers > 0 else None
+        self._pending = []
+
+    def draw_state(self, state):
+        """
+        Queues the heaps of 'state' to draw
+        @input: State state
+        """
+        self.draw_heaps(state.name, [heap.compact() for heap in state.heaps])
+
+    def draw_heaps(self, name, compact_heaps):
+        """
+        Queues heaps to draw, as pictures of the state called 'name'
+        @input: string name
+                list of compact heaps (see Heap.compact)
+        """
+        if self._pool is None:
+            self.queued.append((name, compact_heaps))
+            return
+        filenames = png_names(name, len(compact_heaps), self.directory)
+        self.files += filenames
+        self._pending.append(self._pool.submit(render_heaps, compact_heaps, filenames))
+        if filenames:
+            print("Heaps of state analyzed will be saved in:" + filenames[0][:-len("1.png")] + "$heap_index.png")
+
+    def close(self):
+        """
+        Waits for every queued picture and stops the worker
+        @output: list of string - the files saved
+        """
+        if self._pool is not None:
+            try:
+                for future in self._pending:
+                    future.result()
+            finally:
+                self._pending = []
+                self._pool.shutdown()
+                self._pool = None
+        return self.files
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def use_headless_backend():
+    """
+    Draws with the Agg backend, which needs no display. Runs in the worker processes of HeapRenderer
+    """
+    import_drawing(headless = True)
+
+def render_heaps(compact_heaps, filenames):
+    """
+    Saves a picture of every heap. Runs in the worker processes of HeapRenderer
+    @input: list of compact heaps (see Heap.compact)
+            list of string filenames - one for every heap
+    """
+    import_drawing(headless = True)
+    for i, (data, filename) in enumerate(zip(compact_heaps, filenames)):
+        create_drawing(Heap.from_compact(data), i)
+        plt.savefig(filename)
+        cd()
+
+def import_numpy():
+    """
+    Imports numpy on first use, so analyzing with the dict backend does not load it
+    """
+    global np
+    if np is None:
+        try:
+            import numpy as np
+        except ImportError:
+            raise ImportError("The numpy heap backend requires numpy")
+
+def import_drawing(headless = False):
+    """
+    Imports networkx and matplotlib.pyplot on first use, so analyzing without drawing does not load them
+    @input: bool headless - draw with the Agg backend, which needs no display
+    """
+    global nx, plt
+    if headless:
+        import matplotlib
+        if plt is None:
+            matplotlib.use("Agg")
+        elif matplotlib.get_backend().lower() != "agg":
+            plt.switch_backend("Agg")
+    if plt is None:
+        import networkx as nx
+        import matplotlib.pyplot as plt
+
+# Names of saved pictures: time this module was loaded, process and number of the state drawn in the process
+PNG_RUN = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+_png_count = itertools.count(1)
+
+def png_names(state_name, count, directory = "."):
+    """
+    Returns unique file names for the pictures of the heaps of a state
+    @input: string state_name
+            int count - number of heaps
+            string directory
+    @output: list of string - 'ShapeAnalysisOf$time$-$process$-$number$-$state$-heap=$heap_index$.png'
+    """
+    prefix = ("ShapeAnalysisOf" + PNG_RUN + "-" + str(os.getpid()) + "-" + str(next(_png_count)) + "-" +
+              state_name + "-heap=")
+    return [os.path.join(directory, prefix + str(i) + ".png") for i in range(1, count + 1)]
+
+
 def create_drawing(heap,index):
     """
     For use while the program is running. prints the given heap using networkx framework
     @input: heap
             index - index of sub-graph for multiple graph printing
     """
+    import_drawing()
     G = nx.DiGraph()
     # Add nodes
     G.add_nodes_from(heap.heap_items, type = 'heap')
     summary_items = [v for v in heap.heap_items if heap.is_summary[v] == LOGIC3_1]
     G.add_nodes_from(summary_items, type = 'sum')
     for v in G.nodes:
-        G.node[v]['label'] = v
+        G.nodes[v]['label'] = v
         for x in heap.var_pts_to.keys():
             field_name = "reachable" + str(x)
             G.nodes[v][field_name] = heap.reachable[x][v]
-    G.add_nodes_from([NULL], type = 'NULL')
+    G.add_nodes_from([NULL], type = 'NULL', label = NULL_VAR)
     # Add edges using "next"
     edges_definite = []
     for v1 in heap.heap_items:
@@ -1793,8 +4892,10 @@ def create_drawing(heap,index):
         G.add_edge(v,v, type= 'maybe')
     # Add variable pointers
     var_ptrs = []
-    G.add_nodes_from(heap.var_pts_to.keys(), type ='vars')
-    for x in heap.var_pts_to.keys():
+    # The NULL node stands for the NULL_VAR variable too
+    variables = [x for x in heap.var_pts_to.keys() if x != NULL_VAR]
+    G.add_nodes_from(variables, type ='vars')
+    for x in variables:
         pointed_item = [v for v in heap.heap_items if heap.var_pts_to[x][v] == LOGIC3_1][0]
         var_ptrs.append((x,pointed_item))
     G.add_edges_from(var_ptrs, type= 'var_pts_to') 
@@ -1818,29 +4919,31 @@ def create_drawing(heap,index):
                            edge_color= 'black', style='dashdot', alpha= 0.5,
                            arrowsize=10, width = 3)
     nx.draw_networkx_nodes(G,pos, nodelist=summary_nodes ,
-                            with_labels = True, node_size = 800,
+                            node_size = 800,
                             node_color= 'black', alpha= 0.4)
     nx.draw_networkx_nodes(G,pos, nodelist=var_nodes ,
-                            with_labels = True, node_size = 400,
+                            node_size = 400,
                             node_color= 'blue')
     nx.draw_networkx_nodes(G,pos, nodelist=heap_nodes ,
-                            with_labels = True, node_size = 500,
+                            node_size = 500,
                             node_color= 'red')
     nx.draw_networkx_nodes(G,pos, nodelist=[NULL] ,
-                            with_labels = True, node_size = 600,
+                            node_size = 600,
                             node_color= 'red', alpha= 0.5)
 
-    nx.draw_networkx_labels(G,pos)
+    nx.draw_networkx_labels(G, pos, labels = dict((v, G.nodes[v].get('label', v)) for v in G.nodes))
     plt.axis('off')
     return fig
 
 
 def draw(heap):
+    import_drawing()
     create_drawing(heap,0)
     plt.show()
 
 
 def draw_state(state):
+    import_drawing()
     i = 0
     for heap in state.heaps:
         create_drawing(heap,i)
@@ -1848,32 +4951,22 @@ def draw_state(state):
     plt.show()
     
 def draw_state_to_png(state):
-    i = 0
-    for heap in state.heaps:
+    """
+    Saves pictures of the heaps of 'state' now, in this process (see HeapRenderer to draw in the background)
+    """
+    import_drawing()
+    filenames = png_names(state.name, len(state.heaps))
+    for i, (heap, filename) in enumerate(zip(state.heaps, filenames)):
         create_drawing(heap, i)
-        i+=1
-        plt.savefig('ShapeAnalysisOf'  + 
-          str(datetime.now().hour) + 
-          str(datetime.now().minute) + 
-          str(datetime.now().second) +
-          state.name +
-          "heap=" +
-          str(i) + 
-          '.png')
+        plt.savefig(filename)
         cd()
     print("Heaps of state analyzed were saved in:" + 
-          'ShapeAnalysisOf'  + 
-          str(datetime.now().hour) + 
-          str(datetime.now().minute) + 
-          str(datetime.now().second) +
-          state.name +
-          "heap=" +
-          "$heap_index"
-          '.png')
+          'ShapeAnalysisOf' + PNG_RUN + "-" + str(os.getpid()) + "-$number-" + state.name + "-heap=$heap_index.png")
 
     
 
 def cd():
+    import_drawing()
     plt.clf()
     plt.close()
     
@@ -1883,6 +4976,7 @@ def draw_cfg(cfg):
     @input: heap
             index - index of sub-graph for multiple graph printing
     """
+    import_drawing()
     G = nx.DiGraph()
     # Add nodes
     G.add_nodes_from(cfg.states, type = 'state')
@@ -1905,7 +4999,7 @@ def draw_cfg(cfg):
     nx.draw_networkx_edges(G, pos, edgelist=edges,  edge_color= 'black',
                            arrowstyle='->', arrowsize=5, width = 2)
     nx.draw_networkx_nodes(G,pos, nodelist=nodes ,
-                            with_labels = True, node_size = 400,
+                            node_size = 400,
                             node_color= 'blue', alpha= 0.8)
     nx.draw_networkx_edge_labels(G, pos, font_size=9,
                                  edge_labels=labels)
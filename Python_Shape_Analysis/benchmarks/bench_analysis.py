@@ -0,0 +1,106 @@
+"""
+Benchmark of the shape analysis on the generated linked list programs of programs.py.
+For every program reports the wall time of Cfg.__init__ (parse) and Cfg.analyze, the peak memory of both
+(tracemalloc, measured in a separate run since tracing slows the analysis down), the fixpoint iterations,
+the heaps of all states at the end and the verdict.
+Usage: python bench_analysis.py [--families create reverse ...] [--lists 1 2] [--nesting 1 2]
+                                [--backend dict|numpy] [--strategy fifo|...] [--repeat N] [--json FILE]
+                                [--no-memory] [--write DIRECTORY]
+"""
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import contextlib
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import SA
+from programs import FAMILIES, generate
+
+
+def run_program(code, backend, strategy):
+    """
+    Parses and analyzes 'code', without printing
+    @input: string code
+            backend, strategy - see Cfg.analyze
+    @output: 3-tuple (Cfg graph, float parse seconds, float analyze seconds)
+    """
+    start = time.perf_counter()
+    graph = SA.Cfg(code)
+    parsed = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        graph.analyze(backend, strategy)
+    return graph, parsed - start, time.perf_counter() - parsed
+
+
+def measure(name, code, backend, strategy, repeat = 1, memory = True):
+    """
+    Benchmarks a program
+    @input: string name, code
+            backend, strategy - see Cfg.analyze
+            int repeat - runs to time. The fastest is reported
+            bool memory - whether to measure peak memory, in one more run
+    @output: dictionary - the record of the program
+    """
+    runs = [run_program(code, backend, strategy) for _ in range(repeat)]
+    graph = runs[0][0]
+    record = {"program": name, "edges": len(graph.edges), "states": len(graph.states),
+              "parse": min(run[1] for run in runs), "analyze": min(run[2] for run in runs),
+              "peak_bytes": None, "iterations": graph.stats["iterations"],
+              "heaps": sum(len(state.heaps) for state in graph.states.values()),
+              "max_state_heaps": max(len(state.heaps) for state in graph.states.values()),
+              "verdict": graph.verdict}
+    if memory:
+        tracemalloc.start()
+        try:
+            run_program(code, backend, strategy)
+            record["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark the shape analysis on generated list programs")
+    parser.add_argument("--families", nargs = "+", choices = sorted(FAMILIES), default = list(FAMILIES))
+    parser.add_argument("--lists", nargs = "+", type = int, default = [1], help = "lists per program")
+    parser.add_argument("--nesting", nargs = "+", type = int, default = [1], help = "loop nesting depths")
+    parser.add_argument("--backend", choices = sorted(SA.HEAP_BACKENDS), default = SA.HEAP_BACKEND_DICT)
+    parser.add_argument("--strategy", choices = sorted(SA.WORKLISTS), default = SA.WORKLIST_FIFO)
+    parser.add_argument("--repeat", type = int, default = 1, help = "timed runs per program, the fastest is reported")
+    parser.add_argument("--no-memory", action = "store_true", help = "skip the peak memory run")
+    parser.add_argument("--json", help = "also write the records to this file, as a JSON list")
+    parser.add_argument("--write", help = "only write the programs to this directory, as $family$-$lists$-$nesting$.txt")
+    args = parser.parse_args()
+    programs = [("%s-%d-%d" % (family, lists, nesting), generate(family, lists, nesting))
+                for family in args.families for lists in args.lists for nesting in args.nesting]
+    if args.write:
+        os.makedirs(args.write, exist_ok = True)
+        for name, code in programs:
+            with open(os.path.join(args.write, name + ".txt"), "w") as codefile:
+                codefile.write(code + "\n")
+        print("Wrote " + str(len(programs)) + " programs to " + args.write)
+        return
+    header = "%-16s %6s %9s %10s %10s %6s %7s %6s  %s" % ("program", "edges", "parse ms", "analyze s", "peak MB",
+                                                       "iters", "heaps", "max", "verdict")
+    print(header)
+    records = []
+    for name, code in programs:
+        record = measure(name, code, args.backend, args.strategy, args.repeat, not args.no_memory)
+        records.append(record)
+        peak = "-" if record["peak_bytes"] is None else "%.1f" % (record["peak_bytes"] / 2 ** 20)
+        print("%-16s %6d %9.1f %10.3f %10s %6d %7d %6d  %s" % (name, record["edges"], 1000 * record["parse"],
+              record["analyze"], peak, record["iterations"], record["heaps"], record["max_state_heaps"],
+              record["verdict"]))
+    print("%-16s %6s %9.1f %10.3f" % ("total", "", 1000 * sum(r["parse"] for r in records),
+                                      sum(r["analyze"] for r in records)))
+    if args.json:
+        with open(args.json, "w") as out:
+            json.dump({"backend": args.backend, "strategy": args.strategy, "records": records}, out, indent = 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+Startup benchmark: time to import SA in a fresh interpreter, without and with the optional modules
+(numpy for the ArrayHeap backend, networkx and matplotlib to draw), which SA only imports on first use.
+Usage: python bench_startup.py [--runs N]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+SA_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Code timed in a fresh interpreter, by what it loads
+CASES = [("python (interpreter only)", "pass"),
+         ("import SA (analysis core)", "import SA"),
+         ("  + numpy backend", "import SA; SA.import_numpy()"),
+         ("  + drawing (networkx, matplotlib)", "import SA; SA.import_drawing(headless = True)")]
+
+
+def time_startup(code, runs):
+    """
+    Runs 'code' in 'runs' fresh interpreters
+    @input: string code
+            int runs
+    @output: list of float - wall time of every run in seconds, from process start to exit
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], cwd = SA_DIRECTORY, check = True,
+                       env = dict(os.environ, MPLBACKEND = "Agg"))
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description = "Import time of SA and its optional modules")
+    parser.add_argument("--runs", type = int, default = 10)
+    args = parser.parse_args()
+    print("%-36s %10s %10s" % ("", "median ms", "min ms"))
+    for name, code in CASES:
+        times = time_startup(code, args.runs)
+        print("%-36s %10.1f %10.1f" % (name, 1000 * statistics.median(times), 1000 * min(times)))
+
+
+if __name__ == "__main__":
+    main()
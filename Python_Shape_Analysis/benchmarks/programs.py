@@ -0,0 +1,182 @@
+"""
+Generated linked list programs in the Cfg input format, for benchmarking the shape analysis.
+Every family takes:
+    lists   - number of lists the program works on, each with its own variables (x1, t1, ... x2, t2, ...)
+    nesting - loop nesting depth. The operation on every list runs inside nesting - 1 nondeterministic loops
+and returns the code as a string. The same parameters always give the same program
+"""
+
+class Program:
+    """
+    Builds a program edge by edge: every command goes from the current label to a new one
+    Fields:
+        * list of string - variables
+        * list of string - lines. '$pre-state$ $command$ $post-state$'
+        * string - current. Label of the next command
+        * int - labels. Number of labels used
+    """
+    def __init__(self, variables):
+        self.variables = list(variables)
+        self.lines = []
+        self.labels = 0
+        self.current = self.new_label()
+
+    def new_label(self):
+        self.labels += 1
+        return "L" + str(self.labels - 1)
+
+    def emit(self, *commands):
+        """
+        Adds commands in sequence, after the current label
+        """
+        for command in commands:
+            label = self.new_label()
+            self.edge(command, label)
+            self.current = label
+
+    def edge(self, command, destination):
+        """
+        Adds a command from the current label to 'destination', keeping the current label
+        """
+        self.lines.append(self.current + " " + command + " " + destination)
+
+    def loop(self, body, condition = "TRUE", exit_condition = "TRUE"):
+        """
+        while (condition) body. Both conditions TRUE = loop a nondeterministic number of times
+        @input: function body - adds the body
+                string condition, exit_condition - a condition and its negation
+        """
+        head = self.current
+        exit_label = self.new_label()
+        self.edge("assume(" + exit_condition + ")", exit_label)
+        self.emit("assume(" + condition + ")")
+        body()
+        self.edge("assume(TRUE)", head)
+        self.current = exit_label
+
+    def nest(self, nesting, body):
+        """
+        body, inside nesting - 1 nondeterministic loops
+        """
+        if nesting <= 1:
+            body()
+        else:
+            self.loop(lambda: self.nest(nesting - 1, body))
+
+    def code(self):
+        return "\n".join([" ".join(self.variables)] + self.lines)
+
+
+def list_variables(names, lists):
+    """
+    @output: list of dictionary - for every list, its name of each variable in 'names'
+    """
+    return [dict((name, name + str(i)) for name in names) for i in range(1, lists + 1)]
+
+def create(program, v, nonempty = False):
+    """
+    v[x] := a list of any length, built by adding nodes at its head
+    """
+    x, t = v["x"], v["t"]
+    program.emit(x + ":=NULL")
+    if nonempty:
+        program.emit(x + ":=new")
+    def push():
+        program.emit(t + ":=new", t + ".n:=" + x, x + ":=" + t)
+    program.loop(push)
+
+def walk(program, v, p):
+    """
+    p := some node of v[x], or NULL
+    """
+    x = v["x"]
+    program.emit(p + ":=" + x)
+    def step():
+        program.emit("assume(" + p + "!=NULL)", p + ":=" + p + ".n")
+    program.loop(step)
+
+def generate(family, lists = 1, nesting = 1):
+    """
+    @input: string family - one of FAMILIES
+            int lists, nesting
+    @output: string code
+    """
+    names, operation = FAMILIES[family]
+    variables = list_variables(names, lists)
+    program = Program([name for v in variables for name in v.values()])
+    for v in variables:
+        program.nest(nesting, lambda: operation(program, v))
+    return program.code()
+
+
+def op_create(program, v):
+    create(program, v, nonempty = True)
+    program.emit("assert(" + v["x"] + "!=NULL)")
+
+def op_traverse(program, v):
+    x, p = v["x"], v["p"]
+    create(program, v)
+    program.emit(p + ":=" + x)
+    program.loop(lambda: program.emit(p + ":=" + p + ".n"), p + "!=NULL", p + "==NULL")
+    program.emit("assert(" + p + "==NULL)")
+
+def op_reverse(program, v):
+    x, r, t = v["x"], v["r"], v["t"]
+    create(program, v, nonempty = True)
+    program.emit(r + ":=NULL")
+    def reverse_head():
+        program.emit(t + ":=" + x + ".n", x + ".n:=NULL", x + ".n:=" + r, r + ":=" + x, x + ":=" + t)
+    program.loop(reverse_head, x + "!=NULL", x + "==NULL")
+    program.emit("assert(" + r + "!=NULL)")
+
+def op_insert(program, v):
+    p, t, e = v["p"], v["t"], v["e"]
+    create(program, v, nonempty = True)
+    walk(program, v, p)
+    program.emit("assume(" + p + "!=NULL)", e + ":=new", t + ":=" + p + ".n", e + ".n:=" + t,
+                 p + ".n:=NULL", p + ".n:=" + e, "assert(LS " + p + " " + e + ")")
+
+def op_delete(program, v):
+    p, t, u = v["p"], v["t"], v["u"]
+    create(program, v, nonempty = True)
+    walk(program, v, p)
+    program.emit("assume(" + p + "!=NULL)", t + ":=" + p + ".n", "assume(" + t + "!=NULL)", u + ":=" + t + ".n",
+                 p + ".n:=NULL", p + ".n:=" + u, t + ":=NULL", "assert(" + p + "!=" + u + ")")
+
+def op_split(program, v):
+    p, y = v["p"], v["y"]
+    create(program, v, nonempty = True)
+    walk(program, v, p)
+    program.emit("assume(" + p + "!=NULL)", y + ":=" + p + ".n", p + ".n:=NULL",
+                 "assert(" + p + "!=" + y + ")")
+
+def op_merge(program, v):
+    x, y, p, t = v["x"], v["y"], v["p"], v["t"]
+    create(program, v, nonempty = True)
+    program.emit(y + ":=" + x)
+    create(program, v, nonempty = True)
+    # x and y are now two lists: append y at the end of x
+    program.emit(p + ":=" + x, t + ":=" + p + ".n")
+    program.loop(lambda: program.emit(p + ":=" + t, t + ":=" + p + ".n"), t + "!=NULL", t + "==NULL")
+    program.emit(p + ".n:=" + y, "assert(LS " + p + " " + y + ")")
+
+def op_cyclic(program, v):
+    x, p, t = v["x"], v["p"], v["t"]
+    create(program, v, nonempty = True)
+    # Close the list into a cycle, then go around it once
+    program.emit(p + ":=" + x, t + ":=" + p + ".n")
+    program.loop(lambda: program.emit(p + ":=" + t, t + ":=" + p + ".n"), t + "!=NULL", t + "==NULL")
+    program.emit(p + ".n:=" + x, p + ":=" + x + ".n")
+    program.loop(lambda: program.emit(p + ":=" + p + ".n"), p + "!=" + x, p + "==" + x)
+    program.emit("assert(LS " + x + " " + p + ")")
+
+
+# Family name -> (variables of each list, operation adding the program of a list)
+FAMILIES = {"create": (["x", "t"], op_create),
+            "traverse": (["x", "t", "p"], op_traverse),
+            "reverse": (["x", "t", "r"], op_reverse),
+            "insert": (["x", "t", "p", "e"], op_insert),
+            "delete": (["x", "t", "p", "u"], op_delete),
+            "split": (["x", "t", "p", "y"], op_split),
+            "merge": (["x", "t", "p", "y"], op_merge),
+            "cyclic": (["x", "t", "p"], op_cyclic)}
@@ -0,0 +1,69 @@
+"""
+Helpers of the tests: the programs they analyze, running the analysis quietly,
+and what two runs of the analysis must agree on (outcome)
+"""
+import io
+import os
+import sys
+import contextlib
+
+SA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SA_DIR)
+sys.path.insert(0, os.path.join(SA_DIR, "benchmarks"))
+import SA
+from programs import FAMILIES, generate
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def sample_programs():
+    """
+    Returns the sample programs next to SA.py
+    @output: list of 2-tuples (string file name, string code)
+    """
+    result = []
+    for name in sorted(os.listdir(SA_DIR)):
+        if name.startswith("ShapeAnalysis") and name.endswith(".txt"):
+            with open(os.path.join(SA_DIR, name)) as codefile:
+                result.append((name, codefile.read()))
+    return result
+
+def programs():
+    """
+    Returns the programs to analyze: the sample programs next to SA.py and one small program of every family
+    @output: list of 2-tuples (string name, string code)
+    """
+    return sample_programs() + [("%s-1-1" % family, generate(family, 1, 1)) for family in sorted(FAMILIES)]
+
+def analyze(code, **kwargs):
+    """
+    Parses and analyzes 'code' without printing
+    @input: string code
+            kwargs - see Cfg.analyze
+    @output: Cfg - analyzed
+    """
+    graph = SA.Cfg(code)
+    with contextlib.redirect_stdout(io.StringIO()):
+        graph.analyze(**kwargs)
+    return graph
+
+def heap_set(heaps):
+    """
+    Returns 'heaps' as a set of (heap_items, codes) of their compact form, to compare heaps of either backend
+    """
+    return set(heap.compact()[1:4:2] for heap in heaps)
+
+def outcome(graph):
+    """
+    Returns what every way of running the analysis must agree on
+    @input: Cfg graph - analyzed
+    @output: 2-tuple (verdict, dictionary state name -> set of heaps, see heap_set).
+             The heaps are left out if the analysis found an error: which heaps a state holds by then depends on
+             the order the states were analyzed in
+    """
+    if graph.verdict != SA.VERDICT_OK:
+        return graph.verdict, None
+    return graph.verdict, dict((name, heap_set(state.heaps)) for name, state in graph.states.items())
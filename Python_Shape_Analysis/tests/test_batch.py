@@ -0,0 +1,86 @@
+"""
+Checks batch runs: the JSON lines 'python SA.py --batch' writes, in order, one per program,
+its exit status, and that --max-heaps reaches the workers.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import subprocess
+
+from support import SA, SA_DIR, sample_programs
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.programs = os.path.join(self.directory, "programs")
+        os.makedirs(os.path.join(self.programs, "nested"))
+        self.samples = dict(sample_programs())
+        self.write("programs/loop.txt", self.samples["ShapeAnalysisBasicLoop.txt"])
+        self.write("programs/nested/cycle.txt", self.samples["ShapeAnalysisCycle.txt"])
+        # Not taken: does not match the pattern
+        self.write("programs/notes.md", "x\nL0 x:=new L1\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, code):
+        with open(os.path.join(self.directory, name), "w") as codefile:
+            codefile.write(code)
+
+    def run_batch(self, *args):
+        """
+        Runs 'python SA.py --batch' on the programs directory
+        @output: 2-tuple (int exit status, list of dictionary - the records)
+        """
+        output = os.path.join(self.directory, "records.jsonl")
+        process = subprocess.run([sys.executable, os.path.join(SA_DIR, "SA.py"), "--batch", self.programs,
+                                  "--jobs", "2", "--output", output] + list(args),
+                                 stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+        with open(output) as records:
+            return process.returncode, [json.loads(line) for line in records]
+
+    def test_all_ok(self):
+        status, records = self.run_batch()
+        self.assertEqual(status, 0)
+        self.assertEqual([os.path.relpath(record["file"], self.programs) for record in records],
+                         ["loop.txt", os.path.join("nested", "cycle.txt")])
+        for record in records:
+            self.assertEqual(record["verdict"], SA.VERDICT_OK)
+            self.assertIsNone(record["failed_command"])
+            self.assertGreater(record["stats"]["iterations"], 0)
+            self.assertEqual(set(record["timings"]), set(["parse", "analyze", "total"]))
+
+    def test_errors(self):
+        self.write("programs/null.txt", self.samples["ShapeAnalysisNullDereference.txt"])
+        self.write("programs/parse.txt", "x\nL0 x:=new\n")
+        status, records = self.run_batch()
+        self.assertEqual(status, 1)
+        verdicts = dict((os.path.basename(record["file"]), record["verdict"]) for record in records)
+        self.assertEqual(verdicts, {"loop.txt": SA.VERDICT_OK, "cycle.txt": SA.VERDICT_OK,
+                                    "null.txt": SA.VERDICT_NULL_DEREFERENCE, "parse.txt": SA.VERDICT_PARSE_ERROR})
+        null = [record for record in records if record["file"].endswith("null.txt")][0]
+        graph = SA.Cfg(self.samples["ShapeAnalysisNullDereference.txt"])
+        commands = set(edge.op.entire_command for edge in graph.edges)
+        self.assertIn(null["failed_command"], commands)
+        self.assertIn(null["failed_state"], graph.states)
+
+    def test_max_heaps(self):
+        status, records = self.run_batch("--max-heaps", "1")
+        self.assertEqual(status, 0)
+        self.assertGreater(sum(record["stats"]["capped_states"] for record in records), 0)
+
+    def test_single_run_options(self):
+        process = subprocess.run([sys.executable, os.path.join(SA_DIR, "SA.py"), "--batch", self.programs, "--draw"],
+                                 stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+        self.assertEqual(process.returncode, 2)
+        self.assertIn("--batch", process.stderr)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,132 @@
+"""
+Checks the bounded disjunction of Cfg.analyze(max_heaps = ...): errors are still found under every cap,
+every state keeps at most max(max_heaps, number of aliasings of its heaps) heaps, and the joins it is built on
+(partial_join, variable_alias_key, join_aliased) and the focus of the heaps they join.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import unittest
+
+from support import SA, FAMILIES, generate, sample_programs, programs, analyze
+
+CAPS = (1, 2, 4)
+
+
+def mutants():
+    """
+    Returns programs with an error: the sample programs with one, and the generated programs of every family
+    with a NULL guard removed or an assertion negated
+    @output: list of (string name, string code)
+    """
+    erroneous = [(name, code) for name, code in sample_programs() if analyze(code).verdict != SA.VERDICT_OK]
+    for family in sorted(FAMILIES):
+        lines = generate(family).split("\n")
+        for k, line in enumerate(lines):
+            src, command, dst = (line.split(" ") + ["", ""])[:3]
+            if command.startswith("assume(") and command.endswith("!=NULL)"):
+                mutant = "assume(TRUE)"
+            elif command.startswith("assert(") and "!=" in command:
+                mutant = command.replace("!=", "==")
+            else:
+                continue
+            erroneous.append(("%s-%s" % (family, src), "\n".join(lines[:k] + [" ".join([src, mutant, dst])] + lines[k + 1:])))
+    return [(name, code) for name, code in erroneous if analyze(code).verdict != SA.VERDICT_OK]
+
+def run(heap, *commands):
+    """
+    Returns 'heap' after the commands, which must not need focus
+    """
+    for command in commands:
+        heap = SA.Transformer(command).apply(heap.copy())
+    return heap
+
+def aliasings(heaps):
+    return len(set(SA.variable_alias_key(heap.compact()) for heap in heaps))
+
+
+class TestBounded(unittest.TestCase):
+
+    def test_errors_found_under_every_cap(self):
+        programs = mutants()
+        self.assertGreater(len(programs), len(FAMILIES))
+        for name, code in programs:
+            for max_heaps in CAPS:
+                with self.subTest(program = name, max_heaps = max_heaps):
+                    self.assertNotEqual(analyze(code, max_heaps = max_heaps).verdict, SA.VERDICT_OK)
+
+    def test_heaps_per_state(self):
+        for name, code in programs() + [("merge-2-1", generate("merge", 2))]:
+            for max_heaps in CAPS:
+                with self.subTest(program = name, max_heaps = max_heaps):
+                    graph = analyze(code, max_heaps = max_heaps)
+                    for state in graph.states.values():
+                        self.assertLessEqual(len(state.heaps), max(max_heaps, aliasings(state.heaps)))
+
+    def test_partial_join(self):
+        graph = analyze(generate("merge"))
+        heaps = max((state.heaps for state in graph.states.values()), key = len)
+        for max_heaps in (1, len(heaps) // 2):
+            with self.subTest(max_heaps = max_heaps):
+                bounded, joined = SA.partial_join(heaps, max_heaps)
+                self.assertEqual(len(bounded), len(heaps) - joined)
+                self.assertLessEqual(len(bounded), max(max_heaps, aliasings(heaps)))
+                # Joining never changes how the variables alias
+                self.assertEqual(aliasings(bounded), aliasings(heaps))
+                kept = set(id(heap) for heap in heaps)
+                for heap in bounded:
+                    self.assertEqual(heap.joined, id(heap) not in kept)
+        self.assertEqual(SA.partial_join(heaps, len(heaps)), (heaps, 0))
+
+    def test_variable_alias_key(self):
+        heap = run(SA.Heap(["x", "y", "z"]), "x:=new", "y:=x")
+        self.assertEqual(SA.variable_alias_key(heap.compact()), (0, 0, -1))
+        heap = run(heap, "z:=new", "x:=NULL")
+        self.assertEqual(SA.variable_alias_key(heap.compact()), (-1, 1, 2))
+
+    def test_join_aliased(self):
+        # x alone, and x followed by one more item: both have x on an item and t NULL
+        short = run(SA.Heap(["x", "t"]), "x:=new")
+        long = run(SA.Heap(["x", "t"]), "x:=new", "t:=new", "x.n:=t", "t:=NULL")
+        long = SA.canonical_abstraction([long])[0]
+        self.assertEqual(SA.variable_alias_key(short.compact()), SA.variable_alias_key(long.compact()))
+        joined = SA.Heap.from_compact(SA.join_aliased([short.compact(), long.compact()]))
+        self.assertTrue(joined.joined)
+        x = joined.get("x")
+        self.assertEqual(joined.get("t"), SA.NULL)
+        self.assertEqual(joined.is_summary[x], SA.LOGIC3_0)
+        # The item after x is in one heap only: a summary node x may point to
+        after = [v for v in joined.heap_items if v not in (SA.NULL, x)]
+        self.assertEqual(len(after), 1)
+        self.assertEqual(joined.is_summary[after[0]], SA.LOGIC3_1)
+        self.assertEqual(joined.next[x][after[0]], SA.LOGIC3_HALF)
+        self.assertEqual(joined.next[x][SA.NULL], SA.LOGIC3_HALF)
+        # Reading x.n splits it again: t is NULL in some heaps and not in others
+        transformed = SA.transfer(joined, SA.Transformer("t:=x.n"))
+        self.assertEqual(set(heap.get("t") == SA.NULL for heap in transformed), set([True, False]))
+        self.assertTrue(all(heap.joined for heap in transformed))
+
+    def test_focus_var_splits_joined_heaps_only(self):
+        # x points to a summary node which may point to two other items
+        heap = SA.Heap(["x"])
+        summary, a, b = [heap.new_node() for _ in range(3)]
+        heap._own(*SA.Heap._tables)
+        for v in (summary, a, b):
+            heap.next[v][SA.NULL] = SA.LOGIC3_0
+        heap.is_summary[summary] = SA.LOGIC3_1
+        heap.next[summary][summary] = SA.LOGIC3_HALF
+        heap.next[summary][a] = SA.LOGIC3_HALF
+        heap.next[summary][b] = SA.LOGIC3_HALF
+        heap.var_pts_to["x"][SA.NULL] = SA.LOGIC3_0
+        heap.var_pts_to["x"][summary] = SA.LOGIC3_1
+        self.assertRaises(SA.ErrorIllegalHeap, heap.focus_var, "x")
+        heap.joined = True
+        focused = heap.focus_var("x")
+        # The split summary, and the flattened one pointing to a, or to b
+        self.assertEqual(len(focused), 3)
+        self.assertEqual(sorted(h.next[summary][a] + h.next[summary][b] for h in focused[1:]),
+                         [SA.LOGIC3_1, SA.LOGIC3_1])
+        self.assertTrue(all(h.joined for h in focused))
+        self.assertTrue(SA.Heap.from_compact(heap.compact()).joined)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Checks TransferCache: its results, its LRU eviction under the entry and byte bounds,
+and that an analysis with a small cache reaches the same fixed point as one without.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import unittest
+
+from support import SA, programs, analyze, outcome, heap_set
+
+CODE = "\n".join(["x y", "L0 x:=new L1", "L1 y:=new L2", "L2 x.n:=y L3", "L3 x:=NULL L4"])
+
+
+class TestTransferCache(unittest.TestCase):
+
+    def setUp(self):
+        # Three heaps that are not equivalent, and the command 'x:=NULL' to transfer them along
+        graph = analyze(CODE)
+        self.heaps = [graph.states[name].heaps[0] for name in ("L1", "L2", "L3")]
+        self.transformer = [edge.op for edge in graph.edges if edge.src == "L3"][0]
+
+    def fill(self, cache, heaps):
+        for heap in heaps:
+            cache.transfer(heap, self.transformer)
+
+    def test_results(self):
+        cache = SA.TransferCache(0, 0)
+        for heap in self.heaps:
+            result = cache.transfer(heap, self.transformer)
+            self.assertEqual(heap_set(result), heap_set(SA.transfer(heap, self.transformer)))
+            self.assertIs(cache.transfer(heap.copy(), self.transformer), result)
+        self.assertEqual((cache.hits, cache.misses, cache.evictions), (3, 3, 0))
+
+    def test_entry_bound(self):
+        cache = SA.TransferCache(2, 0)
+        self.fill(cache, self.heaps[:2])
+        # Use the first entry, so the second one is the least recently used
+        self.fill(cache, self.heaps[:1])
+        self.fill(cache, self.heaps[2:])
+        self.assertEqual((len(cache.entries), cache.evictions), (2, 1))
+        self.assertIsNotNone(cache.lookup(self.heaps[0], self.transformer))
+        self.assertIsNone(cache.lookup(self.heaps[1], self.transformer))
+        self.assertIsNotNone(cache.lookup(self.heaps[2], self.transformer))
+
+    def test_byte_bound(self):
+        sizes = [heap.nbytes() + sum(h.nbytes() for h in SA.transfer(heap, self.transformer)) for heap in self.heaps]
+        cache = SA.TransferCache(0, sizes[1] + sizes[2])
+        self.fill(cache, self.heaps)
+        self.assertLessEqual(cache.nbytes, cache.max_bytes)
+        self.assertEqual(cache.nbytes, sum(size for bucket in cache.entries.values() for _, _, size in bucket))
+        self.assertIsNone(cache.lookup(self.heaps[0], self.transformer))
+        self.assertIsNotNone(cache.lookup(self.heaps[2], self.transformer))
+
+    def test_entry_over_byte_bound(self):
+        cache = SA.TransferCache(0, 1)
+        self.fill(cache, self.heaps)
+        self.assertEqual((len(cache.entries), cache.nbytes, cache.evictions), (0, 0, 0))
+
+    def test_small_cache_same_fixed_point(self):
+        for name, code in programs():
+            with self.subTest(program = name):
+                graph = analyze(code, cache_entries = 4)
+                self.assertLessEqual(graph.stats["cache_entries"], 4)
+                self.assertEqual(outcome(graph), outcome(analyze(code, cache_entries = None)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+Checks that checkpoints which cannot be resumed raise ErrorCheckpoint: one of another program, a damaged one,
+one of another version, not a checkpoint at all or missing. And that a checkpoint is replaced whole or not at all.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import io
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import contextlib
+import subprocess
+
+from support import SA, SA_DIR, sample_programs, analyze, outcome
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.samples = dict(sample_programs())
+        self.code = self.samples["ShapeAnalysisBasicLoop.txt"]
+        # A checkpoint of the fixed point of self.code
+        self.filename = self.path("loop.checkpoint")
+        analyze(self.code, checkpoint = SA.Checkpointer(self.filename))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def write(self, name, contents):
+        with open(self.path(name), "wb") as out:
+            out.write(contents)
+        return self.path(name)
+
+    def contents(self):
+        with open(self.filename, "rb") as checkpoint_file:
+            return checkpoint_file.read()
+
+    def assertCannotResume(self, filename, message):
+        graph = SA.Cfg(self.code)
+        with self.assertRaises(SA.ErrorCheckpoint) as raised:
+            with contextlib.redirect_stdout(io.StringIO()):
+                graph.analyze(resume = filename)
+        self.assertIn(message, raised.exception.args[0])
+        # Nothing was analyzed
+        self.assertIsNone(graph.verdict)
+        self.assertEqual(graph.stats["iterations"], 0)
+        with self.assertRaises(SA.ErrorCheckpoint):
+            SA.Cfg.from_checkpoint(filename)
+
+    def test_resume(self):
+        self.assertEqual(outcome(analyze(self.code, resume = self.filename)), outcome(analyze(self.code)))
+        self.assertEqual(outcome(SA.Cfg.from_checkpoint(self.filename)), outcome(analyze(self.code)))
+
+    def test_other_program(self):
+        other = self.samples["ShapeAnalysisCycle.txt"]
+        with self.assertRaises(SA.ErrorCheckpoint) as raised:
+            analyze(other, resume = self.filename)
+        self.assertIn("another program", raised.exception.args[0])
+        # The same program with an edge changed
+        changed = self.code.replace("L9 x:=x.n L10", "L9 x:=w L10")
+        self.assertNotEqual(changed, self.code)
+        self.assertRaises(SA.ErrorCheckpoint, analyze, changed, resume = self.filename)
+
+    def test_truncated(self):
+        contents = self.contents()
+        for size in (len(SA.CHECKPOINT_MAGIC), len(contents) // 2, len(contents) - 1):
+            with self.subTest(size = size):
+                self.assertCannotResume(self.write("truncated", contents[:size]), "damaged")
+
+    def test_corrupted(self):
+        contents = bytearray(self.contents())
+        contents[len(contents) // 2] ^= 0xFF
+        self.assertCannotResume(self.write("corrupted", bytes(contents)), "damaged")
+
+    def test_not_a_checkpoint(self):
+        self.assertCannotResume(self.write("program.txt", self.code.encode()), "not a checkpoint")
+        self.assertCannotResume(self.write("empty", b""), "not a checkpoint")
+
+    def test_other_version(self):
+        data = SA.read_checkpoint(self.filename)
+        data["version"] = SA.CHECKPOINT_VERSION - 1
+        SA.write_checkpoint(self.filename, data)
+        self.assertCannotResume(self.filename, "version")
+
+    def test_missing(self):
+        with self.assertRaises(SA.ErrorCheckpoint):
+            analyze(self.code, resume = self.path("missing"))
+
+    def test_failed_write_keeps_checkpoint(self):
+        contents = self.contents()
+        data = SA.read_checkpoint(self.filename)
+        # Cannot be pickled
+        data["stats"]["unpicklable"] = lambda: None
+        self.assertRaises(Exception, SA.write_checkpoint, self.filename, data)
+        self.assertEqual(self.contents(), contents)
+        self.assertEqual(os.listdir(self.directory), ["loop.checkpoint"])
+
+    def test_command_line(self):
+        program = self.path("cycle.txt")
+        with open(program, "w") as codefile:
+            codefile.write(self.samples["ShapeAnalysisCycle.txt"])
+        result = subprocess.run([sys.executable, os.path.join(SA_DIR, "SA.py"), program, "--resume", self.filename],
+                                stdout = subprocess.PIPE, stderr = subprocess.PIPE, universal_newlines = True)
+        self.assertIn("Error: Cannot read checkpoint " + self.filename + ": it was saved from another program",
+                      result.stdout)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+"""
+Checks Heap.coerce, which only evaluates the constraints reading a predicate table written to since they last held:
+on heaps of the analysis with a few predicates changed at random, it gives the same heap as a full pass over
+all constraints, and the constraint left out of _constraints never applies.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import random
+import unittest
+
+from support import SA, numpy, programs, analyze
+
+LOGIC3 = (SA.LOGIC3_0, SA.LOGIC3_HALF, SA.LOGIC3_1)
+# Heaps of the analysis changed at random
+SAMPLE = 400
+# Heap._tables name -> how to write an entry of it, through the views every backend has
+WRITES = {"var_pts_to": lambda heap, rng: heap.var_pts_to[rng.choice(list(heap.var_pts_to))],
+          "reachable": lambda heap, rng: heap.reachable[rng.choice(list(heap.reachable))],
+          "next": lambda heap, rng: heap.next[rng.choice(heap.heap_items)],
+          "is_summary": lambda heap, rng: heap.is_summary,
+          "in_cycle": lambda heap, rng: heap.in_cycle,
+          "is_shared": lambda heap, rng: heap.is_shared}
+
+
+def analysis_heaps():
+    """
+    Returns SAMPLE heaps of the states after analyzing the programs, coerced by a full pass.
+    canonical_abstraction may leave a heap that coerce would still refine
+    """
+    heaps = []
+    for name, code in programs():
+        graph = analyze(code)
+        for heap in (heap for state in graph.states.values() for heap in state.heaps):
+            heap = heap.copy()
+            heap._dirty = set(heap._tables)
+            if heap.coerce():
+                heaps.append(heap)
+    return random.Random(20).sample(heaps, min(SAMPLE, len(heaps)))
+
+def backends(heap):
+    """
+    Returns 'heap' and, if numpy is installed, the same heap as an ArrayHeap
+    """
+    if numpy is None:
+        return [heap]
+    return [heap, SA.ArrayHeap.from_heap(heap)]
+
+def changed(heap, rng):
+    """
+    Returns a copy of 'heap' with 1 to 3 predicates set to a random value, written after _own like transformers do
+    """
+    heap = heap.copy()
+    heap._dirty = set()
+    for _ in range(rng.randint(1, 3)):
+        name = rng.choice(SA.Heap._tables)
+        heap._own(type(heap)._tables[SA.Heap._tables.index(name)])
+        WRITES[name](heap, rng)[rng.choice(heap.heap_items)] = rng.choice(LOGIC3)
+    return heap
+
+def dropped_rule_applies(heap):
+    """
+    Returns whether 'exists v: not is_shared(v) and n(v1,v) and n(v2,v) |> v1 = v2' would discard 'heap',
+    as the constraint evaluated it before it was left out
+    """
+    for v in heap.heap_items:
+        if v == SA.NULL:
+            continue
+        for v1 in heap.heap_items:
+            for v2 in heap.heap_items:
+                if v1 != v2 and SA.and3(SA.not3(heap.check_shared(v)),
+                                        SA.and3(heap.next[v1][v], heap.next[v2][v])) == SA.LOGIC3_1:
+                    return True
+    return False
+
+
+class TestCoerce(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.heaps = analysis_heaps()
+
+    def test_dirty_tables_as_full_pass(self):
+        rng = random.Random(20)
+        compared = 0
+        for heap in self.heaps:
+            for h in backends(heap):
+                for _ in range(3):
+                    tracked = changed(h, rng)
+                    full = tracked.copy()
+                    full._dirty = set(type(full)._tables)
+                    with self.subTest(backend = type(h).__name__, dirty = sorted(tracked._dirty)):
+                        holds = full.coerce()
+                        self.assertEqual(tracked.coerce(), holds)
+                        if holds:
+                            compared += 1
+                            self.assertEqual(tracked.codes(), full.codes())
+        # Not every change is discarded
+        self.assertGreater(compared, len(self.heaps))
+
+    def test_dropped_rule_never_applies(self):
+        rng = random.Random(20)
+        for heap in self.heaps:
+            for h in [heap] + [changed(heap, rng) for _ in range(3)]:
+                self.assertFalse(dropped_rule_applies(h))
+
+    def test_two_definite_predecessors(self):
+        # a and b both definitely point to c: c must be shared
+        heap = SA.Heap(["x"])
+        a, b, c = [heap.new_node() for _ in range(3)]
+        heap._own(*SA.Heap._tables)
+        for v in (a, b):
+            heap.next[v][SA.NULL] = SA.LOGIC3_0
+            heap.next[v][c] = SA.LOGIC3_1
+        self.assertEqual(heap.check_shared(c), SA.LOGIC3_1)
+        self.assertFalse(dropped_rule_applies(heap))
+        for h in backends(heap):
+            with self.subTest(backend = type(h).__name__):
+                unshared = h.copy()
+                unshared._own(type(h)._tables[SA.Heap._tables.index("is_shared")])
+                unshared.is_shared[c] = SA.LOGIC3_0
+                # Discarded by 'exists v1,v2 : v1 != v2 and n(v1,v) and n(v2,v) |> is_shared(v)' instead
+                self.assertFalse(unshared.coerce())
+                maybe = h.copy()
+                maybe._own(type(h)._tables[SA.Heap._tables.index("is_shared")])
+                maybe.is_shared[c] = SA.LOGIC3_HALF
+                self.assertTrue(maybe.coerce())
+                self.assertEqual(maybe.is_shared[c], SA.LOGIC3_1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+"""
+Checks Cfg.analyze with component_workers: when several strongly connected components fail,
+the error reported is the one of the earliest failed component in topological order, on every run.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import unittest
+
+from support import SA, analyze
+
+# Two branches that both dereference NULL: after a loop building a list (A), and right away (B)
+BRANCH_A = ["L0 x:=NULL A0", "A0 t:=new A1", "A1 t.n:=x A2", "A2 x:=t A0", "A0 u:=NULL A4", "A4 u:=u.n A5"]
+BRANCH_B = ["L0 x:=NULL B0", "B0 u:=NULL B1", "B1 u:=u.n B2"]
+
+
+class TestComponents(unittest.TestCase):
+
+    def check_earliest_error(self, code):
+        graph = SA.Cfg(code)
+        component_of = dict((state.name, i) for i, component in enumerate(graph.components()) for state in component)
+        expected = min(("A4", "B1"), key = component_of.get)
+        for _ in range(3):
+            graph = analyze(code, component_workers = 2)
+            self.assertEqual(graph.verdict, SA.VERDICT_NULL_DEREFERENCE)
+            self.assertEqual(graph.failed_state, expected)
+            self.assertEqual(graph.failed_command, "u:=u.n")
+
+    def test_earliest_error_a_first(self):
+        self.check_earliest_error("\n".join(["x t u"] + BRANCH_A + BRANCH_B))
+
+    def test_earliest_error_b_first(self):
+        self.check_earliest_error("\n".join(["x t u"] + BRANCH_B + BRANCH_A))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,117 @@
+"""
+Checks that the ways of running the analysis agree: the sample programs and the generated programs of
+benchmarks/programs.py get the same verdict and the same heaps in every state with either heap backend,
+worklist strategy, worker processes, after resuming from a checkpoint and when reusing a previous analysis.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import contextlib
+
+from support import SA, numpy, programs, analyze, outcome
+
+
+class StopAfterCheckpoint(Exception):
+    pass
+
+
+class StoppingCheckpointer(SA.Checkpointer):
+    """
+    Checkpointer that stops the analysis right after its first checkpoint, as if the process was killed
+    """
+    def save(self, graph, worklist):
+        SA.Checkpointer.save(self, graph, worklist)
+        raise StopAfterCheckpoint()
+
+
+def edits(code):
+    """
+    Returns versions of 'code' with an edge removed, an edge's command changed and an edge added
+    @input: string code
+    @output: list of 2-tuples (string - the edit, string - the code after it)
+    """
+    lines = code.strip().split("\n")
+    variables, edges = lines[0], lines[1:]
+    first = variables.split()[0]
+    # A new command on the edge before the last
+    words = edges[-2].split()
+    command = "assume(TRUE)" if " ".join(words[1:-1]) != "assume(TRUE)" else first + ":=NULL"
+    changed = edges[:-2] + [" ".join([words[0], command, words[-1]]), edges[-1]]
+    appended = edges + [edges[-1].split()[-1] + " " + first + ":=new LAPPENDED"]
+    return [("remove", "\n".join([variables] + edges[:-1])),
+            ("change", "\n".join([variables] + changed)),
+            ("append", "\n".join([variables] + appended))]
+
+
+class TestEquivalence(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.programs = programs()
+        cls.expected = dict((name, outcome(analyze(code))) for name, code in cls.programs)
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def assertSameOutcome(self, **kwargs):
+        for name, code in self.programs:
+            with self.subTest(program = name):
+                self.assertEqual(outcome(analyze(code, **kwargs)), self.expected[name])
+
+    @unittest.skipIf(numpy is None, "numpy is not installed")
+    def test_numpy_backend(self):
+        self.assertSameOutcome(backend = SA.HEAP_BACKEND_NUMPY)
+
+    def test_set_worklist(self):
+        self.assertSameOutcome(strategy = SA.WORKLIST_SET)
+
+    def test_workers(self):
+        self.assertSameOutcome(workers = 2)
+
+    def test_component_workers(self):
+        self.assertSameOutcome(component_workers = 2)
+
+    def test_resume(self):
+        for name, code in self.programs:
+            with self.subTest(program = name):
+                filename = os.path.join(self.directory, name + ".checkpoint")
+                graph = SA.Cfg(code)
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        graph.analyze(checkpoint = StoppingCheckpointer(filename, iterations = 2, seconds = 0))
+                except StopAfterCheckpoint:
+                    pass
+                if not os.path.exists(filename):
+                    # Found an error before the first checkpoint
+                    self.assertEqual(outcome(graph), self.expected[name])
+                    continue
+                self.assertEqual(outcome(analyze(code, resume = filename)), self.expected[name])
+
+    def test_previous(self):
+        for name, code in self.programs:
+            with self.subTest(program = name):
+                graph = analyze(code, previous = analyze(code))
+                self.assertEqual(outcome(graph), self.expected[name])
+                if graph.verdict == SA.VERDICT_OK:
+                    self.assertGreater(graph.stats["reused_states"], 0)
+
+    def test_previous_edited(self):
+        for name, code in self.programs:
+            previous = analyze(code)
+            for edit, edited in edits(code):
+                with self.subTest(program = name, edit = edit):
+                    graph = analyze(edited, previous = previous)
+                    self.assertEqual(outcome(graph), outcome(analyze(edited)))
+                    if previous.verdict == SA.VERDICT_OK:
+                        # The edits are at the end of the program: the states before them keep their heaps
+                        self.assertGreater(graph.stats["reused_states"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+"""
+Checks Profiler: a profiled analysis reaches the same fixed point in the same iterations as one without,
+and what it records adds up.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import os
+import json
+import shutil
+import tempfile
+import unittest
+
+from support import SA, programs, analyze, outcome
+
+
+class TestProfiler(unittest.TestCase):
+
+    def test_same_analysis(self):
+        for name, code in programs():
+            with self.subTest(program = name):
+                plain = analyze(code, cache_entries = None)
+                profiler = SA.Profiler()
+                profiled = analyze(code, cache_entries = None, profiler = profiler)
+                self.assertEqual(outcome(profiled), outcome(plain))
+                self.assertEqual(profiled.stats["iterations"], plain.stats["iterations"])
+                if profiled.verdict != SA.VERDICT_OK:
+                    # An error ends the analysis in the middle of a visit and an edge, which are then not recorded
+                    continue
+                self.assertEqual(sum(profiler.states.values()), profiled.stats["iterations"])
+                # Without a cache, every heap along every edge but the assertion checks is transferred
+                transferred = sum(visits[1] for edge, visits in profiler.edges.items() if not edge.checks_assertion)
+                self.assertGreater(transferred, 0)
+                self.assertEqual(profiler.phases["focus"][0], transferred)
+                self.assertEqual(profiler.phases["coerce_red"][0], transferred)
+                self.assertEqual(profiler.phases["canonical_abstraction"][0], transferred)
+                self.assertLessEqual(profiler.counters["infeasible"], profiler.phases["apply_transformer"][0])
+
+    def test_export(self):
+        directory = tempfile.mkdtemp()
+        try:
+            profiler = SA.Profiler(trace = True)
+            analyze(programs()[0][1], profiler = profiler)
+            profile = os.path.join(directory, "profile.json")
+            trace = os.path.join(directory, "trace.json")
+            profiler.write_json(profile)
+            profiler.write_chrome_trace(trace)
+            with open(profile) as profile_file:
+                summary = json.load(profile_file)
+            self.assertEqual(set(summary["phases"]), set(SA.PROFILER_PHASES))
+            self.assertGreater(summary["counters"]["largest_heap"], 1)
+            with open(trace) as trace_file:
+                events = json.load(trace_file)
+            events = events["traceEvents"] if isinstance(events, dict) else events
+            self.assertEqual(set(event["cat"] for event in events), set(["phase", "edge", "state"]))
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,75 @@
+"""
+Checks check_reachable and check_cycle, which read the transitive closure of 'next' (see Heap.closure),
+on heaps where the first shortest path a BFS finds is not the one that decides the answer.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import os
+import sys
+import unittest
+
+SA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SA_DIR)
+import SA
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def heap_with_edges(edges):
+    """
+    Returns a heap of 4 items, none pointed by a variable, with 'next' as given
+    @input: list of 3-tuples (int src, int dst, 3-val bool) - 'next' between the items, by their order of creation.
+            Items without an edge have no 'next'
+    @output: 2-tuple (Heap, list of the 4 items)
+    """
+    heap = SA.Heap(["x"])
+    items = [heap.new_node() for _ in range(4)]
+    heap._own("next")
+    for v in items:
+        heap.next[v][SA.NULL] = SA.LOGIC3_0
+    for src, dst, val in edges:
+        heap.next[items[src]][items[dst]] = val
+    return heap, items
+
+def backends(heap):
+    """
+    Returns 'heap' and, if numpy is installed, the same heap as an ArrayHeap
+    """
+    if numpy is None:
+        return [heap]
+    return [heap, SA.ArrayHeap.from_heap(heap)]
+
+
+class TestReachability(unittest.TestCase):
+
+    def test_definite_path_beside_a_maybe_path(self):
+        # 0 -> 1 -> 3 is found first, but its first edge is 1/2. 0 -> 2 -> 3 is definite
+        heap, items = heap_with_edges([(0, 1, SA.LOGIC3_HALF), (0, 2, SA.LOGIC3_1),
+                                       (1, 3, SA.LOGIC3_1), (2, 3, SA.LOGIC3_1)])
+        for h in backends(heap):
+            with self.subTest(backend = type(h).__name__):
+                self.assertEqual(h.check_reachable(items[0], items[3]), SA.LOGIC3_1)
+                self.assertEqual(h.check_reachable(items[0], items[1]), SA.LOGIC3_HALF)
+                self.assertEqual(h.check_reachable(items[3], items[0]), SA.LOGIC3_0)
+
+    def test_cycle_through_a_maybe_edge(self):
+        # 1 definitely leads back to 0, but 0 only maybe leads to 1
+        heap, items = heap_with_edges([(0, 1, SA.LOGIC3_HALF), (1, 0, SA.LOGIC3_1)])
+        for h in backends(heap):
+            with self.subTest(backend = type(h).__name__):
+                self.assertEqual(h.check_cycle(items[0]), SA.LOGIC3_HALF)
+                self.assertEqual(h.check_cycle(items[1]), SA.LOGIC3_HALF)
+                self.assertEqual(h.check_cycle(items[2]), SA.LOGIC3_0)
+
+    def test_definite_cycle(self):
+        heap, items = heap_with_edges([(0, 1, SA.LOGIC3_1), (1, 2, SA.LOGIC3_1), (2, 0, SA.LOGIC3_1)])
+        for h in backends(heap):
+            with self.subTest(backend = type(h).__name__):
+                self.assertEqual(h.check_cycle(items[0]), SA.LOGIC3_1)
+                self.assertEqual(h.check_cycle(items[3]), SA.LOGIC3_0)
+
+
+if __name__ == "__main__":
+    unittest.main()
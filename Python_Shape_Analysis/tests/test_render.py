@@ -0,0 +1,64 @@
+"""
+Checks HeapRenderer: the names of the pictures (png_names), the heaps it is given by an analysis,
+and, when networkx and matplotlib are installed, the pictures saved by its worker.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+import importlib.util
+
+from support import SA, analyze, sample_programs
+
+DRAWING = all(importlib.util.find_spec(name) is not None for name in ("networkx", "matplotlib"))
+
+
+class TestRenderer(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_png_names(self):
+        first = SA.png_names("L3", 2, self.directory)
+        second = SA.png_names("L3", 2, self.directory)
+        self.assertEqual(len(first), 2)
+        for filename in first:
+            self.assertEqual(os.path.dirname(filename), self.directory)
+            self.assertTrue(os.path.basename(filename).startswith("ShapeAnalysisOf" + SA.PNG_RUN + "-" + str(os.getpid())))
+        self.assertTrue(first[0].endswith("-L3-heap=1.png"))
+        self.assertTrue(first[1].endswith("-L3-heap=2.png"))
+        # Drawing the same state again does not overwrite its pictures
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(SA.png_names("L3", 0, self.directory), [])
+
+    def test_queued_heaps(self):
+        code = dict(sample_programs())["ShapeAnalysisBasicLoop.txt"]
+        renderer = SA.HeapRenderer(self.directory, workers = 0)
+        graph = analyze(code, renderer = renderer)
+        self.assertEqual(renderer.close(), [])
+        names = [name for name, _ in renderer.queued]
+        # The state after the assertion, then the last state analyzed
+        self.assertIn("L20", names)
+        self.assertEqual(names[-1], graph._current_state.name)
+        # Drawn as they were then: the state may have got more heaps since
+        for name, compact_heaps in renderer.queued:
+            self.assertTrue(compact_heaps)
+            self.assertLessEqual(set(compact_heaps), set(heap.compact() for heap in graph.states[name].heaps))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    @unittest.skipUnless(DRAWING, "networkx and matplotlib are not installed")
+    def test_pictures(self):
+        graph = analyze(dict(sample_programs())["ShapeAnalysisBasicLoop.txt"])
+        with SA.HeapRenderer(self.directory) as renderer:
+            renderer.draw_state(graph.states["L20"])
+            renderer.draw_state(graph.states["L20"])
+        self.assertEqual(len(renderer.files), 2 * len(graph.states["L20"].heaps))
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted(os.path.basename(f) for f in renderer.files))
+
+
+if __name__ == "__main__":
+    unittest.main()
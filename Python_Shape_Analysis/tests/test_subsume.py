@@ -0,0 +1,82 @@
+"""
+Checks the analysis with subsumption (Cfg.analyze(subsume = True)): State.join_heaps keeps only the most general
+heaps of a state, and the analysis gets the same verdicts as without it, with no more heaps.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import unittest
+
+from support import SA, programs, analyze
+
+
+def run(heap, *commands):
+    """
+    Returns 'heap' after the commands, which must not need focus
+    """
+    for command in commands:
+        heap = SA.Transformer(command).apply(heap.copy())
+    return heap
+
+def general(heap):
+    """
+    Returns a copy of 'heap' where the item 'x' points to is maybe shared: it subsumes 'heap'
+    """
+    heap = heap.copy()
+    heap._own("is_shared")
+    heap.is_shared[heap.get("x")] = SA.LOGIC3_HALF
+    return heap
+
+def key(heap):
+    return SA.subsumption_key(heap.codes())
+
+
+class TestSubsume(unittest.TestCase):
+
+    def test_subsumes(self):
+        specific = run(SA.Heap(["x", "y"]), "x:=new")
+        self.assertTrue(SA.subsumes(key(general(specific)), key(specific)))
+        self.assertFalse(SA.subsumes(key(specific), key(general(specific))))
+        self.assertTrue(SA.subsumes(key(specific), key(specific)))
+        self.assertFalse(SA.subsumes(key(specific), key(run(specific, "y:=x"))))
+
+    def test_join_heaps(self):
+        state = SA.State("S", None)
+        specific = run(SA.Heap(["x", "y"]), "x:=new")
+        self.assertEqual(state.join_heaps([specific], True), [specific])
+        self.assertEqual(state.new_heaps("edge"), [specific])
+        # A more general heap replaces it, and is transformed along the edge again
+        more_general = general(specific)
+        self.assertEqual(state.join_heaps([more_general], True), [more_general])
+        self.assertEqual(state.heaps, [more_general])
+        self.assertEqual(state.subsumed, 1)
+        self.assertEqual(state.new_heaps("edge"), [more_general])
+        # A heap it subsumes adds nothing, a heap with other heap items is not compared
+        self.assertEqual(state.join_heaps([specific.copy()], True), [])
+        self.assertEqual(state.subsumed, 0)
+        other = run(specific, "y:=new")
+        self.assertEqual(state.join_heaps([other], True), [other])
+        self.assertEqual(state.heaps, [more_general, other])
+
+    def test_analysis(self):
+        subsumed = 0
+        for name, code in programs():
+            with self.subTest(program = name):
+                exact = analyze(code)
+                graph = analyze(code, subsume = True)
+                self.assertEqual(graph.verdict, exact.verdict)
+                self.assertEqual(exact.stats["subsumed_heaps"], 0)
+                subsumed += graph.stats["subsumed_heaps"]
+                if graph.verdict != SA.VERDICT_OK:
+                    continue
+                self.assertLessEqual(sum(len(state.heaps) for state in graph.states.values()),
+                                     sum(len(state.heaps) for state in exact.states.values()))
+                # No heap of a state subsumes another
+                for state in graph.states.values():
+                    for heap in state.heaps:
+                        for other in state.heaps:
+                            if other is not heap and other.heap_items == heap.heap_items:
+                                self.assertFalse(SA.subsumes(key(other), key(heap)))
+        self.assertGreater(subsumed, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
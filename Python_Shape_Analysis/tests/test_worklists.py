@@ -0,0 +1,55 @@
+"""
+Checks the worklist strategies of Cfg.analyze: every strategy reaches the same fixed point,
+and the weak topological order of WtoWorklist is built without recursion on deep CFGs.
+Usage: python -m pytest tests (or python -m unittest discover tests), from the directory of SA.py
+"""
+import sys
+import unittest
+
+from support import SA, programs, analyze, outcome
+
+
+def chain(length):
+    """
+    Returns a program of 'length' commands in sequence, in a loop back to the first one
+    @input: int length
+    @output: string code
+    """
+    lines = ["x"]
+    lines += ["L%d x:=NULL L%d" % (i, i + 1) for i in range(length - 1)]
+    lines.append("L%d x:=NULL L0" % (length - 1))
+    return "\n".join(lines)
+
+
+class TestWorklists(unittest.TestCase):
+
+    def test_same_fixed_point(self):
+        for name, code in programs():
+            expected = outcome(analyze(code))
+            for strategy in sorted(SA.WORKLISTS):
+                with self.subTest(program = name, strategy = strategy):
+                    self.assertEqual(outcome(analyze(code, strategy = strategy)), expected)
+
+    def test_deep_weak_topological_order(self):
+        length = 4 * sys.getrecursionlimit()
+        graph = SA.Cfg(chain(length))
+        limit = sys.getrecursionlimit()
+        order = graph.weak_topological_order()
+        self.assertEqual(sys.getrecursionlimit(), limit)
+        # A single loop, headed by the first state, holding all the others in sequence
+        self.assertEqual(len(order), 1)
+        head, component = order[0]
+        self.assertEqual(head.name, "L0")
+        self.assertEqual([state.name for state in component], ["L%d" % i for i in range(1, length)])
+
+    def test_weak_topological_order_of_nested_loops(self):
+        code = "\n".join(["x", "L0 x:=NULL L1", "L1 x:=NULL L2", "L2 x:=NULL L1", "L2 x:=NULL L3",
+                          "L3 x:=NULL L0", "L3 x:=NULL L4"])
+        order = SA.Cfg(code).weak_topological_order()
+        names = lambda partition: [(element[0].name, names(element[1])) if isinstance(element, tuple)
+                                   else element.name for element in partition]
+        self.assertEqual(names(order), [("L0", [("L1", ["L2"]), "L3"]), "L4"])
+
+
+if __name__ == "__main__":
+    unittest.main()